@@ -11,79 +11,70 @@ import sys
 import os
 import numpy as np
 import math as m
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import scipy.constants as const
 import scipy.interpolate as interpolate
 import pandas as pd
 from scipy import stats as st
 from scipy import signal
-from scipy.signal import butter, lfilter, find_peaks
+from scipy.signal import butter, lfilter
 from scipy.stats import maxwell
 from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
 from decimal import Decimal
 
-from PyQt5.QtWidgets import QCheckBox
-
 from ErrorClasses import FileError
+import precision
+import sharedstack
+import accel
+import outofcore
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 # System correction factor to convert voltages to currents
 CORRECTION_FACTOR = 0.004 # A/V
 
 def get_data(name):
-    data = {}
-    os.chdir(name)
-    dir = os.listdir()
-    for folder in dir:
-        folder_name_length = len(folder)
-        if folder != '.gitignore':
-            if folder[-4:folder_name_length] != '.txt':
-                try:
-                    for file in os.listdir(folder):
-                        filename_length = len(file)
-                        if (file[-4:filename_length] == '.csv'
-                                or  file[-4:filename_length] == '.CSV'):
-
-                            all_data = pd.read_csv(
-                                    folder + '/' + file, header=None)
-
-                            # Why are we starting at index 290 and not index 0?
-                            df = all_data.iloc[290:,4]
-                            # Shouldn't the data in range(1, 291) be averaged
-                            # and subtracted out, since the high voltage was off
-                            # and the remaining signal is just system-level
-                            # noise?
-
-                            # convert to numpy array
-                            current_data = df.values
-
-                            try:
-                                data[file] = current_data
-                            except:
-                                pass
-                except:
-                    pass
-            elif folder[-4:folder_name_length] == '.txt':
+
+    # Read by path so the caller's working directory never changes
+    return [read_files(list_files(name)), get_bias(name)]
+
+
+def read_current(path):
+
+    all_data = pd.read_csv(path, header=None)
+
+    # Why are we starting at index 290 and not index 0?
+    df = all_data.iloc[290:,4]
+    # Shouldn't the data in range(1, 291) be averaged
+    # and subtracted out, since the high voltage was off
+    # and the remaining signal is just system-level
+    # noise?
+
+    # convert to numpy array
+    return precision.asarray(df.values)
+
+
+def get_bias(name):
+    for folder in os.listdir(name):
+        if folder != '.gitignore' and folder[-4:] == '.txt':
+            path = os.path.join(name, folder)
+            try:
+                df = pd.read_csv(path, header=None)
+                bias_data = df.values
+            except:
                 try:
-                    df = pd.read_csv(folder, header=None)
-                    bias_data = df.values
+                    bias_data = np.genfromtxt(
+                            path,
+                            delimiter=None,
+                            encoding="utf8")
                 except:
                     try:
-                        bias_data = np.ndfromtxt(
-                                folder,
-                                delimiter=None,
+                        bias_data = np.genfromtxt(
+                                path,
+                                delimiter=',',
                                 encoding="utf8")
                     except:
-                        try:
-                            bias_data = np.ndfromtxt(
-                                    folder,
-                                    delimiter=',',
-                                    encoding="utf8")
-                        except:
-                            pass
+                        pass
     try:
         # Remove all NaN values.
         bias_data_no_NaN = bias_data[~np.isnan(bias_data)]
@@ -98,11 +89,73 @@ def get_data(name):
                 + "CHECK DIRECTORY")
         raise FileError(message)
 
-    return [data, bias_data_out]
+    return bias_data_out
+
+
+def list_files(name):
+
+    # Current files of every shot folder, in the order get_data reads them
+    files = []
+    for folder in os.listdir(name):
+        path = os.path.join(name, folder)
+        if (folder != '.gitignore' and folder[-4:] != '.txt'
+                and os.path.isdir(path)):
+            for file in os.listdir(path):
+                if file[-4:] == '.csv' or file[-4:] == '.CSV':
+                    files.append(os.path.join(path, file))
+    return files
+
+
+def read_files(files):
+
+    # Currents of the given files by file name, as in get_data
+    data = {}
+    for path in files:
+        data[os.path.basename(path)] = read_current(path)
+    return data
+
+
+def get_shot_files(name, budget):
+
+    # The currents as files read in blocks within budget bytes, with the
+    # bias potentials; get_peak_vals accepts it in place of get_data's
+    return [outofcore.ShotFiles(list_files(name), read_files, shot_rows,
+            budget), get_bias(name)]
+
+
+def shot_rows(data):
+    for key in data:
+        yield key, [data[key]]
+
+
+def _segment_peaks(abs_val_raw_current_data, num_biases):
+
+    # Peak of each bias category of the trace, in volts; the scan itself
+    # runs in the accel kernels
+    peaks = accel.segment_peaks(abs_val_raw_current_data, num_biases)
+    peak_current_data = np.zeros((num_biases,1))
+    for j in range(0,num_biases):
+        if np.isnan(peaks[j]):
+            peak_current_data[j] = 0
+            message = ("Current peak value set to 0 uA because " +
+                    "current peak could not be found.")
+            warnings.warn(message, RuntimeWarning)
+        else:
+            peak_current_data[j] = peaks[j]
+
+    return peak_current_data
 
 
 def get_peak_vals(raw_current_data, bias_data):
 
+    # Currents larger than memory are scanned block by block; only the
+    # peaks of each file are kept
+    if isinstance(raw_current_data, outofcore.ShotFiles):
+        peak_current_data_dic = {}
+        for block in raw_current_data.blocks():
+            peak_current_data_dic.update(get_peak_vals(block, bias_data))
+        return peak_current_data_dic
+
     peak_current_data_dic = {}
     if (bias_data[:,0] == 0).any() == True:
         num_biases = len(bias_data) - 1
@@ -113,41 +166,43 @@ def get_peak_vals(raw_current_data, bias_data):
         # Make all values positive -- why are we doing this?
         abs_val_raw_current_data = np.absolute(raw_current_data[key])
 
-        length_current_data = len(abs_val_raw_current_data)
-
-        cutoff_index = (length_current_data-1)/num_biases
-        peak_current_data = np.zeros((num_biases,1))
-        for j in range(0,num_biases):
-            temp = []
-            starting_index = int(np.floor(j*cutoff_index))
-            for i in range(starting_index, length_current_data):
-                # For each bias category, collect current values in a temp list
-                if (i >= j*cutoff_index) and (i < (j+1)*cutoff_index):
-                    temp.append(abs_val_raw_current_data[i])
-                if (i == length_current_data-1) and ((j+1) == num_biases):
-                    # Categorize the very last data point in
-                    # abs_val_raw_current_data
-                    temp.append(abs_val_raw_current_data[-1])
-                if i > (j+1)*cutoff_index:
-                    break
-            # Finds the peak current values in the temp list and
-            # stores in the avg_peak_current_data list, in volts
-            _, temp_peak_dic = find_peaks(temp,
-                    height=np.mean(temp)*2)
-            peaks = temp_peak_dic['peak_heights']
-            try:
-                peak_current_data[j] = np.max(peaks)
-            except ValueError:
-                peak_current_data[j] = 0
-                message = ("Current peak value set to 0 uA because " +
-                        "current peak could not be found.")
-                warnings.warn(message, RuntimeWarning)
+        peak_current_data = _segment_peaks(abs_val_raw_current_data,
+                num_biases)
 
         peak_current_data_dic[key] = np.array(peak_current_data)
 
     return peak_current_data_dic
 
 
+def _peak_block(rows, num_biases):
+    return np.hstack([_segment_peaks(row, num_biases) for row in rows]).T
+
+
+def get_peak_vals_parallel(raw_current_data, bias_data, workers=None):
+
+    # get_peak_vals on a process pool, see sharedstack.map_stack; files of
+    # unequal length cannot be stacked and go through get_peak_vals
+    lengths = set(len(raw_current_data[key]) for key in raw_current_data)
+    if len(lengths) != 1:
+        return get_peak_vals(raw_current_data, bias_data)
+
+    if (bias_data[:,0] == 0).any() == True:
+        num_biases = len(bias_data) - 1
+    else:
+        num_biases = len(bias_data)
+
+    keys = list(raw_current_data)
+    rows = [np.absolute(raw_current_data[key]) for key in keys]
+    peak_table = sharedstack.map_stack(_peak_block, rows, num_biases,
+            (num_biases,), workers, np.float64)
+
+    peak_current_data_dic = {}
+    for key, peak_current_data in zip(keys, peak_table):
+        peak_current_data_dic[key] = peak_current_data[:, None]
+
+    return peak_current_data_dic
+
+
 def peak_avg(peak_current_data_dic, bias_data):
 
     avg_peak_vals =  np.zeros_like(bias_data)
@@ -174,6 +229,15 @@ def peak_avg(peak_current_data_dic, bias_data):
     return avg_peak_vals
 
 
+def get_peak_table(peak_current_data_dic):
+    # Stack the per-file peak values into one (files, biases) array,
+    # in volts, so shots can be resampled without walking the dictionary
+    keys = sorted(peak_current_data_dic)
+    peak_table = np.hstack([peak_current_data_dic[key] for key in keys]).T
+
+    return peak_table
+
+
 def aggregate_data(bias_data, avg_peak_current_data):
     # combine the data in bias_data and avg_peak_current_data
     # into one numpy array
@@ -430,12 +494,142 @@ def density(v_sat, i_sat):
     electron_temp_K = (q_e*v_sat) / (2*k_B) # K
 
     electron_number_density = (i_sat_Amps
-            / (q_e*probe_cs_area*m.exp(-0.5))
-            * m.sqrt(ion_mass / (k_B*electron_temp_K))
+            / (q_e*probe_cs_area*np.exp(-0.5))
+            * np.sqrt(ion_mass / (k_B*electron_temp_K))
             )
 
     return electron_number_density
 
 
+def _bootstrap_design(bias_data):
+    # The bias grid alone fixes how averaged peaks map onto the full IV
+    # dataset and which points fall in each regression region, so both
+    # are built once here and shared by every resample.
+    if (bias_data[:,0] == 0).any() == True:
+        num_biases = len(bias_data) - 1
+    else:
+        num_biases = len(bias_data)
+
+    template = format_data(bias_data, np.zeros_like(bias_data))
+    current_map = np.zeros((len(template), num_biases))
+    for index in range(0, num_biases):
+        unit_peaks = np.zeros((num_biases, 1))
+        unit_peaks[index] = 1
+        avg_peak_vals = peak_avg({'unit': unit_peaks}, bias_data)
+        current_map[:, index] = format_data(bias_data, avg_peak_vals)[:,1]
+
+    # Label each point of the full dataset with its row so split_data
+    # reports the row indices belonging to each region
+    template[:,1] = np.arange(len(template))
+    data_post_split = split_data(template)
+
+    regions = {}
+    for region in data_post_split:
+        regions[region] = (np.array(data_post_split[region]['V']),
+                np.array(data_post_split[region]['I'], dtype=int))
+
+    return current_map, regions
+
+
+def _linregress_rows(x, y):
+    # Least squares line through each row of y against the shared x values
+    x_mean = np.mean(x)
+    dx = x - x_mean
+    y_mean = np.mean(y, axis=1)
+    slope = (y - y_mean[:, None]) @ dx / (dx @ dx)
+
+    regression = {}
+    regression['slope'] = slope
+    regression['intercept'] = y_mean - slope * x_mean
+
+    return regression
+
+
+def _bootstrap_resamples(peak_table, current_map, regions, num_resamples,
+        seed):
+    rng = np.random.default_rng(seed)
+    num_files = len(peak_table)
+
+    # Each resample draws files with replacement; the draw counts weight
+    # the peak table so all resampled means come out of one product
+    counts = rng.multinomial(num_files, np.full(num_files, 1 / num_files),
+            size=num_resamples)
+    mean_peaks = counts @ peak_table / num_files
+    currents = mean_peaks @ current_map.T
+
+    linear_regression_data = {}
+    for region in regions:
+        v, index = regions[region]
+        linear_regression_data[region] = _linregress_rows(
+                v, currents[:, index])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        saturation_values = calculate_saturation_values(
+                linear_regression_data)
+        v_sat = saturation_values['V sat']
+        i_sat = saturation_values['I sat']
+
+        samples = {}
+        samples['Te'] = temperature(v_sat)
+        samples['ne'] = density(v_sat, i_sat)
+        samples['V sat'] = v_sat
+        samples['I sat'] = i_sat
+
+    return samples
+
+
+# Resamples handed to a worker at a time; fixed so results for a given
+# seed do not depend on the number of workers
+RESAMPLE_CHUNK = 500
+
+def bootstrap(peak_current_data_dic, bias_data, num_resamples=2000,
+        confidence=0.95, workers=None, seed=None, nargout=1):
+
+    # in case nargout is not equal to 1 (intervals)
+    # or 2 (intervals, samples)
+    if (nargout != 1) and (nargout != 2):
+        nargout = 1
+
+    peak_table = get_peak_table(peak_current_data_dic)
+    current_map, regions = _bootstrap_design(bias_data)
+
+    num_chunks = int(np.ceil(num_resamples / RESAMPLE_CHUNK))
+    chunk_sizes = np.full(num_chunks, RESAMPLE_CHUNK)
+    chunk_sizes[-1] = num_resamples - RESAMPLE_CHUNK * (num_chunks - 1)
+    seeds = np.random.SeedSequence(seed).spawn(num_chunks)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, num_chunks)
+
+    if workers <= 1:
+        results = [_bootstrap_resamples(peak_table, current_map, regions,
+                int(size), chunk_seed)
+                for size, chunk_seed in zip(chunk_sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_bootstrap_resamples, peak_table,
+                    current_map, regions, int(size), chunk_seed)
+                    for size, chunk_seed in zip(chunk_sizes, seeds)]
+            results = [future.result() for future in futures]
+
+    samples = {}
+    for key in results[0]:
+        samples[key] = np.concatenate([result[key] for result in results])
+
+    # Percentile intervals; resamples with a degenerate fit (NaN) are
+    # left out rather than poisoning the bounds
+    tail = (1 - confidence) / 2 * 100
+    intervals = {}
+    for key in samples:
+        lower, upper = np.nanpercentile(samples[key], [tail, 100 - tail])
+        intervals[key] = (lower, upper)
+
+    if nargout == 1:
+        return intervals
+    else:
+        return intervals, samples
+
+
 if __name__ == 'main':
     print('Running DBDlplt')
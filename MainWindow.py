@@ -28,6 +28,9 @@ import lplt     # Import dependent libs for plotting
 import pplt
 import splt
 import PlotWindow
+import precision
+import prefetch
+import store
 
 class MainWindow(QDialog):
 
@@ -39,6 +42,12 @@ class MainWindow(QDialog):
         self.setWindowIcon(QIcon('assets/ic_aplotter.png'))
         self.setMinimumSize(QSize(400, 420))    # Set main window dimensions
 
+        # Loads likely next datasets in the background, see prefetch, and
+        # reuses stage outputs stored by earlier runs, see store; the
+        # store is pruned to its budget as it fills
+        self.prefetcher = prefetch.Prefetcher(
+                result_store=store.ResultStore(max_bytes=store.STORE_BUDGET))
+
         # Calls to create options grid below statusbar
         self.createGrid()
 
@@ -48,7 +57,8 @@ class MainWindow(QDialog):
                  'REFA',
                  'Nude Faraday',
                  'Input Power',
-                 'Single Dataset']
+                 'Single Dataset',
+                 'Result Trends']
 
         self.choose = QComboBox(self)
         self.choose.addItems(list1)
@@ -58,6 +68,8 @@ class MainWindow(QDialog):
             self.chooseLayout, self.choose.currentIndex())
 
         self.plot = QPushButton('Plot', self)
+        self.single_precision = QCheckBox('Float32', self)
+        self.single_precision.stateChanged.connect(self.setPrecision)
         self.browseButton = QPushButton('Browse', self)
         self.default_directory = 'C:\\'
         self.dirLoc = QLineEdit(self.default_directory)
@@ -69,6 +81,7 @@ class MainWindow(QDialog):
         windowLayout.addLayout(statusLayout)
 
         statusLayout.addWidget(self.choose)
+        statusLayout.addWidget(self.single_precision)
         statusLayout.addWidget(self.plot)
         windowLayout.addWidget(self.optionsBox)
         browseLayout.addWidget(QLabel('Location:'))
@@ -89,20 +102,31 @@ class MainWindow(QDialog):
         self.subplt = QCheckBox('Show Subplot')
         self.bplt = QCheckBox('Verify Bias')
         self.DBDlplt = QCheckBox('DBD Plot')
+        self.bootstrap = QCheckBox('Bootstrap CI')
         self.energy = QCheckBox('Plot Energy Curve')
+        self.stream = QCheckBox('Stream From Disk')
+        self.batch = QCheckBox('Batch Trials')
+        self.pulses = QCheckBox('Pulse Statistics')
+        self.align = QCheckBox('Align Shots')
         self.orderflt = QLineEdit('2')
         self.cutflt = QLineEdit('0.005')
         self.window = QLineEdit('9')
         self.smooth_spline = QLineEdit('4')
         self.spline_pts = QLineEdit('100')
         self.volt_stp = QLineEdit('2')
+        self.budget = QLineEdit('')     # MB, empty to load every shot
         self.single_shot = QCheckBox('Show Single Shot')
+        self.live = QCheckBox('Live Stream')
         self.export = QCheckBox('Export Data')
         self.ds_rpa = QRadioButton('REFA')
         self.ds_dlp = QRadioButton('Langmuir')
         self.verticalSpacer = QSpacerItem(40, 40, QSizePolicy.Minimum,
                                             QSizePolicy.Expanding)
 
+        self.trend_diagnostic = QComboBox(self)
+        self.trend_diagnostic.addItems(['DBD', 'RPA', 'NFP', 'Power'])
+        self.trend_name = QLineEdit('Te')
+
         self.ptype = QComboBox(self)
         self.ptypeList = ['Choose Plot Type...',
                           'Raw',
@@ -143,6 +167,9 @@ class MainWindow(QDialog):
 
             self.layoutSingle()
 
+        elif ind == 6:
+            self.layoutTrend()
+
     def createGrid(self):
 
         self.optionsBox = QGroupBox('Options')
@@ -170,6 +197,7 @@ class MainWindow(QDialog):
         default_dir = os.getcwd()+'/RPA'
 
         self.layout.addWidget(self.subplt, 0, 0)
+        self.layout.addWidget(self.align, 1, 0)
         self.layout.addWidget(self.export, 2, 0)
         self.layout.addWidget(QLabel('Filter Order:'), 0, 1)
         self.layout.addWidget(self.orderflt, 0, 2)
@@ -197,10 +225,14 @@ class MainWindow(QDialog):
         self.layout.addWidget(self.tof, 0, 0)
         self.layout.addWidget(self.DBDlplt, 1, 0)
         self.layout.addWidget(self.export, 2, 0)
+        self.layout.addWidget(self.bootstrap, 3, 0)
+        self.layout.addWidget(self.align, 4, 0)
         self.layout.addWidget(QLabel('Filter Order:'), 0, 1)
         self.layout.addWidget(self.orderflt, 0, 2)
         self.layout.addWidget(QLabel('Cutoff Freq.:'), 1, 1)
         self.layout.addWidget(self.cutflt, 1, 2)
+        self.layout.addWidget(QLabel('Memory Budget (MB):'), 2, 1)
+        self.layout.addWidget(self.budget, 2, 2)
         self.dirLoc.setText(default_dir)
         self.layout.addItem(self.verticalSpacer)
 
@@ -217,6 +249,8 @@ class MainWindow(QDialog):
         self.layout.addWidget(self.orderflt, 0, 2)
         self.layout.addWidget(QLabel('Cutoff Freq.:'), 1, 1)
         self.layout.addWidget(self.cutflt, 1, 2)
+        self.layout.addWidget(QLabel('Memory Budget (MB):'), 2, 1)
+        self.layout.addWidget(self.budget, 2, 2)
         self.dirLoc.setText(default_dir)
         self.layout.addItem(self.verticalSpacer)
 
@@ -228,6 +262,10 @@ class MainWindow(QDialog):
         default_dir = os.getcwd()+'/DLP'
 
         self.layout.addWidget(self.energy, 0, 0)
+        self.layout.addWidget(self.stream, 1, 0)
+        self.layout.addWidget(self.batch, 2, 0)
+        self.layout.addWidget(self.export, 3, 0)
+        self.layout.addWidget(self.pulses, 4, 0)
         self.dirLoc.setText(default_dir)
         self.layout.addItem(self.verticalSpacer)
 
@@ -239,6 +277,7 @@ class MainWindow(QDialog):
 
         self.layout.addWidget(self.ptype, 1, 0)
         self.layout.addWidget(self.export, 2, 0)
+        self.layout.addWidget(self.live, 3, 0)
         self.layout.addWidget(QLabel('Filter Order:'), 0, 1)
         self.layout.addWidget(self.orderflt, 0, 2)
         self.layout.addWidget(QLabel('Cutoff Freq.:'), 1, 1)
@@ -255,6 +294,17 @@ class MainWindow(QDialog):
         self.browseButton.clicked.connect(lambda: self.getFiles('file'))
 
 
+    def layoutTrend(self):
+
+        self.layout.addWidget(QLabel('Diagnostic:'), 0, 1)
+        self.layout.addWidget(self.trend_diagnostic, 0, 2)
+        self.layout.addWidget(QLabel('Result:'), 1, 1)
+        self.layout.addWidget(self.trend_name, 1, 2)
+        self.layout.addItem(self.verticalSpacer)
+
+        self.plot.clicked.connect(self.pushTrend)
+
+
     # Each push function is called via respective plotbutton layout
     # on push call -> read state of each gui object ->
     # create new plot window object filled with plotted data
@@ -270,11 +320,12 @@ class MainWindow(QDialog):
         splinePts = int(self.spline_pts.text())
         stepV = int(self.volt_stp.text())
         subplt = int(self.subplt.isChecked())
+        align = self.align.isChecked()
         try:
             PlotWindow.plotRPA(self, order,
                             cutoff, tts,
                             medWin, smooth,
-                            splinePts, stepV, subplt)
+                            splinePts, stepV, subplt, align)
         except (AttributeError, NotADirectoryError):
             print(self.errortxt)
 
@@ -284,9 +335,13 @@ class MainWindow(QDialog):
         cutoff = float(self.cutflt.text())
         tof = self.tof.isChecked()
         DBDlplt = self.DBDlplt.isChecked()
+        bootstrap = self.bootstrap.isChecked()
+        budget = self.getBudget()
+        align = self.align.isChecked()
 
         try:
-            PlotWindow.plotDLP(self, order, cutoff, tof, DBDlplt)
+            PlotWindow.plotDLP(self, order, cutoff, tof, DBDlplt, bootstrap,
+                    budget, align)
         except(AttributeError, NotADirectoryError):
             print(self.errortxt)
 
@@ -295,18 +350,26 @@ class MainWindow(QDialog):
         order = int(self.orderflt.text())
         cutoff = float(self.cutflt.text())
         biasplt = int(self.bplt.isChecked())
+        budget = self.getBudget()
 
         try:
-            PlotWindow.plotNFP(self, order, cutoff, biasplt)
+            PlotWindow.plotNFP(self, order, cutoff, biasplt, budget)
         except(AttributeError, NotADirectoryError):
             print(self.errortxt)
 
     def pushPower(self):
 
         energy = bool(self.energy.isChecked())
+        stream = bool(self.stream.isChecked())
+        batch = bool(self.batch.isChecked())
+        export = bool(self.export.isChecked())
+        pulses = bool(self.pulses.isChecked())
 
         try:
-            PlotWindow.plotPower(self, energy)
+            if batch:
+                PlotWindow.plotPowerSummary(self, export=export)
+            else:
+                PlotWindow.plotPower(self, energy, stream, pulses)
         except(AttributeError, NotADirectoryError):
             print(self.errortxt)
 
@@ -319,6 +382,10 @@ class MainWindow(QDialog):
         splinePts = int(self.spline_pts.text())
         index = int(self.ptype.currentIndex())
 
+        if self.live.isChecked():   # 'host:port' or a growing file
+            PlotWindow.plotLive(self, order, cutoff, self.dirLoc.text())
+            return
+
         try:
             PlotWindow.plotSingle(
             self,
@@ -331,6 +398,31 @@ class MainWindow(QDialog):
         except(AttributeError, NotADirectoryError):
             print(self.errortxt)
 
+    def pushTrend(self):
+
+        diagnostic = self.trend_diagnostic.currentText()
+        name = self.trend_name.text()
+
+        PlotWindow.plotTrend(self, diagnostic, name)
+
+    # Load, filter and reduce in float32 when checked
+    def setPrecision(self):
+        if self.single_precision.isChecked():
+            precision.set_dtype(np.float32)
+        else:
+            precision.set_dtype(np.float64)
+
+    # Memory budget in bytes, or None to load every shot at once
+    def getBudget(self):
+        if self.budget.text().strip() == '':
+            return None
+        return int(float(self.budget.text()) * 2**20)
+
+    # Stop the prefetch worker with the window
+    def closeEvent(self, event):
+        self.prefetcher.shutdown()
+        super(MainWindow, self).closeEvent(event)
+
     # Used to determine file explorer file type expectation
     def getFiles(self, dirType='folder'):
         if dirType is 'folder':
@@ -13,7 +13,6 @@ import os
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.interpolate import splrep, BSpline
 
 from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtGui import QIcon
@@ -22,21 +21,21 @@ QHBoxLayout, QPushButton, QRadioButton, QVBoxLayout, QCheckBox, QLineEdit,
 QComboBox, QGridLayout, QApplication, QSpacerItem, QSizePolicy)
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as Navbar
-from cycler import cycler
-from decimal import Decimal
-import matplotlib.patches as mpatches
 from matplotlib.offsetbox import TextArea, VPacker, AnnotationBbox
 from pylab import *
 
-import rplt
-import lplt     # Import dependent libs for plotting
-import bplt
+import rplt     # Import dependent libs for plotting
+import api
+import render
+import results
 import pplt
 import splt
-import DBDlplt as dlplt
+import stream
 
 from ErrorClasses import NotImplementedError
 import warnings
+import sqlite3
+import datetime
 
 
 class PlotWindow(QDialog):
@@ -56,391 +55,160 @@ class PlotWindow(QDialog):
         self.setLayout(layout)
         self.show()
 
+# Keep a run's results for trend queries; a failure to store them is
+# reported but never stops the plot
+def record_results(self, diagnostic, params, values):
+    try:
+        results.record(diagnostic, self.fname, params, values)
+    except (sqlite3.Error, OSError) as error:
+        warnings.warn('Results were not stored: %s' % error, RuntimeWarning)
+
+# api result of the current dataset. Stages already cached, by the
+# background worker or an earlier plot, are reused and only the stages
+# downstream of a changed parameter run again; the likely next datasets are
+# queued right after, so they load while this plot is on screen
+def analyze(self, diagnostic, params):
+    prefetcher = getattr(self, 'prefetcher', None)
+    if prefetcher is None:
+        return api.analyze(diagnostic, self.fname, params)
+    prefetcher.wait(diagnostic, self.fname, params)
+    result = api.analyze(diagnostic, self.fname, params, prefetcher.cache,
+            prefetcher.store)
+    prefetcher.schedule(diagnostic, self.fname, params)
+    return result
+
 # Each plot function will call for respective
 # transformation and plot appearance.
 # The plot data is parsed explicitly to avoid error.
 
 def plotRPA(self, order=2, cutoff=0.04, tts=400, medWin=9,
-            smooth=4, splinePts=100, stepV=2, subplt=False):
+            smooth=4, splinePts=100, stepV=2, subplt=False, align=False):
+
+    params = {'order': order, 'cutoff': cutoff, 'align': align, 'tts': tts,
+            'medWin': medWin, 'smooth': smooth, 'splinePts': splinePts,
+            'stepV': stepV}
+    result = analyze(self, 'RPA', params)
 
-    raw_rpa = rplt.get_data(self.fname)
-    lowpass_rpa = rplt.butter_filter(raw_rpa, order, cutoff)
-    slice_rpa = rplt.time_slice(lowpass_rpa, tts)
-    median_rpa = rplt.median_filter(slice_rpa, medWin)
-    x, spl = rplt.spline_fit(median_rpa, smooth, splinePts, 'spline')
-    x, y = rplt.ivdf(x, spl)
+    record_results(self, 'RPA', params, result.values)
 
     if subplt:
-        rplt.plot_dict(lowpass_rpa)
+        plt.figure()
+        for shot in result.shots:
+            plt.plot(result.shots[shot])
+        plt.show()
 
-    plt.figure(figsize=(9, 5))
-    plt.plot(x * stepV, y, '+-')
-    plt.title('Ion Velocity Distribution')
-    plt.xlabel('Energy (eV)')
-    plt.ylabel('I.V.D.F (Arb. units)')
-    plt.minorticks_on()
-    plt.grid(which='major', alpha=0.5)
-    plt.grid(which='minor', alpha=0.2)
+    render.draw_rpa(plt.figure(figsize=render.FIGURE_SIZE['RPA']), result)
     plt.show()
 
 
 
-def plotDLP(self, order=2, cutoff=0.05, tof=False, DBDplot=False):
+def plotDLP(self, order=2, cutoff=0.05, tof=False, DBDplot=False,
+            bootstrap=False, budget=None, align=False):
     if DBDplot == False:
-        raw_dlp = lplt.get_data(self.fname)
-        lowpass_dlp = lplt.butter_filter(raw_dlp, order, cutoff)
-        average_dlp = lplt.butter_avg(lowpass_dlp)
-        time, density = lplt.density(average_dlp)
-
-        ax, fig = plt.subplots()
-
-
-        for key in density.keys():
-            fig.plot(time, density[key], label=key)
-            fig.legend(prop={'size': 7})
-
-            if tof:     # if time of flight is checked
-                xmaxPos = np.argmax(density[key], axis=0) / 10
-                yminPos = np.min(density[key])
-                fig.axvline(x=xmaxPos, color='r', linestyle='--')
-                textstr = (xmaxPos)
-                props = dict(boxstyle='square', facecolor='white', alpha=0.0)
-                fig.text(
-                    xmaxPos,
-                    yminPos,
-                    textstr,
-                    fontsize=9,
-                    verticalalignment='center',
-                    bbox=props)
-
-        plt.xlabel(r'Time ($\mu$s)')
-        plt.ylabel('$n_{e}$ ($m^{-3}$)')
-        plt.title('Plasma Density')
-        plt.minorticks_on()
-        plt.grid(which='major', alpha=0.5)
-        plt.grid(which='minor', alpha=0.2)
+        result = analyze(self, 'DLP', {'order': order, 'cutoff': cutoff,
+                'align': align, 'tof': tof, 'budget': budget})
+
+        render.draw_dlp(plt.figure(figsize=render.FIGURE_SIZE['DLP']),
+                result)
         plt.show()
     else:
 
-        [raw_I_vals, raw_bias_vals] = dlplt.get_data(self.fname)
-        peak_I_vals_dic = dlplt.get_peak_vals(raw_I_vals, raw_bias_vals)
-        avg_peak_I_vals = dlplt.peak_avg(peak_I_vals_dic, raw_bias_vals)
-        data = dlplt.format_data(raw_bias_vals, avg_peak_I_vals)
-        sectioned_data = dlplt.split_data(data)
-        regression_data = dlplt.calculate_linear_regressions(sectioned_data)
-
-        tol = 1E-8
-
-        sat_vals, outside_tols =  dlplt.calculate_saturation_values(
-                regression_data, tol, 2)
-
-        V_sat = sat_vals['V sat']
-        I_sat = sat_vals['I sat']
-
-        electron_temp = dlplt.temperature(V_sat)
-        electron_number_density = dlplt.density(V_sat, I_sat)
-
-        # Warning handling
-        if outside_tols['sat_V_diff'] == True:
-            message = ('Average saturated voltage value '
-                    + 'was used because the difference between left '
-                    + 'and right saturated voltage values was outside the '
-                    + 'tolerance of %.2E V.' % tol)
-            warnings.warn(message, RuntimeWarning)
-        if outside_tols['sat_I_diff'] == True:
-            message = ('Average saturated current value '
-                    + 'was used because the difference between left '
-                    + 'and right saturated voltage values was outside the '
-                    + 'tolerance of %.2E uA.' % tol)
-            warnings.warn(message, RuntimeWarning)
-
-        ax, fig = plt.subplots()
-        # The section below still needs to be cleaned, but it will work for now
-###############################################################################
-        x_ion = np.linspace(data[0,0], data[-1,0], num=50)
-        x_e_ret = np.linspace(data[0,0], data[-1,0], num=50)
-        x_e_sat = np.linspace(data[0,0], data[-1,0], num=50)
-        y_ion = np.zeros_like(x_ion)
-        y_e_ret = np.zeros_like(x_e_ret)
-        y_e_sat = np.zeros_like(x_e_sat)
-
-        i_sat = regression_data['i_sat']
-        e_ret = regression_data['e_ret']
-        e_sat = regression_data['e_sat']
-
-        index = 0
-        for val in x_ion:
-            y_ion[index] = i_sat['slope']*val + i_sat['intercept']
-            index += 1
-        index = 0
-        for val in x_e_ret:
-            y_e_ret[index] = e_ret['slope']*val + e_ret['intercept']
-            index += 1
-        index = 0
-        for val in x_e_sat:
-            y_e_sat[index] = e_sat['slope']*val + e_sat['intercept']
-            index += 1
-
-        y_ion = np.array(y_ion)
-        y_e_ret = np.array(y_e_ret)
-        y_e_sat = np.array(y_e_sat)
-
-        v_fine = np.linspace(data[0,0], data[-1,0], 300)
-        t, c, k = splrep(
-                data[:,0], data[:,1], s=0, k=3)
-        I_func = BSpline(t, c, k, extrapolate=False)
-        fig.plot(v_fine, I_func(v_fine), color='black',
-                linestyle='dashed', linewidth=2)
-        fig.scatter(
-                data[:,0], data[:,1], color='black', s=10*(2**2))
-        fig.plot(x_ion, y_ion, color='red', linewidth=2.0)
-        fig.plot(x_e_ret, y_e_ret, color='magenta', linewidth=2.0)
-        fig.plot(x_e_sat, y_e_sat, color='green', linewidth=2.0)
-
-        # Construct linear regression equations
-
-        if i_sat['intercept'] < 0:
-            i_sat_intercept_negative = True
-            i_sat_intercept_zero = False
-            i_sat['intercept'] = np.absolute(i_sat['intercept'])
-        else:
-            i_sat_intercept_negative = False
-            if round(i_sat['intercept'], 4) == 0.0000:
-                i_sat_intercept_zero = True
-            else:
-                i_sat_intercept_zero = False
-
-
-        if e_ret['intercept'] < 0:
-            e_ret_intercept_negative = True
-            e_ret['intercept'] = np.absolute(e_ret['intercept'])
-        else:
-             e_ret_intercept_negative = False
-             if round(e_ret['intercept'], 4) == 0.0000:
-                 e_ret_intercept_zero = True
-             else:
-                 e_ret_intercept_zero = False
-
-        if e_sat['intercept'] < 0:
-            e_sat_intercept_negative = True
-            e_sat['intercept'] = np.absolute(e_sat['intercept'])
-        else:
-             e_sat_intercept_negative = False
-             if round(e_sat['intercept'], 4) == 0.0000:
-                 e_sat_intercept_zero = True
-             else:
-                 e_sat_intercept_zero = False
-
-
-        s_ion_str = str("%.4f" % round(i_sat['slope'], 4))
-        inter_ion_str = str("%.4f" % round(i_sat['intercept'], 4))
-
-        s_e_ret_str = str("%.4f" % round(e_ret['slope'], 4))
-        inter_e_ret_str = str("%.4f" % round(e_ret['intercept'], 4))
-
-        s_e_sat_str = str("%.4f" % round(e_sat['slope'], 4))
-        inter_e_sat_str = str("%.4f" % round(e_sat['intercept'], 4))
-
-
-        str_ion = r'$I_{ion \,\,\, sat} = $' + s_ion_str
-        if i_sat_intercept_negative == False:
-            if i_sat_intercept_zero == False:
-                str_ion += r'$\cdot V +$' + inter_ion_str
-            else:
-                str_ion += r'$\cdot V$'
-        else:
-            str_ion += r'$\cdot V -$' + inter_ion_str
-
-        str_e_ret = r'$I_{e \,\,\, ret} = $' + s_e_ret_str
-        if e_ret_intercept_negative == False:
-            if e_ret_intercept_zero == False:
-                str_e_ret += r'$\cdot V +$' + inter_e_ret_str
-            else:
-                str_e_ret += r'$\cdot V$'
-        else:
-            str_e_ret += r'$\cdot V -$' + inter_e_ret_str
-
-        str_e_sat = r'$I_{e \,\,\, sat} = $' + s_e_sat_str
-        if e_sat_intercept_negative == False:
-            if e_sat_intercept_zero == False:
-                str_e_sat += r'$\cdot V +$' + inter_e_sat_str
-            else:
-                str_e_sat += r'$\cdot V$'
-        else:
-            str_e_sat += r'$\cdot V -$' + inter_e_sat_str
-
-        # Construct electron temp and number density output
+        result = analyze(self, 'DBD',
+                {'bootstrap': bootstrap, 'budget': budget})
 
-        T_str = (r'$T_e$ $\approx$ '
-                + str('%.2f' % round(electron_temp, 2)) + ' eV')
-        n_e_str =  (r'$n_e$ $\approx$ '
-                + '%.2E' % Decimal(str(electron_number_density))
-                + r' $\mathrm{m}^{-3}$')
+        record_results(self, 'DBD', {'bootstrap': int(bootstrap)},
+                result.values)
 
-        # Construct legend
-        h = []
+        render.draw_dbd(plt.figure(figsize=render.FIGURE_SIZE['DBD']),
+                result)
+        plt.show()
 
-        plot_labels = ['Measured Data',
-                'Ion Saturation Regression',
-                'Electron Retarding Regression',
-                'Electron Saturation Regression']
 
-        h.append(mpatches.Patch(color='black', label=plot_labels[0]))
-        h.append(mpatches.Patch(color='red', label=plot_labels[1]))
-        h.append(mpatches.Patch(color='magenta', label=plot_labels[2]))
-        h.append(mpatches.Patch(color='green', label=plot_labels[3]))
 
-        fig.legend(loc=2, borderaxespad=0, handles=h, prop={'size': 18})
+def plotNFP(self, order=2, cutoff=0.05, biasplt=False, budget=None):
 
-  #############################################################################
-        ax = plt.gca()
+    if biasplt == False:
+        result = analyze(self, 'NFP', {'order': order, 'cutoff': cutoff,
+                'budget': budget})
 
-        # fig.text(0.55, 0.30, str_ion, transform=ax.transAxes)
-        # fig.text(0.55, 0.25, str_e_ret, transform=ax.transAxes)
-        # fig.text(0.55, 0.20, str_e_sat, transform=ax.transAxes)
-        # fig.text(0.55, 0.10, T_str, transform=ax.transAxes)
-        # fig.text(0.55, 0.5, n_e_str, transform=ax.transAxes)
+        record_results(self, 'NFP', {'order': order, 'cutoff': cutoff},
+                result.values)
 
-        txt = (str_ion + "\n" + str_e_ret + "\n" + str_e_sat
-            + "\n" + T_str + "\n" + n_e_str)
+        render.draw_nfp(plt.figure(figsize=render.FIGURE_SIZE['NFP']),
+                result)
+        plt.show()
 
-        props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+    else:
+        result = analyze(self, 'Bias', {'order': order, 'cutoff': cutoff})
 
-        fig.text(0.55, 0.25, txt, size=18,
-            verticalalignment="top", horizontalalignment="left",
-            multialignment="left", bbox=props,  transform=ax.transAxes)
+        render.draw_bias(plt.figure(figsize=render.FIGURE_SIZE['Bias']),
+                result)
+        plt.show()
 
-        plt.rcParams.update({'font.size': 22})
 
-        for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] +
-                ax.get_xticklabels() + ax.get_yticklabels()):
-             item.set_fontsize(20)
 
-        plt.xlabel('Voltage (V)')
-        plt.ylabel(r'Peak Current ($\mu$A)')
-        plt.title('Bias Voltage vs Peak Current')
-        plt.minorticks_on()
-        plt.grid(which='major', alpha=0.5)
-        plt.grid(which='minor', alpha=0.2)
-        plt.show()
+def plotPower(self, energy=False, stream=False, pulses=False):
+    result = analyze(self, 'Power', {'energy': energy, 'stream': stream,
+            'pulses': pulses, 'title': self.fname})
 
+    record_results(self, 'Power', {'pulses': int(pulses)}, result.values)
 
+    render.draw_power(plt.figure(figsize=render.FIGURE_SIZE['Power']),
+            result)
+    plt.show()
 
-def plotNFP(self, order=2, cutoff=0.05, biasplt=False):
 
-    # Until working, throw NotImplemented error if biasplt == False
-    if biasplt == False:
-        raise NotImplementedError("NFP plotting not yet implemented")
 
-    if biasplt == False:
-        raw_nfp = nplt.get_data(self.fname)
-        lowpass_nfp = nplt.butter_filter(raw_nfp, order, cutoff)
-        max_vals_nfp = biasplt.get_max_vals(lowpass_nfp)
-        Idensity = nplt.Idensity(max_vals_nfp)
-        #plt.figure(figsize=(9, 5))
-
-        # Setting prop cycle on default rc parameter
-        plt.rc('lines', linewidth=4)
-        plt.rc('axes', prop_cycle=(cycler('color', ['k', 'b', 'r', 'm'])))
-
-        ax, fig = plt.subplots()
-
-        for id in Idensity.keys():
-            if id == 'L':
-                id_label = 'Left'
-            elif id == 'R':
-                id_label = 'Right'
-            elif id == 'D':
-                id_label = 'Double'
-            elif id == 'T':
-                id_label = 'Triple'
-            else:
-                id_label = 'Other'
-            fig.plot(*zip(*sorted(Idensity[id].items())), 'o', label=id_label)
-            fig.legend(prop={'size': 7})
-
-        plt.xlabel(r'Radial Position (cm)')
-        plt.ylabel(r'$J$ $\left(\mathrm{A} \, \mathrm{m}^{-2}\right)$')
-        plt.title(r'Plasma Current Density at $V_{bias} = -30 \, V$')
-        plt.minorticks_on()
-        plt.grid(which='major', alpha=0.5)
-        plt.grid(which='minor', alpha=0.2)
-        plt.show()
+def plotPowerSummary(self, sort_by='total energy', export=False):
 
+    if export:
+        export_file = os.path.join(self.fname, 'power_summary.csv')
     else:
-        raw_nfp = bplt.get_data(self.fname)
-        lowpass_nfp = bplt.butter_filter(raw_nfp, order, cutoff)
-        max_vals_nfp = bplt.get_max_vals(lowpass_nfp)
-        Idensity = bplt.Idensity(max_vals_nfp)
-        #plt.figure(figsize=(9, 5))
-
-        ax, fig = plt.subplots()
-
-        for key in Idensity.keys():
-            fig.plot(*zip(*sorted(Idensity.items())), 'ko')
-
-        plt.xlabel(r'Bias Potential (V)')
-        plt.ylabel(r'$J$ $\left(\mathrm{A} \, \mathrm{m}^{-2} \right)$')
-        plt.title(r'Plasma Current Density at $r = 0$')
-        plt.minorticks_on()
-        plt.grid(which='major', alpha=0.5)
-        plt.grid(which='minor', alpha=0.2)
-        plt.show()
-
+        export_file = None
+    # Trials share the GUI's cache and store with single trial plots
+    prefetcher = getattr(self, 'prefetcher', None)
+    if prefetcher is None:
+        table = pplt.batch_summary(self.fname, sort_by=sort_by,
+                export=export_file)
+    else:
+        table = pplt.batch_summary(self.fname, sort_by=sort_by,
+                export=export_file, cache=prefetcher.cache,
+                store=prefetcher.store)
+
+    # Energy chart above the full summary table, one table row per trial
+    fig, (ax, table_ax) = plt.subplots(2, 1,
+            figsize=(9, 5 + 0.25 * len(table)),
+            gridspec_kw={'height_ratios': [5, 1 + 0.25 * len(table)]})
+    ax.bar(np.arange(len(table)), table['total energy'] * 1e3, color='m')
+    ax.set_xticks(np.arange(len(table)))
+    ax.set_xticklabels(table.index, rotation=90)
+    ax.set_title(r'Energy per Trial - ' + self.fname)
+    ax.set_ylabel(r'Total Energy (mJ)')
+    ax.minorticks_on()
+    ax.grid(which='major', alpha=0.5)
+    ax.grid(which='minor', alpha=0.2)
+
+    table_ax.axis('off')
+    if len(table):
+        table_ax.table(cellText=[['%.3E' % value for value in row]
+                for row in table.values], rowLabels=list(table.index),
+                colLabels=list(table.columns), loc='center')
+    fig.tight_layout()
+    plt.show()
 
 
-def plotPower(self, energy=False):
-    raw_data = pplt.get_data(self.fname, energy)
-    # lowpass_rpa = rplt.butter_filter(raw_rpa, order, cutoff)
-    # slice_rpa = rplt.time_slice(lowpass_rpa, tts)
-    # median_rpa = rplt.median_filter(slice_rpa, medWin)
-    # x, spl = rplt.spline_fit(median_rpa, smooth, splinePts, 'spline')
-    # x, y = rplt.ivdf(x, spl)
 
+def plotTrend(self, diagnostic='DBD', name='Te'):
 
-    time_ns = raw_data['time'] * 1e9
-    voltage_V = raw_data['voltage']
-    voltage_kV = raw_data['voltage'] * 1e-3
-    current_A = raw_data['current']
-    power_W = raw_data['power']
-    power_kW = raw_data['power'] * 1e-3
-        
+    timestamps, values, run_ids = results.trend(diagnostic, name)
+    dates = [datetime.datetime.fromtimestamp(t) for t in timestamps]
 
     plt.figure(figsize=(9, 5))
-    plt.plot(time_ns, voltage_kV*1e1, 'b-')
-    plt.plot(time_ns, current_A, 'g-')
-    plt.plot(time_ns, power_kW, 'k-')
-    
-    plt.title(r'Power Plot - ' + self.fname)
-    plt.xlabel(r'Time (ns)')
-
-    # Construct legend
-    h = []
-
-    plot_labels = ['Voltage',
-            'Current',
-            'Power',
-            'Energy']
-
-    h.append(mpatches.Patch(color='blue', label=plot_labels[0]))
-    h.append(mpatches.Patch(color='green', label=plot_labels[1]))
-    h.append(mpatches.Patch(color='black', label=plot_labels[2]))
-
-    if energy:
-        energy_J = raw_data['energy']
-        energy_mJ = energy_J * 1e3
-        plt.plot(time_ns, energy_mJ*1e1, 'm-')
-        h.append(mpatches.Patch(color='magenta', label=plot_labels[3]))
-        plt.ylabel(r'Voltage $\left(10^{-1} \, \mathrm{kV}\right)$'
-                + r' / Current (A) / Power (kW) / Energy $\left(10^{-1}'
-                + r' \, \mathrm{mJ}\right)$')
-    else:
-        plt.ylabel(r'Voltage ($10^{-1} \, \mathrm{kV}$) / Current (A) / Power (kW)')
-        # plt.ylabel(r'Voltage (V) / Current (A) / Power (W)'))
-
-
-    legend(loc='best', borderaxespad=0, handles=h)
-    # , prop={'size': 18}
+    plt.plot(dates, values, 'ko-')
+    plt.title(diagnostic + ' Trend - ' + name)
+    plt.xlabel('Run Date')
+    plt.ylabel(name)
+    plt.gcf().autofmt_xdate()
     plt.minorticks_on()
     plt.grid(which='major', alpha=0.5)
     plt.grid(which='minor', alpha=0.2)
@@ -448,15 +216,26 @@ def plotPower(self, energy=False):
 
 
 
+# Causally filtered scope data drawn as it arrives from a socket or a capture
+# file that is still being written
+def plotLive(self, order=2, cutoff=0.05, location=''):
+    self.live_plot = stream.LivePlot(location, order, cutoff)
+    plt.show()
+
+
 def plotSingle(self, order=2, cutoff=0.05, medWin=9,
                 smooth=4, splinePts=100, index=0):
 
 
     if index is 1:
 
-        raw = splt.get_data(self.fname)
+        # Very large captures are drawn from the level-of-detail pyramid
+        if os.path.getsize(self.fname) > splt.LOD_THRESHOLD:
+            self.lod_viewer = splt.plot_pyramid(self.fname)
+        else:
+            raw = splt.get_data(self.fname)
 
-        splt.plot_dict(raw)
+            splt.plot_dict(raw)
 
     elif index is 2:
         raw = splt.get_data(self.fname)
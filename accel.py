@@ -0,0 +1,253 @@
+"""Acceleration Module
+
+This module contains the kernels for the stages that stay sequential after
+vectorization: peak scanning over the bias segments of a DBD trace, pulse
+edge detection in power traces and running median updates. Each kernel is
+written twice, as a scalar loop compiled with Numba when it is installed and
+as a pure NumPy fallback, and both return identical results.
+
+The 'jit' backend is the default when Numba imports; without it the
+'numpy' fallback is used, and the scalar loops can still be selected and
+run as plain Python. tests/test_accel.py checks both backends against the
+SciPy routines the kernels replace, with or without Numba.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import math
+import numpy as np
+from scipy import ndimage
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+BACKENDS = ('jit', 'numpy')
+
+# ndimage boundary modes and their np.pad equivalents
+PAD_MODES = {'constant': 'constant', 'reflect': 'symmetric',
+             'mirror': 'reflect', 'nearest': 'edge', 'wrap': 'wrap'}
+
+
+def jit(func):
+    if HAVE_NUMBA:
+        return numba.njit(cache=True)(func)
+    return func
+
+
+if HAVE_NUMBA:
+    _backend = 'jit'
+else:
+    _backend = 'numpy'
+
+
+def set_backend(backend):
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError("Backend is not recognized: %r" % backend)
+    _backend = backend
+
+
+def get_backend():
+    return _backend
+
+
+# Segment peaks ---------------------------------------------------------------
+
+def segment_offsets(length, num_biases):
+
+    # Sample indices of each bias segment of a trace, concatenated, and the
+    # offsets of every segment in them. A segment holds the samples i with
+    # j*cutoff <= i < (j+1)*cutoff, and the last one also gets the final
+    # sample, exactly as DBDlplt has always split its traces.
+    cutoff_index = (length-1)/num_biases
+    index = []
+    offsets = [0]
+    for j in range(num_biases):
+        start = math.ceil(j*cutoff_index)
+        stop = min(math.ceil((j+1)*cutoff_index), length)
+        segment = np.arange(start, max(start, stop))
+        if j + 1 == num_biases:
+            segment = np.append(segment, length - 1)
+        index.append(segment)
+        offsets.append(offsets[-1] + len(segment))
+
+    return np.concatenate(index).astype(np.int64), np.array(offsets)
+
+
+@jit
+def _peak_heights_loop(values, offsets, thresholds):
+
+    # Local maxima as scipy.signal.find_peaks defines them (flat tops count
+    # once, edges never count), at or above each segment's threshold
+    heights = np.full(len(offsets) - 1, np.nan)
+    for j in range(len(offsets) - 1):
+        i = offsets[j] + 1
+        i_max = offsets[j+1] - 1
+        while i < i_max:
+            if values[i-1] < values[i]:
+                i_ahead = i + 1
+                while i_ahead < i_max and values[i_ahead] == values[i]:
+                    i_ahead += 1
+                if values[i_ahead] < values[i]:
+                    if values[i] >= thresholds[j] and (np.isnan(heights[j])
+                            or values[i] > heights[j]):
+                        heights[j] = values[i]
+                    i = i_ahead
+            i += 1
+
+    return heights
+
+
+def _peak_heights_numpy(values, offsets, thresholds):
+
+    # Collapse each segment into runs of equal values; a run is a peak when
+    # the runs on both sides of it, in the same segment, are lower
+    num_segments = len(offsets) - 1
+    segment = np.repeat(np.arange(num_segments), np.diff(offsets))
+
+    new_run = np.ones(len(values), dtype=bool)
+    new_run[1:] = ((values[1:] != values[:-1])
+            | (segment[1:] != segment[:-1]))
+    run_value = values[new_run]
+    run_segment = segment[new_run]
+
+    same_segment = run_segment[1:] == run_segment[:-1]
+    left_lower = np.zeros(len(run_value), dtype=bool)
+    left_lower[1:] = same_segment & (run_value[:-1] < run_value[1:])
+    right_lower = np.zeros(len(run_value), dtype=bool)
+    right_lower[:-1] = same_segment & (run_value[1:] < run_value[:-1])
+
+    peak = (left_lower & right_lower
+            & (run_value >= thresholds[run_segment]))
+    heights = np.full(num_segments, -np.inf)
+    np.maximum.at(heights, run_segment[peak], run_value[peak])
+    heights[heights == -np.inf] = np.nan
+
+    return heights
+
+
+def segment_peaks(values, num_biases):
+
+    # Highest find_peaks peak of every bias segment of values, counting
+    # only peaks at least twice the segment mean; NaN where there are none
+    values = np.asarray(values).ravel()
+    index, offsets = segment_offsets(len(values), num_biases)
+    values = values[index]
+
+    thresholds = np.full(num_biases, np.nan)
+    for j in range(num_biases):
+        if offsets[j+1] > offsets[j]:
+            thresholds[j] = np.mean(values[offsets[j]:offsets[j+1]])*2
+
+    if _backend == 'jit':
+        return _peak_heights_loop(values, offsets, thresholds)
+    return _peak_heights_numpy(values, offsets, thresholds)
+
+
+# Pulse edges -----------------------------------------------------------------
+
+@jit
+def _pulse_edges_loop(active, min_gap, min_width):
+
+    length = len(active)
+    starts = np.empty(length // 2 + 1, dtype=np.int64)
+    ends = np.empty(length // 2 + 1, dtype=np.int64)
+    count = 0
+    i = 0
+    while i < length:
+        if active[i]:
+            start = i
+            while i < length and active[i]:
+                i += 1
+            if count > 0 and start - ends[count-1] < min_gap:
+                ends[count-1] = i
+            else:
+                starts[count] = start
+                ends[count] = i
+                count += 1
+        else:
+            i += 1
+
+    keep = (ends[:count] - starts[:count]) >= min_width
+    return starts[:count][keep], ends[:count][keep]
+
+
+def _pulse_edges_numpy(active, min_gap, min_width):
+
+    length = len(active)
+    edges = np.diff(active.view(np.int8))
+    starts = np.flatnonzero(edges == 1) + 1
+    ends = np.flatnonzero(edges == -1) + 1     # exclusive
+    if length and active[0]:
+        starts = np.concatenate(([0], starts))
+    if length and active[-1]:
+        ends = np.concatenate((ends, [length]))
+
+    if len(starts) > 1:
+        keep = (starts[1:] - ends[:-1]) >= min_gap
+        starts = np.concatenate((starts[:1], starts[1:][keep]))
+        ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+
+    keep = (ends - starts) >= min_width
+    return starts[keep].astype(np.int64), ends[keep].astype(np.int64)
+
+
+def pulse_edges(active, min_gap=1, min_width=1):
+
+    # Start and exclusive end indices of the runs of True in active, runs
+    # closer than min_gap samples merged and runs shorter than min_width
+    # dropped
+    active = np.ascontiguousarray(active, dtype=bool)
+    if _backend == 'jit':
+        return _pulse_edges_loop(active, min_gap, min_width)
+    return _pulse_edges_numpy(active, min_gap, min_width)
+
+
+# Running median --------------------------------------------------------------
+
+@jit
+def _running_median_loop(padded, window, out):
+
+    # Keep the window sorted and update it by one removal and one insertion
+    # per step: a binary search, then swaps that shift up to w samples, so
+    # O(w) per step. ndimage takes the upper median for even windows.
+    rank = window // 2
+    for row in range(padded.shape[0]):
+        x = padded[row]
+        sorted_window = np.sort(x[:window])
+        out[row, 0] = sorted_window[rank]
+        for i in range(1, out.shape[1]):
+            k = np.searchsorted(sorted_window, x[i-1])
+            sorted_window[k] = x[i+window-1]
+            while k > 0 and sorted_window[k-1] > sorted_window[k]:
+                sorted_window[k-1], sorted_window[k] = \
+                    sorted_window[k], sorted_window[k-1]
+                k -= 1
+            while k < window - 1 and sorted_window[k+1] < sorted_window[k]:
+                sorted_window[k+1], sorted_window[k] = \
+                    sorted_window[k], sorted_window[k+1]
+                k += 1
+            out[row, i] = sorted_window[rank]
+
+
+def running_median(rows, window, mode='constant'):
+
+    # Centred median of every row of a 2-D array, matching
+    # ndimage.median_filter(row, size=window, mode=mode) for finite data
+    rows = np.asarray(rows)
+    if mode not in PAD_MODES:
+        raise ValueError("Boundary mode is not recognized: %r" % mode)
+    out = np.empty_like(rows)
+
+    if _backend == 'numpy' or rows.shape[-1] == 0:
+        for index, row in enumerate(rows):
+            out[index] = ndimage.median_filter(row, size=window, mode=mode)
+        return out
+
+    padding = ((0, 0), (window // 2, window - 1 - window // 2))
+    padded = np.ascontiguousarray(np.pad(rows, padding, PAD_MODES[mode]))
+    _running_median_loop(padded, window, out)
+    return out
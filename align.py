@@ -0,0 +1,78 @@
+"""Align Module
+
+This module contains the functions used to remove shot-to-shot trigger
+jitter before shots are averaged or sliced. Each shot's lag behind a
+reference is the peak of their cross-correlation, found through the FFT and
+refined to a fraction of a sample as in the time of flight module. Every
+shot is then shifted back by its lag with a linear phase ramp on the same
+spectrum, so fractional lags cost no more than whole ones and the whole
+stack is aligned with one forward and two inverse transforms.
+
+Before transforming, each shot is padded with a straight line from its last
+sample back to its first, so the circular shift wraps smoothly and the
+samples shifted in at either end take the nearest edge value.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import numpy as np
+from scipy import fft
+
+import tof as timeofflight
+
+# Largest trigger jitter searched either way unless told otherwise
+MAX_JITTER = 100 # samples
+
+# Extra padding beyond the largest lag searched, so the edge ramp stays
+# away from the samples kept
+PAD_MARGIN = 16 # samples
+
+
+def _padded_spectra(rows, reference, max_lag, workers):
+
+    # Spectra of the rows and reference, each padded with a ramp joining
+    # its last sample to its first
+    n = rows.shape[-1]
+    nfft = fft.next_fast_len(n + 2*max_lag + PAD_MARGIN, real=True)
+    stacked = np.concatenate((reference[None, :], rows))
+    ramp = np.linspace(0, 1, nfft - n + 2)[1:-1]
+    padded = np.empty((len(stacked), nfft))
+    padded[:, :n] = stacked
+    padded[:, n:] = (stacked[:, -1:] + ramp[None, :]
+            * (stacked[:, :1] - stacked[:, -1:]))
+    spectra = fft.rfft(padded, axis=-1, workers=workers)
+    return spectra[0], spectra[1:], nfft
+
+
+def align_rows(rows, reference=None, max_lag=MAX_JITTER, workers=-1):
+
+    # rows is a (shots, samples) stack. Returns the stack with every shot
+    # moved onto the reference (by default the mean shot) and each shot's
+    # lag behind it in samples. Lags up to max_lag samples either way are
+    # searched, or every lag when it is None.
+    rows = np.asarray(rows)
+    n = rows.shape[-1]
+    if reference is None:
+        reference = np.sum(rows, axis=0) / len(rows)
+    if max_lag is None or max_lag > n - 1:
+        max_lag = n - 1
+    max_lag = int(max_lag)
+
+    reference_spectrum, spectra, nfft = _padded_spectra(rows,
+            np.asarray(reference, dtype=rows.dtype), max_lag, workers)
+
+    # Cross-correlation without the means (the zero frequency bin), as
+    # tof.xcorr does, kept to lags -max_lag ... max_lag
+    product = np.conj(reference_spectrum)[None, :] * spectra
+    product[:, 0] = 0
+    corr = fft.irfft(product, nfft, axis=-1, workers=workers)
+    corr = np.concatenate((corr[:, nfft-max_lag:], corr[:, :max_lag+1]),
+            axis=-1)
+    lags = timeofflight.peak_lag(corr, np.arange(-max_lag, max_lag + 1))
+
+    # x[t + lag] for every shot: a phase ramp on the spectrum
+    frequency = np.arange(spectra.shape[-1]) / nfft
+    spectra *= np.exp(2j * np.pi * frequency[None, :] * lags[:, None])
+    aligned = fft.irfft(spectra, nfft, axis=-1, workers=workers)[:, :n]
+
+    return aligned.astype(rows.dtype, copy=False), lags
@@ -0,0 +1,243 @@
+"""API Module
+
+This module contains the functions used to analyze a dataset from scripts,
+notebooks and other programs: one function per diagnostic, taking the
+dataset path and the analysis parameters and returning a result object that
+holds the arrays and fitted values. Nothing here draws, and neither Qt nor
+matplotlib is imported; render lays these results out on figures and the GUI
+is a thin client of this module.
+
+    import api
+    result = api.analyze_dbd('DLP/run1', bootstrap=True)
+    print(result.Te, result.intervals['Te'])
+
+Every function runs the diagnostic's pipeline, so passing cache (a
+pipeline.NodeCache) or store (a store.ResultStore) lets repeated analyses
+reuse the stage outputs of earlier ones.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import pipeline
+
+
+class Result:
+    """Arrays and fitted values of one analyzed dataset.
+
+    Attributes:
+        name -- dataset path
+        params -- every pipeline parameter the result was computed with
+        values -- scalar results by name, as stored in the results database
+    """
+
+    diagnostic = None
+
+    def __init__(self, name, params, values=None):
+        self.name = name
+        self.params = params
+        self.values = dict(values or {})
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.name)
+
+
+class RPAResult(Result):
+    """Ion velocity distribution of a retarding potential analyzer dataset.
+
+    Attributes:
+        energy -- ion energy of each IVDF point, in eV
+        ivdf -- ion velocity distribution function at each energy
+        shots -- filtered (and aligned) current trace of each shot file
+    """
+
+    diagnostic = 'RPA'
+
+    def __init__(self, name, params, energy, ivdf, shots, values):
+        super().__init__(name, params, values)
+        self.energy = energy
+        self.ivdf = ivdf
+        self.shots = shots
+
+
+class DLPResult(Result):
+    """Plasma density over time at each Langmuir probe position.
+
+    Attributes:
+        time -- sample times, in us whatever the files' time unit
+        density -- electron number density over time by probe folder, in m^-3
+        tof -- time of flight delays and velocities between probe pairs, or
+            None when not computed
+    """
+
+    diagnostic = 'DLP'
+
+    def __init__(self, name, params, time, density, tof=None):
+        super().__init__(name, params)
+        self.time = time
+        self.density = density
+        self.tof = tof
+
+
+class DBDResult(Result):
+    """Electron temperature and density from a Langmuir probe bias sweep.
+
+    Attributes:
+        data -- (bias, peak current) rows, in V and uA
+        regression -- linear fits of the ion saturation, electron retarding
+            and electron saturation regions
+        Te -- electron temperature, in eV
+        ne -- electron number density, in m^-3
+        intervals -- bootstrap confidence interval of each value, or None
+    """
+
+    diagnostic = 'DBD'
+
+    def __init__(self, name, params, data, regression, Te, ne, intervals,
+            values):
+        super().__init__(name, params, values)
+        self.data = data
+        self.regression = regression
+        self.Te = Te
+        self.ne = ne
+        self.intervals = intervals
+
+
+class NFPResult(Result):
+    """Current density profiles and beam metrics of a Nude Faraday probe.
+
+    Attributes:
+        Idensity -- (radial positions, current densities) by probe id
+        probes -- probe ids, in the row order of the metrics
+        metrics -- beam current, divergence, centroid and centroid angle
+            arrays, one entry per probe
+    """
+
+    diagnostic = 'NFP'
+
+    def __init__(self, name, params, Idensity, probes, metrics, values):
+        super().__init__(name, params, values)
+        self.Idensity = Idensity
+        self.probes = probes
+        self.metrics = metrics
+
+
+class BiasResult(Result):
+    """Current density at each bias potential of a Faraday probe sweep.
+
+    Attributes:
+        Idensity -- current density by bias potential
+    """
+
+    diagnostic = 'Bias'
+
+    def __init__(self, name, params, Idensity):
+        super().__init__(name, params)
+        self.Idensity = Idensity
+
+
+class PowerResult(Result):
+    """Input voltage, current and power traces of one trial.
+
+    Attributes:
+        data -- time, voltage, current, power (and energy) arrays
+        title -- title of the trial
+        pulses -- start, end and peak of every pulse, or None
+        pulse_statistics -- count, energy and repetition rate of the
+            pulses, or None
+    """
+
+    diagnostic = 'Power'
+
+    def __init__(self, name, params, data, title, values, pulses=None,
+            pulse_statistics=None):
+        super().__init__(name, params, values)
+        self.data = data
+        self.title = title
+        self.pulses = pulses
+        self.pulse_statistics = pulse_statistics
+
+
+def _run(diagnostic, name, params, targets=('result',), cache=None,
+        store=None):
+    return pipeline.run(pipeline.get_pipeline(diagnostic), name, params,
+            targets, cache, store=store)
+
+
+def analyze_rpa(name, order=2, cutoff=0.04, align=False, tts=400, medWin=9,
+        smooth=4, splinePts=100, stepV=2, cache=None, store=None):
+
+    params = {'order': order, 'cutoff': cutoff, 'align': align, 'tts': tts,
+            'medWin': medWin, 'smooth': smooth, 'splinePts': splinePts,
+            'stepV': stepV}
+    values = _run('RPA', name, params, ('aligned', 'result'), cache, store)
+    result = values['result']
+    shots = dict((shot, values['aligned'][shot][0])
+            for shot in values['aligned'])
+    return RPAResult(name, params, result['energy'], result['ivdf'], shots,
+            result['values'])
+
+
+def analyze_dlp(name, order=2, cutoff=0.05, align=False, tof=False,
+        budget=None, time_unit='us', cache=None, store=None):
+
+    # budget (bytes) averages the shots block by block within it; time_unit
+    # is the unit of the shot files' time column (see lplt.TIME_UNITS)
+    params = {'order': order, 'cutoff': cutoff, 'align': align, 'tof': tof,
+            'budget': budget, 'time_unit': time_unit}
+    result = _run('DLP', name, params, cache=cache, store=store)['result']
+    return DLPResult(name, params, result['time'], result['density'],
+            result.get('tof'))
+
+
+def analyze_dbd(name, tol=pipeline.SATURATION_TOL, bootstrap=False,
+        budget=None, cache=None, store=None):
+
+    params = {'tol': tol, 'bootstrap': bootstrap, 'budget': budget}
+    result = _run('DBD', name, params, cache=cache, store=store)['result']
+    return DBDResult(name, params, result['data'], result['regression'],
+            result['Te'], result['ne'], result['intervals'], result['values'])
+
+
+def analyze_nfp(name, order=2, cutoff=0.05, budget=None, cache=None,
+        store=None):
+
+    params = {'order': order, 'cutoff': cutoff, 'budget': budget}
+    result = _run('NFP', name, params, cache=cache, store=store)['result']
+    return NFPResult(name, params, result['Idensity'], result['probes'],
+            result['metrics'], result['values'])
+
+
+def analyze_bias(name, order=2, cutoff=0.05, cache=None, store=None):
+
+    params = {'order': order, 'cutoff': cutoff}
+    result = _run('Bias', name, params, cache=cache, store=store)['result']
+    return BiasResult(name, params, result['Idensity'])
+
+
+def analyze_power(name, energy=False, stream=False, pulses=False, title=None,
+        cache=None, store=None):
+
+    # stream computes through memory-mapped files to bound memory; the
+    # title defaults to the trial's path
+    if title is None:
+        title = name
+    params = {'energy': energy, 'stream': stream, 'pulses': pulses,
+            'title': title}
+    result = _run('Power', name, params, cache=cache, store=store)['result']
+    return PowerResult(name, params, result['data'], result['title'],
+            result['values'], result.get('pulses'),
+            result.get('pulse statistics'))
+
+
+ANALYZE = {'RPA': analyze_rpa, 'DLP': analyze_dlp, 'DBD': analyze_dbd,
+           'NFP': analyze_nfp, 'Bias': analyze_bias, 'Power': analyze_power}
+
+
+def analyze(diagnostic, name, params=None, cache=None, store=None):
+
+    # Result of any diagnostic, with params as keyword arguments of its
+    # function
+    if diagnostic not in ANALYZE:
+        raise ValueError("Diagnostic is not recognized: %r" % diagnostic)
+    return ANALYZE[diagnostic](name, cache=cache, store=store,
+            **(params or {}))
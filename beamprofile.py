@@ -0,0 +1,127 @@
+"""Beam Profile Module
+
+This module contains the functions used to reduce Nude Faraday probe current
+density profiles to beam metrics: total beam current, divergence half-angle
+and centroid. Profiles from every probe and every sweep are reduced together
+as one array, so a whole campaign comes out of a single call.
+
+Radial positions are taken as arc lengths along the hemisphere of radius
+distance swept by the probe, so position r maps to the polar angle r/distance.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import numpy as np
+from scipy.interpolate import make_interp_spline
+
+# Radius of the hemisphere swept by the probe, measured from the thruster
+# exit plane
+PROBE_DISTANCE = 0.5 # m
+
+
+def stack_profiles(Idensity, grid=None):
+
+    # Resample each probe's (positions, current density) profile onto one
+    # shared grid so all probes reduce as rows of a single matrix
+    probes = list(Idensity.keys())
+    if grid is None:
+        grid = np.unique(np.concatenate(
+            [Idensity[id][0] for id in probes]))
+
+    profiles = np.zeros((len(probes), len(grid)))
+    for row, id in enumerate(probes):
+        position, J = Idensity[id]
+        order = np.argsort(position)
+        profiles[row] = np.interp(grid, position[order], J[order],
+                left=0, right=0)
+
+    return probes, grid, profiles
+
+
+def _interp_matrix(x, x_new):
+
+    # Linear interpolation from x to x_new as a matrix, clamped at the ends
+    # like np.interp, so it applies to any number of rows in one product
+    index = np.clip(np.searchsorted(x, x_new) - 1, 0, len(x) - 2)
+    weight = np.clip((x_new - x[index]) / (x[index+1] - x[index]), 0, 1)
+
+    matrix = np.zeros((len(x_new), len(x)))
+    rows = np.arange(len(x_new))
+    matrix[rows, index] = 1 - weight
+    matrix[rows, index+1] += weight
+
+    return matrix
+
+
+def _cumulative(theta, f, method):
+
+    # Cumulative integral of f along its last axis, starting at 0
+    if method == 'spline':
+        spline = make_interp_spline(theta, f, k=3, axis=-1).antiderivative()
+        cumulative = spline(theta)
+        return cumulative - cumulative[..., :1]
+    elif method == 'trapezoid':
+        areas = np.diff(theta) * (f[..., 1:] + f[..., :-1]) / 2.0
+        cumulative = np.zeros(f.shape)
+        cumulative[..., 1:] = np.cumsum(areas, axis=-1)
+        return cumulative
+    else:
+        raise ValueError("Integration method is not recognized: %r" % method)
+
+
+def beam_metrics(position, profiles, distance=PROBE_DISTANCE, fraction=0.95,
+        method='trapezoid'):
+
+    # position is the shared radial grid in cm; profiles holds current
+    # density in A/m^2 on that grid along its last axis, with any leading
+    # axes for probes and sweeps
+    position = np.asarray(position, dtype=np.float64)
+    profiles = np.asarray(profiles, dtype=np.float64)
+    order = np.argsort(position)
+    position = position[order]
+    profiles = profiles[..., order]
+
+    theta = position * 1E-2 / distance # rad
+    weight = np.absolute(np.sin(theta))
+
+    # Sweeps covering one side of the axis stand for the whole ring;
+    # sweeps across the axis already cover both halves
+    if position[0] >= 0:
+        ring = 2 * np.pi
+    else:
+        ring = np.pi
+
+    current = _cumulative(theta, profiles * weight, method)
+    total = current[..., -1]
+
+    # Centroid of the profile itself, without the ring area weighting
+    # that would pull it away from the axis
+    mass = _cumulative(theta, profiles, method)[..., -1]
+    moment = _cumulative(theta, profiles * position, method)[..., -1]
+
+    # Current enclosed within +/- alpha for every |theta| on the grid
+    alpha = np.unique(np.concatenate(([0], np.absolute(theta))))
+    upper = _interp_matrix(theta, alpha)
+    lower = _interp_matrix(theta, -alpha)
+    enclosed = current @ (upper - lower).T
+    enclosed_fraction = enclosed / enclosed[..., -1:]
+
+    # First alpha reaching the requested fraction, linearly interpolated
+    # from the sample below it
+    above = np.argmax(enclosed_fraction >= fraction, axis=-1)[..., None]
+    below = np.maximum(above - 1, 0)
+    f_above = np.take_along_axis(enclosed_fraction, above, axis=-1)
+    f_below = np.take_along_axis(enclosed_fraction, below, axis=-1)
+    step = np.where(f_above > f_below, f_above - f_below, 1)
+    divergence = (alpha[below] + (fraction - f_below) / step
+            * (alpha[above] - alpha[below]))
+    divergence = np.where(above == 0, 0, divergence)[..., 0]
+
+    metrics = {}
+    metrics['beam current'] = ring * distance**2 * total # A
+    metrics['divergence'] = np.degrees(divergence) # deg
+    metrics['centroid'] = moment / mass # cm
+    metrics['centroid angle'] = np.degrees(
+            metrics['centroid'] * 1E-2 / distance) # deg
+
+    return metrics
@@ -11,7 +11,6 @@ __author__ = 'Kaito Durkee'
 import sys
 import os
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy import signal
 from scipy.signal import butter, lfilter
 from scipy.stats import maxwell
@@ -19,12 +18,16 @@ from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
 import re
 
-from PyQt5.QtWidgets import QCheckBox
+import precision
+import sharedstack
+
+# Bias voltage in a shot filename, e.g. '-30V' or '- 30 V'
+BIAS_PATTERN = re.compile('-?[ ]?[0-9]?[0-9][ ]?V')
 
 def get_bias_potential(file):
 
     # Pull out bias voltage from filename as a float.
-    bias_match = re.search('-?[ ]?[0-9]?[0-9][ ]?V',file)
+    bias_match = BIAS_PATTERN.search(file)
 
     if bias_match == None:
         raise ValueError("\n\nFilename format is incorrect: %r" % file)
@@ -40,27 +43,52 @@ def get_bias_potential(file):
 
 def get_data(name):
 
+    # Read by path so the caller's working directory never changes
+    return read_files(list_files(name))
+
+
+def list_files(name):
+    return [os.path.join(name, shot) for shot in os.listdir(name)
+            if shot != '.gitignore']
+
+
+def read_files(files):
+
+    # Load the given shot files, e.g. from a catalog query
     data = {}
-    os.chdir(name)
 
-    for shot in os.listdir():
-        bias = get_bias_potential(shot)
+    for shot in files:
+        bias = get_bias_potential(os.path.basename(shot))
 
-        data[bias] = np.ndfromtxt(
-            shot, delimiter='\t')
+        data[bias] = precision.asarray(np.genfromtxt(
+            shot, delimiter='\t'))
 
     return data
 
 
 def butter_filter(data, order, cutoff):
     buttered = {}
-    sos = signal.butter(order, cutoff, btype='low', analog=False, output='sos')
+    sos = precision.butter_sos(order, cutoff)
     for bias in data:
         corrected = np.array(signal.sosfiltfilt(sos, data[bias][:, 1]))
         buttered[bias] = corrected
     return buttered
 
 
+def butter_filter_parallel(data, order, cutoff, workers=None):
+
+    # butter_filter on a process pool, see sharedstack.filter_rows
+    sos = precision.butter_sos(order, cutoff)
+    biases = list(data)
+    filtered = sharedstack.filter_rows(
+        [data[bias][:, 1] for bias in biases], sos, workers)
+
+    buttered = {}
+    for bias, corrected in zip(biases, filtered):
+        buttered[bias] = corrected
+    return buttered
+
+
 def get_max_vals(buttered):
 
     max_vals = {}
@@ -0,0 +1,163 @@
+"""Catalog Module
+
+This module contains the functions used to index the metadata encoded in
+campaign filenames (bias voltage, radial position, scope channel and probe
+folder) into a local SQLite database. A campaign is scanned once; rescans
+only re-parse files whose size or modification time changed. Queries return
+file paths that the read_files loaders in bplt, lplt, nplt and pplt accept
+directly, without walking directories.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import hashlib
+import sqlite3
+
+from bplt import BIAS_PATTERN, get_bias_potential
+from nplt import POSITION_PATTERN, ID_LIST, get_radial_position
+from pplt import CHANNEL_PATTERN, get_channel_name
+
+CATALOG_NAME = 'catalog.sqlite'
+
+# Default catalogs live outside the scanned tree, so they never become part
+# of the datasets the loaders read and results.dataset_hash hashes
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'export', 'catalogs')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT,
+    directory TEXT,
+    name TEXT,
+    extension TEXT,
+    size INTEGER,
+    mtime REAL,
+    bias REAL,
+    position REAL,
+    channel TEXT,
+    probe TEXT
+);
+CREATE INDEX IF NOT EXISTS files_bias ON files (bias, folder);
+CREATE INDEX IF NOT EXISTS files_position ON files (position, probe);
+CREATE INDEX IF NOT EXISTS files_channel ON files (channel, directory);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder, directory);
+"""
+
+# Files that are never data, including a catalog built inside its root
+SKIPPED = ['.gitignore', CATALOG_NAME, CATALOG_NAME + '-journal']
+
+
+def catalog_path(root):
+
+    # Default database of one root, named after it and a hash of its
+    # absolute path so campaigns with the same folder name do not collide
+    root = os.path.abspath(root)
+    digest = hashlib.sha256(root.encode('utf8')).hexdigest()[:12]
+    return os.path.join(CATALOG_DIR, '%s-%s.sqlite' % (
+            os.path.basename(root) or 'root', digest))
+
+
+def connect(db):
+    connection = sqlite3.connect(db)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def parse_metadata(name):
+
+    # Every pattern is tried on every file; a filename only carries the
+    # fields of its own diagnostic, so misses are stored as NULL
+    metadata = {'bias': None, 'position': None, 'channel': None}
+
+    if POSITION_PATTERN.search(name) is not None:
+        metadata['position'] = get_radial_position(name)
+    if BIAS_PATTERN.search(name) is not None:
+        metadata['bias'] = get_bias_potential(name)
+    if CHANNEL_PATTERN.search(name) is not None:
+        metadata['channel'] = get_channel_name(name)
+
+    return metadata
+
+
+def build(root, db=None):
+
+    # Scan root and bring the catalog up to date; returns the database path
+    root = os.path.abspath(root)
+    if db is None:
+        db = catalog_path(root)
+        os.makedirs(os.path.dirname(db), exist_ok=True)
+
+    connection = connect(db)
+    known = dict((row[0], (row[1], row[2])) for row in
+            connection.execute('SELECT path, size, mtime FROM files'))
+
+    rows = []
+    seen = set()
+    for directory, folders, files in os.walk(root):
+        folders.sort()
+        relative = os.path.relpath(directory, root)
+        if relative == '.':
+            relative = ''
+        folder = relative.split(os.sep)[0]
+        for name in sorted(files):
+            if name in SKIPPED:
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            seen.add(path)
+            if known.get(path) == (stat.st_size, stat.st_mtime):
+                continue
+
+            # As in nplt.read_files, the probe id is the first letter of
+            # the folder above a shot's position folder, at any depth
+            metadata = parse_metadata(name)
+            parts = relative.split(os.sep)
+            if (metadata['position'] is not None and len(parts) >= 2
+                    and parts[-2][:1] in ID_LIST):
+                probe = parts[-2][0]
+            else:
+                probe = None
+            rows.append((path, folder, relative, name,
+                    os.path.splitext(name)[1].lower(), stat.st_size,
+                    stat.st_mtime, metadata['bias'], metadata['position'],
+                    metadata['channel'], probe))
+
+    with connection:
+        connection.executemany(
+                'INSERT OR REPLACE INTO files VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        connection.executemany('DELETE FROM files WHERE path = ?',
+                [(path,) for path in known if path not in seen])
+    connection.close()
+
+    return db
+
+
+def query(db, bias=None, position=None, channel=None, probe=None,
+        folder=None, directory=None, extension=None):
+
+    # Paths of every cataloged file matching all of the given fields,
+    # e.g. query(db, bias=-30, folder='L')
+    fields = {'bias': bias, 'position': position, 'channel': channel,
+            'probe': probe, 'folder': folder, 'directory': directory,
+            'extension': extension}
+
+    conditions = []
+    values = []
+    for field in fields:
+        if fields[field] is not None:
+            conditions.append(field + ' = ?')
+            values.append(fields[field])
+
+    sql = 'SELECT path FROM files'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY path'
+
+    connection = connect(db)
+    paths = [row[0] for row in connection.execute(sql, values)]
+    connection.close()
+
+    return paths
@@ -1,39 +1,114 @@
 import sys
 import os
+from functools import partial
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy import signal
 from scipy.signal import butter, lfilter
 from scipy.stats import maxwell
 from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
 
-from PyQt5.QtWidgets import QCheckBox
+import precision
+import sharedstack
+import outofcore
+import align as alignment
+from resample import resample_rows
+
+# Microseconds per unit of the shot files' time column; density puts its
+# time axis in us, which tof and the plots assume
+TIME_UNITS = {'s': 1E6, 'ms': 1E3, 'us': 1.0, 'ns': 1E-3}
 
 
 def get_data(name):
 
-    data = {}
-    os.chdir(name)
+    # Shots of every probe folder, read by path so the caller's working
+    # directory never changes
+    return read_files(list_files(name))
+
 
-    for folder in os.listdir():
+def list_files(name):
+
+    # Shot files of every probe folder, in the order get_data reads them
+    files = []
+    for folder in os.listdir(name):
         if not folder == '.gitignore':
-            data.update({folder: []})
+            for shot in os.listdir(os.path.join(name, folder)):
+                files.append(os.path.join(name, folder, shot))
+    return files
+
+
+def get_shot_files(name, budget):
+
+    # The dataset as files read in blocks within budget bytes; butter_filter
+    # and butter_avg accept it in place of get_data's dictionary
+    return outofcore.ShotFiles(list_files(name), read_files, shot_rows,
+            budget)
+
+
+def shot_rows(data):
+    for key in data.keys():
+        yield key, data[key]
 
-            for shot in os.listdir(folder):
-                data[folder].append(np.ndfromtxt(
-                    folder + '/' + shot, delimiter='\t'))
+
+def read_files(files):
+
+    # Load the given shot files, e.g. from a catalog query, grouped by the
+    # folder each one sits in
+    data = {}
+
+    for shot in files:
+        folder = os.path.basename(os.path.dirname(os.path.abspath(shot)))
+        data.setdefault(folder, []).append(precision.asarray(np.genfromtxt(
+            shot, delimiter='\t')))
     return data
 
 
+def common_grid(data):
+
+    # Time column of the first shot, which every shot is resampled onto
+    if isinstance(data, outofcore.ShotFiles):
+        data = data.read(data.files[:1])
+    first = next(iter(data.values()))[0]
+    return np.asarray(first[:, 0], dtype=np.float64)
+
+
+def resample(data, grid):
+
+    # Every shot interpolated from its own time column onto grid, so shots
+    # of any length or sample rate stack; each probe folder becomes one
+    # contiguous (shots, samples, 2) array laid out like the shot files
+    if isinstance(data, outofcore.ShotFiles):
+        return data.map(partial(resample, grid=grid))
+
+    resampled = {}
+    for key in data.keys():
+        shots = data[key]
+        values = resample_rows([shot[:, 0] for shot in shots],
+                [shot[:, 1] for shot in shots], grid)
+        stack = np.empty(values.shape + (2,), dtype=values.dtype)
+        stack[:, :, 0] = grid
+        stack[:, :, 1] = values
+        resampled[key] = stack
+    return resampled
+
+
 def butter_filter(data, order, cutoff):
 
+    if isinstance(data, outofcore.ShotFiles):
+        return data.map(partial(butter_filter, order=order, cutoff=cutoff))
+
     buttered = {}
-    sos = signal.butter(order, cutoff, btype='low', analog=False, output='sos')
+    sos = precision.butter_sos(order, cutoff)
 
     correct = 1  # 0.004 # Is this value necessary?
 
     for key in data.keys():
+        if isinstance(data[key], np.ndarray):
+            # A resampled stack is filtered in one call along the samples
+            V = np.sqrt(data[key][:, :, 1]**2)
+            buttered[key] = correct * signal.sosfiltfilt(sos, V, axis=1)
+            continue
+
         buttered.update({key: []})
 
         for shot in data[key]:
@@ -44,17 +119,67 @@ def butter_filter(data, order, cutoff):
     return buttered
 
 
-def butter_avg(buttered):
+def butter_filter_parallel(data, order, cutoff, workers=None):
+
+    # butter_filter on a process pool, see sharedstack.filter_rows;
+    # resampled stacks keep their layout
+    sos = precision.butter_sos(order, cutoff)
+
+    rows = []
+    for key in data.keys():
+        if isinstance(data[key], np.ndarray):
+            rows.extend(np.sqrt(data[key][:, :, 1]**2))
+        else:
+            rows.extend(np.sqrt(shot[:, 1]**2) for shot in data[key])
+    filtered = sharedstack.filter_rows(rows, sos, workers)
+
+    buttered = {}
+    index = 0
+    for key in data.keys():
+        block = filtered[index:index + len(data[key])]
+        if isinstance(data[key], np.ndarray):
+            buttered[key] = np.asarray(block)
+        else:
+            buttered[key] = list(block)
+        index += len(data[key])
+
+    return buttered
+
+
+def butter_avg(buttered, align=False):
+
+    # Shot stacks larger than memory are averaged block by block, with the
+    # same result. With align, every shot is first moved onto the plain
+    # average of its folder to remove trigger jitter, which takes a second
+    # pass over the files out of core.
+    if isinstance(buttered, outofcore.ShotFiles):
+        avg = outofcore.reduce_groups(buttered)
+        if align:
+            avg = outofcore.reduce_groups(outofcore.ShotFiles(
+                    buttered.files, buttered.read,
+                    partial(aligned_rows, references=avg), buttered.budget,
+                    buttered.transforms))
+        return dict(avg)
 
     avg = {}
 
     for key in buttered.keys():
         avg.update({key: (np.sum(buttered[key], axis=0) / len(buttered[key]))})
+        if align:
+            aligned = alignment.align_rows(np.asarray(buttered[key]),
+                    avg[key])[0]
+            avg[key] = np.sum(aligned, axis=0) / len(aligned)
 
     return avg
 
 
-def density(avg):
+def aligned_rows(data, references):
+    for key in data.keys():
+        yield key, alignment.align_rows(np.asarray(data[key]),
+                references[key])[0]
+
+
+def density(avg, time_axis=None, time_unit='us'):
 
     temp_estimate = 10  # eV
     temp_eV = temp_estimate * 1.16E4
@@ -65,9 +190,17 @@ def density(avg):
 
     const = 0.6 * electron_charge * area_of_probe * \
         np.sqrt(boltz * temp_eV / mass)
+    const = precision.get_dtype()(const)
 
     density = {}
-    time_axis = np.linspace(1, 10000, num=10000) / 10
+    if time_axis is None:
+        # Shots of 10000 samples 0.1 us apart, as the scope records them
+        time_axis = np.linspace(1, 10000, num=10000) / 10
+    else:
+        # Resampled data passes its own grid, in time_unit
+        if time_unit not in TIME_UNITS:
+            raise ValueError("Time unit is not recognized: %r" % time_unit)
+        time_axis = np.asarray(time_axis) * TIME_UNITS[time_unit] # us
 
     for key in avg.keys():
         density.update({key: avg[key] / const})
@@ -9,8 +9,8 @@ __author__ = 'Kaito Durkee'
 
 import sys
 import os
+from functools import partial
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy import signal
 from scipy.signal import butter, lfilter
 from scipy.stats import maxwell
@@ -18,18 +18,86 @@ from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
 import re
 
-from PyQt5.QtWidgets import QCheckBox
+import precision
+import outofcore
+
+
+# Radial position in a shot filename, e.g. '12.5 cm' or '3-cm'
+POSITION_PATTERN = re.compile('[0-9]?[0-9][.]?[0-9]?[0-9]?[ -]?[ ]?cm')
+
+# id is L, R, D, or T (Left, Right, Double, or Triple)
+ID_LIST = ['L','R','D','T']
+
+
+class ShotTable:
+    """Shots stored as parallel arrays beside one 2-D sample matrix.
+
+    Row i of samples belongs to probe[i] at position[i]. Group-by
+    reductions sort the rows by (probe, position) once and reduce each
+    group with a segmented ufunc, so no Python loop runs per shot.
+
+    Attributes:
+        probe -- probe id of each row ('L', 'R', 'D' or 'T')
+        position -- radial position of each row, in cm
+        shot -- shot index of each row within its probe and position
+        samples -- (rows, samples) matrix of signal values
+    """
+
+    def __init__(self, probe, position, shot, samples):
+        self.probe = np.asarray(probe, dtype='U1')
+        self.position = np.asarray(position, dtype=np.float64)
+        self.shot = np.asarray(shot, dtype=np.int32)
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.probe)
+
+    def groups(self):
+        # Row order sorting the table by (probe, position), and the index
+        # in that order where each group starts
+        order = np.lexsort((self.position, self.probe))
+        probe = self.probe[order]
+        position = self.position[order]
+
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = ((probe[1:] != probe[:-1])
+                | (position[1:] != position[:-1]))
+        starts = np.flatnonzero(new_group)
+
+        return order, starts
+
+    def group_reduce(self, values, ufunc):
+        # Reduce per-row values (1-D or one row per shot) within each
+        # (probe, position) group, e.g. with np.add or np.maximum
+        order, starts = self.groups()
+        reduced = ufunc.reduceat(np.asarray(values)[order], starts, axis=0)
+        return self.probe[order][starts], self.position[order][starts], \
+            reduced
+
+    def group_mean(self):
+        # One averaged row per (probe, position). Each group's rows are
+        # summed in file order, as the out-of-core path folds them, rather
+        # than with reduceat's pairwise order
+        order, starts = self.groups()
+        stops = np.append(starts[1:], len(order))
+        counts = stops - starts
+        samples = self.samples[order]
+        sums = np.array([np.add.reduce(samples[start:stop], axis=0)
+                for start, stop in zip(starts, stops)])
+        means = sums / counts[:, None].astype(sums.dtype)
+        return ShotTable(self.probe[order][starts],
+                self.position[order][starts], np.zeros(len(starts)), means)
 
 
 def get_radial_position(filename):
 
     # Pull out radial position from filename as a float.
-    position_match = re.search('[0-9]?[0-9][.]?[0-9]?[0-9]?[ -]?[ ]?cm',filename)
+    position_match = POSITION_PATTERN.search(filename)
 
     if position_match == None:
         raise ValueError("Filename format is incorrect: %r" % filename)
 
-    position_string = bias_match.group()
+    position_string = position_match.group()
     position_string = "".join(position_string.split())
     position_string = position_string[:-2]
     if position_string[-1] == '-':
@@ -40,9 +108,9 @@ def get_radial_position(filename):
     return position
 
 
-def check_folders_in_directory(id_list):
+def check_folders_in_directory(id_list, name='.'):
     flag = False
-    for folder in os.listdir():
+    for folder in os.listdir(name):
         if folder[0] in id_list:
             flag = True
     if flag == False:
@@ -52,71 +120,121 @@ def check_folders_in_directory(id_list):
 
 def get_data(name):
 
-    data = {}
-    os.chdir(name)
+    check_folders_in_directory(ID_LIST, name)
 
-    # id is L, R, D, or T (Left, Right, Double, or Triple)
-    id_list = ['L','R','D','T']
-    check_folders_in_directory(id_list)
+    return read_files(list_files(name))
 
-    for id in id_list:
-        for folder in os.listdir():
-            if folder[0] == id:
-                data[id] = {}
-                for position_file in os.listdir(folder):
-                    for shot_file in os.listdir(position_file):
-                        position = get_radial_position(shot_file)
-                        data[id][position] = {shot_file: np.ndfromtxt(
-                                folder + '/' + position_file +'/' +
-                                shot_file, delimiter='\t')}
-    if data == {}:
 
-    return data
+def list_files(name):
+
+    # Shot files of every probe and position folder, in probe id order
+    files = []
+    for id in ID_LIST:
+        for folder in sorted(os.listdir(name)):
+            if folder[0] == id and os.path.isdir(os.path.join(name, folder)):
+                for position_folder in sorted(os.listdir(
+                        os.path.join(name, folder))):
+                    position_path = os.path.join(name, folder,
+                            position_folder)
+                    for shot_file in sorted(os.listdir(position_path)):
+                        files.append(os.path.join(position_path, shot_file))
+
+    return files
+
+
+def get_shot_files(name, budget):
+
+    # The dataset as files read in blocks within budget bytes; butter_filter
+    # and butter_avg accept it in place of get_data's ShotTable
+    check_folders_in_directory(ID_LIST, name)
+    return outofcore.ShotFiles(list_files(os.path.abspath(name)), read_files,
+            shot_rows, budget)
+
+
+def shot_rows(data):
+    for row in range(len(data)):
+        yield (data.probe[row], data.position[row]), data.samples[row:row+1]
+
+
+def read_files(files):
+
+    # Load the given shot files, e.g. from a catalog query. The probe id
+    # is the first letter of the folder two levels above each file.
+    probe = []
+    position = []
+    shot = []
+    samples = []
+    shot_count = {}
+
+    for shot_file in files:
+        probe_folder = os.path.dirname(os.path.dirname(
+                os.path.abspath(shot_file)))
+        id = os.path.basename(probe_folder)[0]
+        radial_position = get_radial_position(os.path.basename(shot_file))
+
+        # Shots are numbered in file order within each probe and position
+        key = (id, radial_position)
+        shot_count[key] = shot_count.get(key, -1) + 1
+
+        probe.append(id)
+        position.append(radial_position)
+        shot.append(shot_count[key])
+        samples.append(precision.asarray(np.genfromtxt(
+                shot_file, delimiter='\t')[:, 1]))
+
+    if samples == []:
+        raise ValueError("No shot files found in directory: " +
+                         "CHECK DIRECTORY")
+    if len(set(len(s) for s in samples)) != 1:
+        raise ValueError("Shot files differ in length: CHECK DIRECTORY")
+
+    return ShotTable(probe, position, shot, np.vstack(samples))
 
 
 def butter_filter(data, order, cutoff):
-    buttered = {}
-    sos = signal.butter(order, cutoff, btype='low', analog=False, output='sos')
-    for id in data:
-        buttered[id] = {}
-        for position in data[id]:
-            buttered[id][position] = {}
-            for shot_file in data[id][position]:
-                corrected = np.array(
-                    signal.sosfiltfilt(sos, data[positon][shot_file][:, 1]))
 
-                buttered[id][position][shot_file] = corrected
-    return buttered
+    if isinstance(data, outofcore.ShotFiles):
+        return data.map(partial(butter_filter, order=order, cutoff=cutoff))
 
+    # All shots are filtered in one call along the sample axis
+    sos = precision.butter_sos(order, cutoff)
+    corrected = signal.sosfiltfilt(sos, data.samples, axis=1)
 
-def butter_avg(buttered):
+    return ShotTable(data.probe, data.position, data.shot, corrected)
 
-    avg = {}
 
-    for id in buttered.keys():
-        avg[id] = {}
-        for position in buttered[id]:
-            avg[id][position] = {}
-            for shot_file in buttered[id][position]:
-                length = len(buttered[id][position][shot_file])
-                average_vals = (np.sum(
-                        buttered[id][position][shot_file], axis=0) / length)
+def butter_avg(buttered):
+
+    # Shot stacks larger than memory are averaged block by block, with the
+    # same result
+    if isinstance(buttered, outofcore.ShotFiles):
+        means = outofcore.reduce_groups(buttered)
+        groups = list(means)
+        probe = np.array([group[0] for group in groups], dtype='U1')
+        position = np.array([group[1] for group in groups])
+        order = np.lexsort((position, probe))
+        return ShotTable(probe[order], position[order],
+                np.zeros(len(groups)), np.array([means[groups[index]]
+                for index in order]))
 
-                avg[id][position] = average_vals
+    return buttered.group_mean()
 
-    return avg
 
 def get_max_vals(avg):
 
-    max_vals = {}
+    # Largest |min| per probe and position, returned per probe as sorted
+    # (positions, values) arrays
+    probe, position, max = avg.group_reduce(
+        np.absolute(np.amin(avg.samples, axis=1)), np.maximum)
 
-    for id in avg.keys():
-        max_vals[id] = {}
-        for position in avd[id]:
-            max = np.absolute(np.amin(avg[id][position]))
-            max_vals.[id][position] = max
+    max_vals = {}
+    for id in ID_LIST:
+        in_probe = probe == id
+        if in_probe.any():
+            max_vals[id] = (position[in_probe], max[in_probe])
     return max_vals
 
+
 def Idensity(max_vals):
 
     area_of_probe = 1.2667686E-4 # m^2 = pi*[(12.7 mm)/2]^2
@@ -126,12 +244,11 @@ def Idensity(max_vals):
 
     Idensity = {}
 
-    # Create a dictionary of radial position mapped to
+    # Create a dictionary of probe ids mapped to radial positions and
     # max current density values.
     for id in max_vals.keys():
-        Idensity[id] = {}
-        for position in max_vals[id]:
-            Idensity[id][position] = max_vals[position] / const
+        position, max = max_vals[id]
+        Idensity[id] = (position, max / const)
     return Idensity
 
 
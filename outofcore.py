@@ -0,0 +1,163 @@
+"""Out Of Core Module
+
+This module contains the functions used to average shot stacks that do not
+fit in memory. A dataset opened under a memory budget is a ShotFiles: the
+list of its shot files, the module function that reads some of them, and
+the filters to apply once they are read. Nothing is loaded until a
+reduction walks it in blocks of files sized to the budget.
+
+Every group of shots (a probe folder, or a probe and radial position) is
+reduced to a Partial of mergeable statistics: count, sum, maximum and the
+M2 sum of squared deviations for the variance. Rows are folded into the sum
+one at a time in file order, the same order numpy adds the rows of a stacked
+array, so the averages equal the in-memory ones exactly. Partials stay in
+memory while they fit in half the budget and spill to memory-mapped files
+after that.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+# Copies of one shot alive at once while it is parsed and filtered
+BLOCK_OVERHEAD = 8
+
+
+def _allocate(length, dtype, directory=None):
+    if directory is None:
+        return np.zeros(length, dtype=dtype)
+    handle, path = tempfile.mkstemp(dir=directory, suffix='.npy')
+    os.close(handle)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+            shape=(length,))
+
+
+class Partial:
+    """Mergeable count, sum, maximum and M2 of equal length rows."""
+
+    def __init__(self, length, dtype=np.float64, directory=None):
+        self.count = 0
+        self.total = _allocate(length, dtype, directory)
+        self.maximum = _allocate(length, dtype, directory)
+        self.running_mean = _allocate(length, np.float64, directory)
+        self.m2 = _allocate(length, np.float64, directory)
+
+    def update(self, rows):
+
+        # Fold rows in one at a time; the sum keeps numpy's row order and
+        # the mean and M2 follow Welford's update
+        for row in rows:
+            self.count += 1
+            if self.count == 1:
+                self.total[:] = row
+                self.maximum[:] = row
+            else:
+                np.add(self.total, row, out=self.total)
+                np.maximum(self.maximum, row, out=self.maximum)
+            delta = row - self.running_mean
+            self.running_mean += delta / self.count
+            self.m2 += delta * (row - self.running_mean)
+
+    def merge(self, other):
+
+        # Combine with the partial of other rows (Chan et al.), e.g. one
+        # reduced on another machine or from another directory
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count = other.count
+            self.total[:] = other.total
+            self.maximum[:] = other.maximum
+            self.running_mean[:] = other.running_mean
+            self.m2[:] = other.m2
+            return
+
+        count = self.count + other.count
+        delta = other.running_mean - self.running_mean
+        self.m2 += other.m2 + delta**2 * (self.count * other.count / count)
+        self.running_mean += delta * (other.count / count)
+        np.add(self.total, other.total, out=self.total)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.count = count
+
+    def mean(self):
+        return self.total / self.count
+
+    def variance(self, ddof=0):
+        return self.m2 / (self.count - ddof)
+
+
+class ShotFiles:
+    """Shot files of a dataset, read and filtered block by block."""
+
+    def __init__(self, files, read, rows, budget, transforms=()):
+        self.files = list(files)
+        self.read = read    # files -> data in the module's own layout
+        self.rows = rows    # data -> (group, rows) pairs in file order
+        self.budget = budget # bytes
+        self.transforms = tuple(transforms)
+
+    def __len__(self):
+        return len(self.files)
+
+    def map(self, transform):
+
+        # Same files with one more function applied to every block
+        return ShotFiles(self.files, self.read, self.rows, self.budget,
+                self.transforms + (transform,))
+
+    def load(self, files):
+        data = self.read(files)
+        for transform in self.transforms:
+            data = transform(data)
+        return data
+
+    def blocks(self, reserved=0):
+
+        # Blocks of loaded, transformed data. The first file alone sizes
+        # the blocks: as many shots as fit in the budget left after the
+        # reserved bytes, allowing for the copies made while loading.
+        start = 0
+        size = 1
+        while start < len(self.files):
+            block = self.load(self.files[start:start+size])
+            if start == 0:
+                shot_bytes = max([rows[0].nbytes for group, rows
+                        in self.rows(block)] or [1])
+                size = max(1, int((self.budget - reserved)
+                        // (shot_bytes * BLOCK_OVERHEAD)))
+                start = 1
+            else:
+                start += size
+            yield block
+
+
+def reduce_groups(shots, finish=Partial.mean):
+
+    # finish(partial) of every group of shots, in the order groups first
+    # appear. Partials beyond half the budget live in memory-mapped files
+    # that are removed once every group is finished.
+    with tempfile.TemporaryDirectory(prefix='partials_',
+            ignore_cleanup_errors=True) as spill_dir:
+        partials = OrderedDict()
+        used = 0
+        for block in shots.blocks(shots.budget // 2):
+            for group, rows in shots.rows(block):
+                if group not in partials:
+                    row = np.asarray(rows[0])
+                    size = 2 * row.nbytes + 2 * len(row) * 8
+                    directory = None
+                    if used + size > shots.budget // 2:
+                        directory = spill_dir
+                    partials[group] = Partial(len(row), row.dtype, directory)
+                    used += size
+                partials[group].update(rows)
+
+        finished = OrderedDict((group, finish(partials[group]))
+                for group in partials)
+        del partials
+    return finished
@@ -0,0 +1,589 @@
+"""Pipeline Module
+
+This module contains the functions used to describe every diagnostic as a
+graph of stages and to run those graphs. A stage names its input stages and
+the parameters it reads; the scheduler runs each stage as soon as its inputs
+are ready, so independent branches (the DBD bootstrap and regression fits,
+for example) run concurrently.
+
+Every node's output is keyed by a hash of its stage, its parameter values
+and the keys of its inputs, with the dataset, the working precision and the
+toolkit's source at the root. Cached nodes are reused and everything
+upstream of them is skipped, so changing one parameter reruns only the
+stages that depend on it. Outputs live in memory in a NodeCache and,
+optionally, on disk in a store.ResultStore that other runs and machines
+share. In memory the dataset is identified by its files' paths, sizes and
+modification times, which costs no reads; the store is addressed by the
+content of the files, hashed only when a store is used. The same graphs
+drive the GUI, the prefetcher and campaign rendering.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import sys
+import glob
+import hashlib
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import rplt
+import lplt
+import bplt
+import nplt
+import pplt
+import DBDlplt as dlplt
+import beamprofile
+import precision
+import results
+import outofcore
+import tof as timeofflight
+
+# Memory kept by a NodeCache before least recently used nodes are dropped
+CACHE_BUDGET = 512 * 2**20 # bytes
+
+# Shots filtered or scanned by a process pool sharing one stacked matrix
+# once they hold this much; smaller datasets are quicker in one process
+PARALLEL_MIN_BYTES = 64 * 2**20 # bytes
+
+# Tolerance between left and right saturation values in DBD fits
+SATURATION_TOL = 1E-8
+
+# The dataset path is the one input every graph starts from
+DATASET = 'dataset'
+
+_MISSING = object()
+
+
+# Source files hashed into every key, so edited code never reuses outputs
+# stored by an older version
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_code_version = None
+
+
+class Stage:
+    """One step of a pipeline: func(*inputs, *params) of named stages."""
+
+    def __init__(self, name, func, inputs=(), params=(), store=True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+        self.store = store  # False where rereading is cheaper than storing
+
+    def identity(self):
+        return self.func.__module__ + '.' + self.func.__qualname__
+
+
+class Pipeline:
+    """Stages of one diagnostic, checked to form a DAG, and their defaults."""
+
+    def __init__(self, stages, defaults=None):
+        self.stages = OrderedDict((stage.name, stage) for stage in stages)
+        self.defaults = dict(defaults or {})
+
+        for stage in stages:
+            for name in stage.inputs:
+                if name != DATASET and name not in self.stages:
+                    raise ValueError("Stage %r has an unknown input: %r"
+                            % (stage.name, name))
+
+        # Depth first topological order; a stage met again while its own
+        # inputs are still being visited closes a cycle
+        self.order = []
+        state = {}
+
+        def visit(name):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError("Pipeline has a cycle through: %r" % name)
+            state[name] = 'visiting'
+            for input in self.stages[name].inputs:
+                if input != DATASET:
+                    visit(input)
+            state[name] = 'done'
+            self.order.append(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def params(self, params=None):
+        return dict(self.defaults, **(params or {}))
+
+    def keys(self, dataset, params=None, content=False):
+
+        # Key of every node for this dataset and these parameters, from the
+        # files' signature or, with content, their content
+        return self.node_keys(dataset_key(dataset, content), params)
+
+    def node_keys(self, root, params=None):
+        params = self.params(params)
+        keys = {DATASET: root}
+        for name in self.order:
+            stage = self.stages[name]
+            keys[name] = _digest((stage.identity(),
+                    tuple((param, params[param]) for param in stage.params),
+                    tuple(keys[input] for input in stage.inputs)))
+        return keys
+
+
+def _digest(value):
+    return hashlib.sha256(repr(value).encode('utf8')).hexdigest()
+
+
+def dataset_key(dataset, content=False):
+
+    # Root of every key: the dataset, the working precision and the source
+    if content:
+        files = ('content', results.dataset_hash(dataset))
+    else:
+        files = ('signature', results.dataset_signature(dataset))
+    return _digest((files, np.dtype(precision.get_dtype()).name,
+            code_version()))
+
+
+def _content_root(dataset, signature_root, store):
+
+    # Content root of a dataset whose signature root is known. The store
+    # remembers the pair, so unchanged files are hashed once per store
+    # rather than once per process.
+    alias = _digest(('content of', signature_root))
+    root = store.get(alias)
+    if root is None:
+        root = dataset_key(dataset, content=True)
+        store.put(alias, root)
+    return root
+
+
+def code_version():
+
+    # Hash of the toolkit's source files, read once per process
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(SOURCE_DIR, '*.py'))):
+            digest.update(os.path.basename(path).encode('utf8'))
+            digest.update(results.file_hash(path).encode('utf8'))
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def nbytes(value):
+
+    # Approximate memory held by a node's output
+    if isinstance(value, np.memmap) and value.filename is not None:
+        return 0    # lives on disk
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, dict):
+        return sum(nbytes(key) + nbytes(value[key]) for key in value)
+    elif isinstance(value, (list, tuple)):
+        return sum(nbytes(item) for item in value)
+    elif hasattr(value, '__dict__'):
+        return nbytes(vars(value))
+    else:
+        return sys.getsizeof(value)
+
+
+class NodeCache:
+    """Least recently used node outputs by key, bounded by a memory budget."""
+
+    def __init__(self, budget=CACHE_BUDGET):
+        self.budget = budget
+        self.values = OrderedDict()
+        self.sizes = {}
+        self.total = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.values
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self.values:
+                return default
+            self.values.move_to_end(key)
+            return self.values[key]
+
+    def put(self, key, value):
+
+        # A node larger than the whole budget is never kept
+        size = nbytes(value)
+        if size > self.budget:
+            return
+        with self._lock:
+            if key in self.values:
+                del self.values[key]
+                self.total -= self.sizes.pop(key)
+            self.values[key] = value
+            self.sizes[key] = size
+            self.total += size
+            while self.total > self.budget:
+                old_key, _ = self.values.popitem(last=False)
+                self.total -= self.sizes.pop(old_key)
+
+
+def run(pipeline, dataset, params=None, targets=('result',), cache=None,
+        workers=None, store=None):
+
+    # Values of the target stages for one dataset. Stages whose key is in
+    # cache, or failing that in store, are reused without running anything
+    # upstream of them; the rest run on a thread pool as soon as their
+    # inputs are ready.
+    params = pipeline.params(params)
+    keys = pipeline.keys(dataset, params)
+    values = {DATASET: os.path.abspath(dataset)}
+
+    # Store keys need the files' content, hashed the first time the store
+    # is actually consulted
+    store_keys = {}
+
+    def store_key(name):
+        if not store_keys:
+            store_keys.update(pipeline.node_keys(_content_root(dataset,
+                    keys[DATASET], store), params))
+        return store_keys[name]
+
+    # Walk up from the targets, stopping at cached nodes
+    todo = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name in values or name in todo:
+            continue
+        value = _lookup(keys[name], cache, store, pipeline.stages[name],
+                store_key, name)
+        if value is not _MISSING:
+            values[name] = value
+            continue
+        todo.add(name)
+        stack.extend(pipeline.stages[name].inputs)
+
+    def call(stage):
+        return stage.func(*[values[input] for input in stage.inputs],
+                *[params[param] for param in stage.params])
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while todo or running:
+            for name in [name for name in pipeline.order if name in todo]:
+                stage = pipeline.stages[name]
+                if all(input in values for input in stage.inputs):
+                    todo.remove(name)
+                    running[pool.submit(call, stage)] = stage
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                values[stage.name] = future.result()
+                if cache is not None:
+                    cache.put(keys[stage.name], values[stage.name])
+                # Out-of-core handles name files on this machine only
+                if (store is not None and stage.store and not isinstance(
+                        values[stage.name], outofcore.ShotFiles)):
+                    store.put(store_key(stage.name), values[stage.name])
+
+    return dict((name, values[name]) for name in targets)
+
+
+def _lookup(key, cache, store, stage, store_key, name):
+
+    # Memory first; a stored output is kept in memory once loaded
+    value = _MISSING
+    if cache is not None:
+        value = cache.get(key, _MISSING)
+    if value is _MISSING and store is not None and stage.store:
+        value = store.get(store_key(name), _MISSING)
+        if value is not _MISSING and cache is not None:
+            cache.put(key, value)
+    return value
+
+
+def analyze(diagnostic, dataset, params=None, cache=None, store=None):
+    return run(get_pipeline(diagnostic), dataset, params, ('result',),
+            cache, store=store)['result']
+
+
+# Stage functions -------------------------------------------------------------
+# Small adapters between library calls; each returns one node's output
+
+def _second(pair):
+    return pair[1]
+
+
+def _parallel(raw):
+
+    # Worth the process pool: several CPUs and a large in-memory dataset.
+    # The parallel functions return exactly what the serial ones do.
+    return ((os.cpu_count() or 1) > 1
+            and not isinstance(raw, outofcore.ShotFiles)
+            and nbytes(raw) >= PARALLEL_MIN_BYTES)
+
+
+def _rpa_lowpass(raw, order, cutoff):
+    if _parallel(raw):
+        return rplt.butter_filter_parallel(raw, order, cutoff)
+    return rplt.butter_filter(raw, order, cutoff)
+
+
+def _rpa_align(lowpass, align):
+    if not align:
+        return lowpass
+    return rplt.align_shots(lowpass)
+
+
+def _rpa_spline(median, smooth, splinePts):
+    return rplt.spline_fit(median, smooth, splinePts, 'spline')
+
+
+def _rpa_ivdf(spline):
+    return rplt.ivdf(*spline)
+
+
+def _rpa_result(ivdf, stepV):
+    x, y = ivdf
+    result = {}
+    result['energy'] = x * stepV # eV
+    result['ivdf'] = y
+    result['values'] = {'IVDF peak energy': x[np.argmax(y)] * stepV}
+    return result
+
+
+def _dlp_data(dataset, budget):
+    if budget:  # shots are read in blocks when averaged
+        return lplt.get_shot_files(dataset, budget)
+    return lplt.get_data(dataset)
+
+
+def _dlp_lowpass(resampled, order, cutoff):
+    if _parallel(resampled):
+        return lplt.butter_filter_parallel(resampled, order, cutoff)
+    return lplt.butter_filter(resampled, order, cutoff)
+
+
+def _dlp_tof(density, tof):
+    if not tof:
+        return None
+    time, density = density    # lplt.density gives its time axis in us
+    return timeofflight.time_of_flight(density, time, time_unit='us')
+
+
+def _dlp_result(density, tof):
+    result = {'time': density[0], 'density': density[1]}
+    if tof is not None:
+        result['tof'] = tof
+    return result
+
+
+def _dbd_data(dataset, budget):
+    if budget:
+        return dlplt.get_shot_files(dataset, budget)
+    return dlplt.get_data(dataset)
+
+
+def _dbd_peaks(raw):
+    raw_I_vals, raw_bias_vals = raw
+    if _parallel(raw_I_vals):
+        return dlplt.get_peak_vals_parallel(raw_I_vals, raw_bias_vals)
+    return dlplt.get_peak_vals(raw_I_vals, raw_bias_vals)
+
+
+def _dbd_saturation(regression_data, tol):
+
+    sat_vals, outside_tols = dlplt.calculate_saturation_values(
+            regression_data, tol, 2)
+
+    # Warning handling
+    if outside_tols['sat_V_diff'] == True:
+        message = ('Average saturated voltage value '
+                + 'was used because the difference between left '
+                + 'and right saturated voltage values was outside the '
+                + 'tolerance of %.2E V.' % tol)
+        warnings.warn(message, RuntimeWarning)
+    if outside_tols['sat_I_diff'] == True:
+        message = ('Average saturated current value '
+                + 'was used because the difference between left '
+                + 'and right saturated voltage values was outside the '
+                + 'tolerance of %.2E uA.' % tol)
+        warnings.warn(message, RuntimeWarning)
+
+    return sat_vals
+
+
+def _dbd_plasma(sat_vals):
+    V_sat = sat_vals['V sat']
+    I_sat = sat_vals['I sat']
+    return dlplt.temperature(V_sat), dlplt.density(V_sat, I_sat)
+
+
+def _dbd_bootstrap(peaks, bias, bootstrap):
+    if not bootstrap:   # resample shots for confidence intervals
+        return None
+    return dlplt.bootstrap(peaks, bias)
+
+
+def _dbd_result(data, regression_data, sat_vals, plasma, intervals):
+
+    electron_temp, electron_number_density = plasma
+    values = {'Te': electron_temp, 'ne': electron_number_density,
+            'I sat': sat_vals['I sat'], 'V sat': sat_vals['V sat']}
+    if intervals is not None:
+        for key in intervals:
+            values[key + ' lower'] = intervals[key][0]
+            values[key + ' upper'] = intervals[key][1]
+
+    result = {}
+    result['data'] = data
+    result['regression'] = regression_data
+    result['Te'] = electron_temp
+    result['ne'] = electron_number_density
+    result['intervals'] = intervals
+    result['values'] = values
+    return result
+
+
+def _nfp_data(dataset, budget):
+    if budget:
+        return nplt.get_shot_files(dataset, budget)
+    return nplt.get_data(dataset)
+
+
+def _nfp_metrics(Idensity):
+
+    # Beam metrics for every probe in one reduction
+    probes, grid, profiles = beamprofile.stack_profiles(Idensity)
+    return probes, beamprofile.beam_metrics(grid, profiles)
+
+
+def _nfp_result(Idensity, metrics):
+    probes, metrics = metrics
+    values = {}
+    for row, id in enumerate(probes):
+        for key in metrics:
+            values[key + ' ' + id] = metrics[key][row]
+
+    result = {}
+    result['Idensity'] = Idensity
+    result['probes'] = probes
+    result['metrics'] = metrics
+    result['values'] = values
+    return result
+
+
+def _bias_lowpass(raw, order, cutoff):
+    if _parallel(raw):
+        return bplt.butter_filter_parallel(raw, order, cutoff)
+    return bplt.butter_filter(raw, order, cutoff)
+
+
+def _bias_result(Idensity):
+    return {'Idensity': Idensity}
+
+
+def _power_data(dataset, energy, stream):
+    if stream:  # bounded memory for long captures
+        return pplt.stream_data(dataset, energy)
+    return pplt.get_data(dataset, energy)
+
+
+def _power_pulses(raw_data, pulses):
+    if not pulses:
+        return None
+    pulse_data = pplt.find_pulses(raw_data)
+    return pulse_data, pplt.pulse_statistics(pulse_data)
+
+
+def _power_result(raw_data, summary, pulses, title):
+    result = {'data': raw_data, 'title': title}
+    result['values'] = dict(summary)
+    if pulses is not None:
+        pulse_data, stats = pulses
+        result['pulses'] = pulse_data
+        result['pulse statistics'] = stats
+        result['values']['pulse count'] = stats['count']
+        result['values']['mean pulse energy'] = stats['mean energy']
+        result['values']['std pulse energy'] = stats['std energy']
+    return result
+
+
+# Diagnostic graphs -----------------------------------------------------------
+
+PIPELINES = {}
+
+PIPELINES['RPA'] = Pipeline([
+    Stage('raw', rplt.get_data, [DATASET], store=False),
+    Stage('lowpass', _rpa_lowpass, ['raw'], ['order', 'cutoff']),
+    Stage('aligned', _rpa_align, ['lowpass'], ['align'], store=False),
+    Stage('slice', rplt.time_slice, ['aligned'], ['tts']),
+    Stage('median', rplt.median_filter, ['slice'], ['medWin']),
+    Stage('spline', _rpa_spline, ['median'], ['smooth', 'splinePts']),
+    Stage('ivdf', _rpa_ivdf, ['spline']),
+    Stage('result', _rpa_result, ['ivdf'], ['stepV'])],
+    {'order': 2, 'cutoff': 0.04, 'align': False, 'tts': 400, 'medWin': 9,
+    'smooth': 4, 'splinePts': 100, 'stepV': 2})
+
+PIPELINES['DLP'] = Pipeline([
+    Stage('raw', _dlp_data, [DATASET], ['budget'], store=False),
+    Stage('grid', lplt.common_grid, ['raw']),
+    Stage('resampled', lplt.resample, ['raw', 'grid'], store=False),
+    Stage('lowpass', _dlp_lowpass, ['resampled'], ['order', 'cutoff']),
+    Stage('average', lplt.butter_avg, ['lowpass'], ['align']),
+    Stage('density', lplt.density, ['average', 'grid'], ['time_unit']),
+    Stage('tof', _dlp_tof, ['density'], ['tof']),
+    Stage('result', _dlp_result, ['density', 'tof'])],
+    {'order': 2, 'cutoff': 0.05, 'align': False, 'tof': False,
+    'budget': None, 'time_unit': 'us'})
+
+PIPELINES['DBD'] = Pipeline([
+    Stage('raw', _dbd_data, [DATASET], ['budget'], store=False),
+    Stage('bias', _second, ['raw']),
+    Stage('peaks', _dbd_peaks, ['raw']),
+    Stage('average', dlplt.peak_avg, ['peaks', 'bias']),
+    Stage('data', dlplt.format_data, ['bias', 'average']),
+    Stage('sections', dlplt.split_data, ['data']),
+    Stage('regression', dlplt.calculate_linear_regressions, ['sections']),
+    Stage('saturation', _dbd_saturation, ['regression'], ['tol']),
+    Stage('plasma', _dbd_plasma, ['saturation']),
+    Stage('bootstrap', _dbd_bootstrap, ['peaks', 'bias'], ['bootstrap']),
+    Stage('result', _dbd_result,
+            ['data', 'regression', 'saturation', 'plasma', 'bootstrap'])],
+    {'tol': SATURATION_TOL, 'bootstrap': False, 'budget': None})
+
+PIPELINES['NFP'] = Pipeline([
+    Stage('raw', _nfp_data, [DATASET], ['budget'], store=False),
+    Stage('lowpass', nplt.butter_filter, ['raw'], ['order', 'cutoff']),
+    Stage('average', nplt.butter_avg, ['lowpass']),
+    Stage('max', nplt.get_max_vals, ['average']),
+    Stage('Idensity', nplt.Idensity, ['max']),
+    Stage('metrics', _nfp_metrics, ['Idensity']),
+    Stage('result', _nfp_result, ['Idensity', 'metrics'])],
+    {'order': 2, 'cutoff': 0.05, 'budget': None})
+
+PIPELINES['Bias'] = Pipeline([
+    Stage('raw', bplt.get_data, [DATASET], store=False),
+    Stage('lowpass', _bias_lowpass, ['raw'], ['order', 'cutoff']),
+    Stage('max', bplt.get_max_vals, ['lowpass']),
+    Stage('Idensity', bplt.Idensity, ['max']),
+    Stage('result', _bias_result, ['Idensity'])],
+    {'order': 2, 'cutoff': 0.05})
+
+PIPELINES['Power'] = Pipeline([
+    Stage('raw', _power_data, [DATASET], ['energy', 'stream'], store=False),
+    Stage('summary', pplt.summarize, ['raw']),
+    Stage('pulses', _power_pulses, ['raw'], ['pulses']),
+    Stage('result', _power_result, ['raw', 'summary', 'pulses'],
+            ['title'], store=False)],
+    {'energy': False, 'stream': False, 'pulses': False, 'title': ''})
+
+
+def get_pipeline(diagnostic):
+    if diagnostic not in PIPELINES:
+        raise ValueError("Diagnostic is not recognized: %r" % diagnostic)
+    return PIPELINES[diagnostic]
@@ -9,20 +9,41 @@ import sys
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from scipy import signal, integrate
 from scipy.signal import butter, lfilter
 from scipy.stats import maxwell
 from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
 import re
+import glob
+import json
+import shutil
+import hashlib
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 
-from PyQt5.QtWidgets import QCheckBox
+import precision
+import accel
+
+# Scope probe scaling factors
+VOLTAGE_SCALE = 100 # V/V
+CURRENT_SCALE = 2 # A/V
+
+# Rows read from each channel file per block when streaming
+CHUNK_SIZE = 1000000
+
+# Streamed trials are kept here, one directory per trial, and reused until
+# its capture files change
+STREAM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'export', 'stream')
+
+# Scope channel in a capture filename, e.g. 'T0001CH3.CSV'
+CHANNEL_PATTERN = re.compile('CH[1-4]')
 
 def get_channel_name(filename):
 
     # Pull out channel name identifier from filename.
-    channel_name_match = re.search('CH[1-4]',filename)
+    channel_name_match = CHANNEL_PATTERN.search(filename)
 
     if channel_name_match == None:
         raise ValueError("Filename format is incorrect: %r" % filename)
@@ -34,17 +55,26 @@ def get_channel_name(filename):
 
 
 def get_data(name, energy_bool):
+
+    # Read by path so the caller's working directory never changes
+    return read_files([os.path.join(name, file) for file in os.listdir(name)],
+            energy_bool)
+
+
+def read_files(files, energy_bool):
+
+    # Load one trial from the given capture files, e.g. from a catalog
+    # query. A trial without readable CH1 and CH3 captures gives {}.
     data = {}
-    os.chdir(name)
-    dir = os.listdir()
+    time_data = voltage_data = current_data = None
     try:
-        for file in dir:
+        for file in files:
             filename_length = len(file)
             file_extension = file[-4:filename_length]
             if (file_extension == '.csv'
                     or  file_extension == '.CSV'):
 
-                channel_name = get_channel_name(file)
+                channel_name = get_channel_name(os.path.basename(file))
                 all_data = pd.read_csv(file, header=None)
 
                 df1 = all_data.iloc[:,3]
@@ -53,26 +83,336 @@ def get_data(name, energy_bool):
                 # convert to numpy array
                 if channel_name == 'CH1':
                     time_data = df1.values
-                    voltage_data = df2.values
+                    voltage_data = precision.asarray(df2.values)
                 elif channel_name == 'CH3':
-                    current_data = df2.values
+                    current_data = precision.asarray(df2.values)
                 else:
                     pass
-                try:
-                    data['time'] = time_data
-                    data['voltage'] = voltage_data * 100 # V/V scaling factor
-                    data['current'] = current_data * 2 # A/V scaling factor
-                    data['power'] = data['voltage'] * data['current'] # W
-
-                    if energy_bool:
-                        data['energy'] = integrate.cumtrapz(data['power'], data['time'], initial=0) # J
-                except:
-                    pass
-    except:
-        pass
+    except (OSError, ValueError, IndexError):
+        return data
+
+    if time_data is None or voltage_data is None or current_data is None:
+        return data
+
+    data['time'] = time_data
+    data['voltage'] = voltage_data * VOLTAGE_SCALE
+    data['current'] = current_data * CURRENT_SCALE
+    data['power'] = data['voltage'] * data['current'] # W
+
+    if energy_bool:
+        data['energy'] = integrate.cumulative_trapezoid(data['power'],
+                data['time'], initial=0) # J
     return data
 
 
+def get_channel_files(name):
+
+    # Map channel names to their CSV files without changing directory
+    channel_files = {}
+    for file in os.listdir(name):
+        if file[-4:] == '.csv' or file[-4:] == '.CSV':
+            channel_files[get_channel_name(file)] = os.path.join(name, file)
+
+    if 'CH1' not in channel_files or 'CH3' not in channel_files:
+        raise ValueError("CH1 and CH3 files are required: %r" % name)
+
+    return channel_files
+
+
+def count_rows(file, block_size=2**20):
+
+    # Count lines in blocks so the row count costs no more memory than
+    # one block, however long the capture is
+    rows = 0
+    last = b'\n'
+    with open(file, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            rows += block.count(b'\n')
+            last = block[-1:]
+            block = f.read(block_size)
+    if last != b'\n':
+        rows += 1
+
+    return rows
+
+
+def stream_path(name, energy_bool):
+
+    # Cache directory of one trial: a hash of its path, then a hash of its
+    # capture files' sizes and modification times and the compute type
+    channel_files = get_channel_files(name)
+    trial = hashlib.sha256(os.path.abspath(name).encode('utf8')).hexdigest()
+    signature = [np.dtype(precision.get_dtype()).name, bool(energy_bool)]
+    for channel in ('CH1', 'CH3'):
+        stat = os.stat(channel_files[channel])
+        signature.append((stat.st_size, stat.st_mtime_ns))
+    version = hashlib.sha256(repr(signature).encode('utf8')).hexdigest()
+    return os.path.join(STREAM_DIR, '%s-%s' % (trial[:16], version[:16]))
+
+
+def stream_data(name, energy_bool, out_dir=None, chunk_size=CHUNK_SIZE):
+
+    # Same result as get_data, computed block by block into memory-mapped
+    # .npy files so memory use is bounded by chunk_size, not record length.
+    # Without out_dir the files go to the trial's directory under
+    # STREAM_DIR, where an unchanged trial is reused rather than streamed
+    # again and the copies of older versions of it are removed.
+    channel_files = get_channel_files(name)
+
+    # Time and energy stay float64 whatever the compute type
+    dtypes = {'time': np.float64,
+            'voltage': precision.get_dtype(),
+            'current': precision.get_dtype(),
+            'power': precision.get_dtype()}
+    if energy_bool:
+        dtypes['energy'] = np.float64
+
+    if out_dir is None:
+        out_dir = stream_path(name, energy_bool)
+        trial = os.path.basename(out_dir).split('-')[0]
+        for old_dir in glob.glob(os.path.join(STREAM_DIR, trial + '-*')):
+            if old_dir != out_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(os.path.join(out_dir, 'complete.json')):
+            return dict((key, np.load(os.path.join(out_dir, key + '.npy'),
+                    mmap_mode='r')) for key in dtypes)
+    os.makedirs(out_dir, exist_ok=True)
+
+    length = min(count_rows(channel_files['CH1']),
+            count_rows(channel_files['CH3']))
+    data = {}
+    for key in dtypes:
+        data[key] = np.lib.format.open_memmap(
+                os.path.join(out_dir, key + '.npy'), mode='w+',
+                dtype=dtypes[key], shape=(length,))
+
+    ch1_reader = pd.read_csv(channel_files['CH1'], header=None,
+            usecols=[3, 4], chunksize=chunk_size)
+    ch3_reader = pd.read_csv(channel_files['CH3'], header=None,
+            usecols=[3, 4], chunksize=chunk_size)
+
+    # Last sample and running energy carried across block boundaries
+    prev_time = None
+    prev_power = None
+    energy_total = 0.0
+
+    start = 0
+    for ch1, ch3 in zip(ch1_reader, ch3_reader):
+        stop = min(start + len(ch1), start + len(ch3), length)
+        n = stop - start
+        if n <= 0:
+            break
+
+        time_data = ch1.iloc[:n, 0].values
+        voltage_data = (precision.asarray(ch1.iloc[:n, 1].values)
+                * VOLTAGE_SCALE)
+        current_data = (precision.asarray(ch3.iloc[:n, 1].values)
+                * CURRENT_SCALE)
+        power_data = voltage_data * current_data
+
+        data['time'][start:stop] = time_data
+        data['voltage'][start:stop] = voltage_data
+        data['current'][start:stop] = current_data
+        data['power'][start:stop] = power_data
+
+        if energy_bool:
+            # Trapezoids are summed in the same order as
+            # cumulative_trapezoid, with the running total prepended, so
+            # every value matches bit for bit
+            if prev_time is None:
+                t = time_data
+                p = power_data
+            else:
+                t = np.concatenate(([prev_time], time_data))
+                p = np.concatenate(([prev_power], power_data))
+            trapezoids = np.diff(t) * (p[1:] + p[:-1]) / 2.0
+            energy = np.cumsum(np.concatenate(([energy_total], trapezoids)))
+            if prev_time is not None:
+                energy = energy[1:]
+            data['energy'][start:stop] = energy
+            energy_total = energy[-1]
+
+        prev_time = time_data[-1]
+        prev_power = power_data[-1]
+        start = stop
+
+    for key in data:
+        data[key].flush()
+    with open(os.path.join(out_dir, 'complete.json'), 'w') as f:
+        json.dump({'length': length}, f)
+
+    return data
+
+
+def summarize(data):
+
+    if 'power' not in data:
+        raise ValueError('CH1 and CH3 data could not be read')
+    time_data = data['time']
+    power_data = data['power']
+    abs_power = np.absolute(power_data)
+
+    # Pulse duration is the full width of |P| at half its maximum
+    above_half = np.flatnonzero(abs_power >= abs_power.max() / 2)
+    pulse_duration = time_data[above_half[-1]] - time_data[above_half[0]]
+
+    if 'energy' in data:
+        total_energy = data['energy'][-1]
+    else:
+        total_energy = np.sum(np.diff(time_data)
+                * (power_data[1:] + power_data[:-1]) / 2.0)
+
+    summary = {}
+    summary['peak voltage'] = np.max(np.absolute(data['voltage'])) # V
+    summary['peak current'] = np.max(np.absolute(data['current'])) # A
+    summary['peak power'] = abs_power.max() # W
+    summary['total energy'] = total_energy # J
+    summary['pulse duration'] = pulse_duration # s
+
+    return summary
+
+
+def batch_summary(name, workers=None, sort_by=None, export=None, cache=None,
+        store=None):
+
+    # Every subdirectory of name is one trial holding CH1/CH3 captures.
+    # Trials go through the Power pipeline, so summaries already in cache
+    # or store are reused and new ones are kept there; threads share the
+    # cache. pipeline imports this module, so it is imported here.
+    import pipeline
+
+    graph = pipeline.get_pipeline('Power')
+
+    def summarize_trial(path):
+        try:
+            return pipeline.run(graph, path, None, ('summary',), cache,
+                    store=store)['summary']
+        except ValueError:
+            return None
+
+    name = os.path.abspath(name)
+    trials = sorted(folder for folder in os.listdir(name)
+            if os.path.isdir(os.path.join(name, folder)))
+    paths = [os.path.join(name, trial) for trial in trials]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(paths)))
+
+    if workers == 1:
+        summaries = [summarize_trial(path) for path in paths]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            summaries = list(pool.map(summarize_trial, paths))
+
+    rows = {}
+    for trial, summary in zip(trials, summaries):
+        if summary is None:
+            message = ("Trial skipped because CH1 and CH3 data could " +
+                    "not be read: %r" % trial)
+            warnings.warn(message, RuntimeWarning)
+        else:
+            rows[trial] = summary
+
+    table = pd.DataFrame.from_dict(rows, orient='index',
+            columns=['peak voltage', 'peak current', 'peak power',
+                'total energy', 'pulse duration'])
+    table.index.name = 'trial'
+
+    if sort_by is not None:
+        table = table.sort_values(sort_by, ascending=False)
+    if export is not None:
+        table.to_csv(export)
+
+    return table
+
+
+def find_pulses(data, threshold=0.1, min_gap=1, min_width=1):
+
+    # Pulses are runs of samples with |P| at or above threshold * max |P|.
+    # Runs closer than min_gap samples are merged so ringing inside one
+    # pulse is not split, and runs shorter than min_width are dropped.
+    time_data = np.asarray(data['time'])
+    power_data = np.asarray(data['power'])
+    abs_power = np.absolute(power_data)
+    length = len(abs_power)
+
+    active = abs_power >= threshold * abs_power.max()
+    starts, ends = accel.pulse_edges(active, min_gap, min_width)
+    widths = ends - starts
+
+    # Trapezoid areas, padded so every boundary index is in range; the
+    # interleaved boundaries make reduceat sum each pulse and each gap
+    trapezoids = np.zeros(length)
+    trapezoids[:-1] = (np.diff(time_data)
+            * (power_data[1:] + power_data[:-1]) / 2.0)
+    bounds = np.column_stack((starts, ends - 1)).ravel()
+    if len(bounds):
+        energy = np.add.reduceat(trapezoids, bounds)[::2]
+        # reduceat returns the element itself for an empty range
+        energy[widths == 1] = 0.0
+    else:
+        energy = np.zeros(0)
+
+    padded_power = np.append(abs_power, 0.0)
+    bounds = np.column_stack((starts, ends)).ravel()
+    if len(bounds):
+        peak_power = np.maximum.reduceat(padded_power, bounds)[::2]
+    else:
+        peak_power = np.zeros(0)
+
+    # Locate each peak by gathering the pulse samples into one flat
+    # array and taking the first sample per pulse equal to its peak
+    pulse_labels = np.repeat(np.arange(len(starts)), widths)
+    offsets = np.repeat(starts - (np.cumsum(widths) - widths), widths)
+    sample_index = np.arange(len(pulse_labels)) + offsets
+    matches = np.flatnonzero(
+            abs_power[sample_index] == peak_power[pulse_labels])
+    _, first = np.unique(pulse_labels[matches], return_index=True)
+    peak_index = sample_index[matches[first]]
+
+    pulses = {}
+    pulses['start index'] = starts
+    pulses['end index'] = ends
+    pulses['start'] = time_data[starts] # s
+    pulses['end'] = time_data[ends - 1] # s
+    pulses['duration'] = pulses['end'] - pulses['start'] # s
+    pulses['peak time'] = time_data[peak_index] # s
+    pulses['peak power'] = peak_power # W
+    pulses['energy'] = energy # J
+
+    return pulses
+
+
+def pulse_statistics(pulses):
+
+    # Pulse fields need one pulse and period fields two; fields without
+    # enough pulses are NaN
+    count = len(pulses['start'])
+
+    statistics = {}
+    statistics['count'] = count
+    for field in ('mean energy', 'std energy', 'mean peak power',
+            'std peak power', 'mean duration', 'mean period',
+            'period jitter', 'repetition rate'):
+        statistics[field] = np.nan
+
+    if count >= 1:
+        statistics['mean energy'] = np.mean(pulses['energy']) # J
+        statistics['std energy'] = np.std(pulses['energy']) # J
+        statistics['mean peak power'] = np.mean(pulses['peak power']) # W
+        statistics['std peak power'] = np.std(pulses['peak power']) # W
+        statistics['mean duration'] = np.mean(pulses['duration']) # s
+
+    if count >= 2:
+        period = np.diff(pulses['start'])
+        statistics['mean period'] = np.mean(period) # s
+        statistics['period jitter'] = np.std(period) # s
+        statistics['repetition rate'] = 1 / np.mean(period) # Hz
+
+    return statistics
+
 
 if __name__ == 'main':
     print('Running pplt')
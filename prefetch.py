@@ -0,0 +1,197 @@
+"""Prefetch Module
+
+This module contains the functions used to load and filter the datasets an
+analyst is likely to open next while the current plot is on screen. Likely
+next means the sibling directories following (and just before) the current
+one and the recently opened directories. Prefetching runs the first stages
+of a diagnostic's pipeline in one worker process at low OS priority, so it
+never competes with the GUI, and every stage output is kept in a least
+recently used pipeline.NodeCache bounded by a memory budget.
+
+Stage outputs are keyed by pipeline.Pipeline.keys, which covers the dataset
+files, the parameters each stage reads and the working precision, so
+changing a parameter never returns stale data and only reruns the stages
+that depend on it. The worker hashes the candidate datasets itself, and
+both it and the GUI read and write the same store.ResultStore, so outputs
+stored by any earlier run are reused here too.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pipeline
+import precision
+import store
+
+PREFETCH_BUDGET = 512 * 2**20 # bytes
+NUM_SIBLINGS = 2    # following sibling directories to prefetch
+NUM_RECENT = 4      # recently opened directories to prefetch
+PREFETCH_NICE = 10
+
+# Windows priority class for the worker, from winbase.h
+BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+
+# Stages the worker runs ahead; everything after these is cheap
+PREFETCH_TARGETS = {'RPA': ('lowpass',), 'DLP': ('lowpass',),
+                    'DBD': ('peaks', 'bias'), 'NFP': ('lowpass',),
+                    'Bias': ('lowpass',), 'Power': ('raw',)}
+
+
+def _lower_priority():
+    try:
+        os.nice(PREFETCH_NICE)
+    except AttributeError:
+        # Windows has no nice
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetPriorityClass(kernel32.GetCurrentProcess(),
+                BELOW_NORMAL_PRIORITY_CLASS)
+
+
+def _prefetch(diagnostic, name, params, dtype, directory):
+
+    # Keys and values of the prefetch targets of one dataset
+    precision.set_dtype(dtype)
+    graph = pipeline.get_pipeline(diagnostic)
+    targets = PREFETCH_TARGETS[diagnostic]
+    keys = graph.keys(name, params)
+    result_store = None if directory is None else store.ResultStore(directory)
+    values = pipeline.run(graph, name, params, targets, store=result_store)
+    return dict((keys[target], values[target]) for target in targets)
+
+
+class Prefetcher:
+    """Pipeline stage cache filled ahead of the analyst by a worker process."""
+
+    def __init__(self, budget=PREFETCH_BUDGET, num_siblings=NUM_SIBLINGS,
+            num_recent=NUM_RECENT, result_store=None):
+
+        self.num_siblings = num_siblings
+        self.num_recent = num_recent
+        self.cache = pipeline.NodeCache(budget)
+        self.store = result_store
+        self.pending = {}
+        self.prefetched = {}    # node keys of each finished prefetch
+        self.recent = []
+        self._lock = threading.RLock()
+        self._pool = None
+
+    def key(self, diagnostic, name, params):
+        return (diagnostic, os.path.abspath(name),
+                tuple(sorted(params.items())), precision.get_dtype())
+
+    def wait(self, diagnostic, name, params):
+
+        # Called before analyzing a dataset with self.cache: a worker that
+        # is prefetching it right now is waited for, and prefetching it
+        # later is cancelled
+        name = os.path.abspath(name)
+        key = self.key(diagnostic, name, params)
+        self._visit(name)
+
+        with self._lock:
+            future = self.pending.get(key)
+        if future is not None and future.running():
+            # Its callback may not have stored the values yet
+            self._finish(key, future)
+        elif future is not None:
+            future.cancel()
+
+    def run(self, diagnostic, name, params, targets=('result',)):
+
+        # Target stage values for a dataset. Anything the worker has not
+        # cached yet runs here, and stages downstream of a cached one run
+        # alone.
+        self.wait(diagnostic, name, params)
+        return pipeline.run(pipeline.get_pipeline(diagnostic),
+                os.path.abspath(name), params, targets, self.cache,
+                store=self.store)
+
+    def candidates(self, name):
+
+        # Next sibling directories first, then the previous one, then the
+        # most recently opened directories
+        name = os.path.abspath(name)
+        parent = os.path.dirname(name)
+        try:
+            siblings = sorted(entry.path for entry in os.scandir(parent)
+                    if entry.is_dir() and not entry.name.startswith('.'))
+        except OSError:
+            siblings = []
+
+        names = []
+        if name in siblings:
+            index = siblings.index(name)
+            names += siblings[index+1:index+1+self.num_siblings]
+            names += siblings[max(index-1, 0):index]
+        names += [recent for recent in self.recent[:self.num_recent]
+                if os.path.isdir(recent)]
+
+        candidates = []
+        for candidate in names:
+            if candidate != name and candidate not in candidates:
+                candidates.append(candidate)
+        return candidates
+
+    def schedule(self, diagnostic, name, params):
+
+        # Queue the likely next datasets with the current parameters; work
+        # queued for an earlier plot and not started yet is dropped
+        keys = []
+        for candidate in self.candidates(name):
+            keys.append((self.key(diagnostic, candidate, params), candidate))
+
+        wanted = set(key for key, candidate in keys)
+        with self._lock:
+            for key in list(self.pending):
+                if key not in wanted:
+                    self.pending[key].cancel()
+
+            for key, candidate in keys:
+                if key in self.pending or (key in self.prefetched and all(
+                        node_key in self.cache
+                        for node_key in self.prefetched[key])):
+                    continue
+                directory = None
+                if self.store is not None:
+                    directory = self.store.directory
+                future = self._executor().submit(_prefetch, diagnostic,
+                        candidate, params, precision.get_dtype(), directory)
+                self.pending[key] = future
+                future.add_done_callback(partial(self._finish, key))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1,
+                    initializer=_lower_priority)
+        return self._pool
+
+    def _finish(self, key, future):
+
+        # Waits for the worker; a failed prefetch is run again, and its
+        # error reported, by whoever asks for the dataset
+        failed = future.cancelled() or future.exception() is not None
+        with self._lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+            if failed:
+                return
+            values = future.result()
+            for node_key in values:
+                self.cache.put(node_key, values[node_key])
+            self.prefetched[key] = list(values)
+
+    def _visit(self, name):
+        if name in self.recent:
+            self.recent.remove(name)
+        self.recent.insert(0, name)
+        del self.recent[self.num_recent+1:]
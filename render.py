@@ -0,0 +1,372 @@
+"""Render Module
+
+This module contains the functions used to build the RPA, Langmuir, DBD,
+Nude Faraday, bias sweep and input power figures, and to render them off
+screen for whole campaigns at once. Each diagnostic's api function reduces
+its data to a result object and its draw function lays that result out on a
+matplotlib Figure through the object-oriented API only. Nothing here touches
+pyplot or rcParams, so figures can be built in any thread or process;
+PlotWindow draws the same figures on screen.
+
+A campaign renders in a process pool, one dataset per task:
+
+    python render.py DBD path/to/campaign --format png svg
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import numpy as np
+from scipy.interpolate import splrep, BSpline
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.patches as mpatches
+from cycler import cycler
+
+import api
+import pipeline
+import store
+
+# Figure size of each diagnostic in inches
+FIGURE_SIZE = {'RPA': (9, 5), 'DLP': (6.4, 4.8), 'DBD': (16, 9),
+               'NFP': (6.4, 4.8), 'Bias': (6.4, 4.8), 'Power': (9, 5)}
+DPI = 150
+FORMATS = ('png',)
+
+NFP_LABELS = {'L': 'Left', 'R': 'Right', 'D': 'Double', 'T': 'Triple'}
+NFP_COLORS = ['k', 'b', 'r', 'm']
+
+
+def _grid(ax):
+    ax.minorticks_on()
+    ax.grid(which='major', alpha=0.5)
+    ax.grid(which='minor', alpha=0.2)
+
+
+# Retarding potential analyzer ------------------------------------------------
+
+def draw_rpa(figure, result):
+    ax = figure.add_subplot()
+    ax.plot(result.energy, result.ivdf, '+-')
+    ax.set_title('Ion Velocity Distribution')
+    ax.set_xlabel('Energy (eV)')
+    ax.set_ylabel('I.V.D.F (Arb. units)')
+    _grid(ax)
+    return ax
+
+
+# Langmuir probe density and time of flight -----------------------------------
+
+def draw_dlp(figure, result):
+    ax = figure.add_subplot()
+    for key in result.density.keys():
+        ax.plot(result.time, result.density[key], label=key)
+    ax.legend(prop={'size': 7})
+
+    if result.tof is not None:
+        # Cross-correlation delays of every probe pair; the box lists
+        # neighbouring probes
+        flight = result.tof
+        probes = list(result.density.keys())
+        txt = ''
+        for index, pair in enumerate(flight['pairs']):
+            if probes.index(pair[1]) != probes.index(pair[0]) + 1:
+                continue
+            txt += (pair[0] + r' $\rightarrow$ ' + pair[1] + ': '
+                    + '%.2f' % flight['delay'][index] + r' $\mu$s')
+            if np.isfinite(flight['velocity'][index]):
+                txt += ', %.3E m/s' % flight['velocity'][index]
+            txt += '\n'
+        props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+        ax.text(0.02, 0.98, txt.rstrip(), size=8, verticalalignment='top',
+                bbox=props, transform=ax.transAxes)
+
+    ax.set_xlabel(r'Time ($\mu$s)')
+    ax.set_ylabel('$n_{e}$ ($m^{-3}$)')
+    ax.set_title('Plasma Density')
+    _grid(ax)
+    return ax
+
+
+# Langmuir probe bias sweep (DBD) ---------------------------------------------
+
+def _regression_label(name, fit):
+
+    # e.g. '$I_{ion sat} = $0.1234$\cdot V -$0.5678'
+    label = name + '%.4f' % round(fit['slope'], 4)
+    intercept = '%.4f' % round(np.absolute(fit['intercept']), 4)
+    if fit['intercept'] < 0:
+        label += r'$\cdot V -$' + intercept
+    elif round(fit['intercept'], 4) == 0.0000:
+        label += r'$\cdot V$'
+    else:
+        label += r'$\cdot V +$' + intercept
+    return label
+
+
+def draw_dbd(figure, result):
+    ax = figure.add_subplot()
+    data = result.data
+    regression_data = result.regression
+    x = np.linspace(data[0,0], data[-1,0], num=50)
+
+    v_fine = np.linspace(data[0,0], data[-1,0], 300)
+    t, c, k = splrep(data[:,0], data[:,1], s=0, k=3)
+    I_func = BSpline(t, c, k, extrapolate=False)
+    ax.plot(v_fine, I_func(v_fine), color='black', linestyle='dashed',
+            linewidth=2)
+    ax.scatter(data[:,0], data[:,1], color='black', s=10*(2**2))
+
+    fits = [('i_sat', 'red', r'$I_{ion \,\,\, sat} = $'),
+            ('e_ret', 'magenta', r'$I_{e \,\,\, ret} = $'),
+            ('e_sat', 'green', r'$I_{e \,\,\, sat} = $')]
+    labels = []
+    for key, color, name in fits:
+        fit = regression_data[key]
+        ax.plot(x, fit['slope']*x + fit['intercept'], color=color,
+                linewidth=2.0)
+        labels.append(_regression_label(name, fit))
+
+    # Construct electron temp and number density output
+    T_str = (r'$T_e$ $\approx$ ' + str('%.2f' % round(result.Te, 2))
+            + ' eV')
+    n_e_str = (r'$n_e$ $\approx$ '
+            + '%.2E' % Decimal(str(result.ne)) + r' $\mathrm{m}^{-3}$')
+
+    if result.intervals is not None:
+        T_lo, T_hi = result.intervals['Te']
+        n_e_lo, n_e_hi = result.intervals['ne']
+        T_str += (' [' + str('%.2f' % T_lo) + ', ' + str('%.2f' % T_hi)
+                + ']')
+        n_e_str += (' [' + '%.2E' % Decimal(str(n_e_lo)) + ', '
+                + '%.2E' % Decimal(str(n_e_hi)) + ']')
+
+    # Construct legend
+    h = []
+    h.append(mpatches.Patch(color='black', label='Measured Data'))
+    h.append(mpatches.Patch(color='red', label='Ion Saturation Regression'))
+    h.append(mpatches.Patch(color='magenta',
+            label='Electron Retarding Regression'))
+    h.append(mpatches.Patch(color='green',
+            label='Electron Saturation Regression'))
+    ax.legend(loc=2, borderaxespad=0, handles=h, prop={'size': 18})
+
+    txt = '\n'.join(labels + [T_str, n_e_str])
+    props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+    ax.text(0.55, 0.25, txt, size=18, verticalalignment="top",
+            horizontalalignment="left", multialignment="left", bbox=props,
+            transform=ax.transAxes)
+
+    ax.set_xlabel('Voltage (V)', fontsize=20)
+    ax.set_ylabel(r'Peak Current ($\mu$A)', fontsize=20)
+    ax.set_title('Bias Voltage vs Peak Current', fontsize=22)
+    ax.tick_params(which='both', labelsize=20)
+    _grid(ax)
+    return ax
+
+
+# Nude Faraday probe ----------------------------------------------------------
+
+def draw_nfp(figure, result):
+    ax = figure.add_subplot()
+    ax.set_prop_cycle(cycler('color', NFP_COLORS))
+
+    for id in result.Idensity.keys():
+        ax.plot(*result.Idensity[id], 'o', linewidth=4,
+                label=NFP_LABELS.get(id, 'Other'))
+    ax.legend(prop={'size': 7})
+
+    metrics = result.metrics
+    txt = ''
+    for row, id in enumerate(result.probes):
+        txt += (id + r': $I_b$ = ' + '%.3E' % metrics['beam current'][row]
+                + r' A, $\theta_{div}$ = '
+                + '%.1f' % metrics['divergence'][row]
+                + r'$^\circ$, $r_c$ = ' + '%.2f' % metrics['centroid'][row]
+                + ' cm\n')
+    props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+    ax.text(0.02, 0.98, txt.rstrip(), size=8, verticalalignment='top',
+            bbox=props, transform=ax.transAxes)
+
+    ax.set_xlabel(r'Radial Position (cm)')
+    ax.set_ylabel(r'$J$ $\left(\mathrm{A} \, \mathrm{m}^{-2}\right)$')
+    ax.set_title(r'Plasma Current Density at $V_{bias} = -30 \, V$')
+    _grid(ax)
+    return ax
+
+
+# Faraday probe bias sweep ----------------------------------------------------
+
+def draw_bias(figure, result):
+    ax = figure.add_subplot()
+    ax.plot(*zip(*sorted(result.Idensity.items())), 'ko')
+    ax.set_xlabel(r'Bias Potential (V)')
+    ax.set_ylabel(r'$J$ $\left(\mathrm{A} \, \mathrm{m}^{-2} \right)$')
+    ax.set_title(r'Plasma Current Density at $r = 0$')
+    _grid(ax)
+    return ax
+
+
+# Input power -----------------------------------------------------------------
+
+def draw_power(figure, result):
+    ax = figure.add_subplot()
+    raw_data = result.data
+
+    time_ns = raw_data['time'] * 1e9
+    voltage_kV = raw_data['voltage'] * 1e-3
+    current_A = raw_data['current']
+    power_kW = raw_data['power'] * 1e-3
+
+    ax.plot(time_ns, voltage_kV*1e1, 'b-')
+    ax.plot(time_ns, current_A, 'g-')
+    ax.plot(time_ns, power_kW, 'k-')
+    ax.set_title(r'Power Plot - ' + result.title)
+    ax.set_xlabel(r'Time (ns)')
+
+    # Construct legend
+    h = []
+    h.append(mpatches.Patch(color='blue', label='Voltage'))
+    h.append(mpatches.Patch(color='green', label='Current'))
+    h.append(mpatches.Patch(color='black', label='Power'))
+
+    if 'energy' in raw_data:
+        energy_mJ = raw_data['energy'] * 1e3
+        ax.plot(time_ns, energy_mJ*1e1, 'm-')
+        h.append(mpatches.Patch(color='magenta', label='Energy'))
+        ax.set_ylabel(r'Voltage $\left(10^{-1} \, \mathrm{kV}\right)$'
+                + r' / Current (A) / Power (kW) / Energy $\left(10^{-1}'
+                + r' \, \mathrm{mJ}\right)$')
+    else:
+        ax.set_ylabel(
+            r'Voltage ($10^{-1} \, \mathrm{kV}$) / Current (A) / Power (kW)')
+
+    if result.pulses is not None:
+        pulse_data = result.pulses
+        stats = result.pulse_statistics
+        ax.plot(pulse_data['peak time'] * 1e9,
+                pulse_data['peak power'] * 1e-3, 'rx')
+
+        txt = ('Pulses: ' + str(stats['count'])
+                + '\nMean energy: ' + '%.3E' % stats['mean energy'] + ' J'
+                + '\nStd energy: ' + '%.3E' % stats['std energy'] + ' J')
+        if stats['count'] > 1:
+            txt += ('\nRep. rate: ' + '%.3E' % stats['repetition rate']
+                    + ' Hz')
+        props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+        ax.text(0.02, 0.98, txt, verticalalignment='top', bbox=props,
+                transform=ax.transAxes)
+
+    ax.legend(loc='best', borderaxespad=0, handles=h)
+    _grid(ax)
+    return ax
+
+
+DRAW = {'RPA': draw_rpa, 'DLP': draw_dlp, 'DBD': draw_dbd, 'NFP': draw_nfp,
+        'Bias': draw_bias, 'Power': draw_power}
+
+
+# Off-screen rendering --------------------------------------------------------
+
+def build_figure(diagnostic, result):
+
+    # A new off-screen figure, not registered with pyplot
+    figure = Figure(figsize=FIGURE_SIZE[diagnostic])
+    FigureCanvasAgg(figure)
+    DRAW[diagnostic](figure, result)
+    return figure
+
+
+def render(diagnostic, name, out_file, params=None, formats=FORMATS,
+        dpi=DPI, store_dir=None):
+
+    # Analyze a dataset and save its figure as out_file plus each format's
+    # extension; returns the written paths. Campaign-wide parameters such as
+    # budget only reach the diagnostics that read them.
+    defaults = pipeline.get_pipeline(diagnostic).defaults
+    params = dict((key, value) for key, value in (params or {}).items()
+            if key in defaults)
+    result_store = None
+    if store_dir is not None:   # reuse and keep stage outputs
+        result_store = store.ResultStore(store_dir, store.STORE_BUDGET)
+    result = api.analyze(diagnostic, name, params, store=result_store)
+    figure = build_figure(diagnostic, result)
+
+    paths = []
+    for format in formats:
+        path = out_file + '.' + format
+        figure.savefig(path, format=format, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+def _render_task(diagnostic, name, out_file, params, formats, dpi,
+        store_dir):
+    try:
+        return render(diagnostic, name, out_file, params, formats, dpi,
+                store_dir)
+    except Exception as error:
+        return error
+
+
+def render_campaign(diagnostic, datasets, out_dir, params=None,
+        formats=FORMATS, dpi=DPI, workers=None, store_dir=None):
+
+    # Render every dataset (a campaign directory, whose subdirectories are
+    # the datasets, or a list of dataset paths) in a process pool. Returns
+    # the written paths of each dataset, or the exception it raised.
+    if isinstance(datasets, str):
+        root = os.path.abspath(datasets)
+        datasets = sorted(entry.path for entry in os.scandir(root)
+                if entry.is_dir() and not entry.name.startswith('.'))
+    datasets = [os.path.abspath(name) for name in datasets]
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for name in datasets:
+            out_file = os.path.join(out_dir, os.path.basename(name)
+                    + '_' + diagnostic)
+            futures[name] = pool.submit(_render_task, diagnostic, name,
+                    out_file, params, formats, dpi, store_dir)
+        for name in datasets:
+            rendered[name] = futures[name].result()
+
+    return rendered
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Render a campaign of figures off screen')
+    parser.add_argument('diagnostic', choices=sorted(DRAW))
+    parser.add_argument('campaign', help='directory of dataset directories')
+    parser.add_argument('--out', default=os.path.join('export', 'figures'))
+    parser.add_argument('--format', nargs='+', default=list(FORMATS))
+    parser.add_argument('--dpi', type=int, default=DPI)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--budget', type=float, default=None,
+            help='memory budget in MB for averaging DLP, DBD and NFP shots')
+    parser.add_argument('--store', nargs='?', const=store.STORE_DIR,
+            default=None, help='reuse stage outputs stored in this directory')
+    parser.add_argument('--align', action='store_true',
+            help='remove trigger jitter from RPA and DLP shots')
+    args = parser.parse_args()
+
+    params = {}
+    if args.budget is not None:
+        params['budget'] = int(args.budget * 2**20) # bytes
+    if args.align:
+        params['align'] = True
+    rendered = render_campaign(args.diagnostic, args.campaign, args.out,
+            params, args.format, args.dpi, args.workers, args.store)
+    for name in rendered:
+        if isinstance(rendered[name], Exception):
+            print(name + ': ' + repr(rendered[name]))
+        else:
+            print(name + ': ' + ', '.join(rendered[name]))
@@ -0,0 +1,70 @@
+"""Resample Module
+
+This module contains the functions used to put shots recorded with
+different lengths, start times or sample rates onto one shared time grid,
+so they can be stacked into a single contiguous array and filtered and
+averaged together. Every shot is linearly interpolated from its own time
+column in one vectorized pass: the time columns are concatenated with a row
+offset added to each, which keeps the whole array sorted, so one
+searchsorted call places every grid point of every shot.
+
+Grid points outside a shot's time range take the shot's first or last value,
+as with np.interp.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import numpy as np
+
+
+def resample_rows(times, values, grid):
+
+    # times and values are sequences of 1-D arrays, one pair per shot, whose
+    # lengths may differ; returns a (shots, len(grid)) array. Shots already
+    # sampled at the grid times are copied without interpolating.
+    grid = np.asarray(grid, dtype=np.float64)
+    if len(times) == 0:
+        return np.empty((0, len(grid)))
+    dtype = np.result_type(*[np.asarray(row).dtype for row in values])
+    stack = np.empty((len(times), len(grid)), dtype=dtype)
+
+    on_grid = np.array([len(t) == len(grid) and np.array_equal(t, grid)
+            for t in times])
+    for row in np.flatnonzero(on_grid):
+        stack[row] = values[row]
+    rows = np.flatnonzero(~on_grid)
+    if len(rows) == 0:
+        return stack
+
+    lengths = np.array([len(times[row]) for row in rows])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    flat_t = np.concatenate([np.asarray(times[row], dtype=np.float64)
+            for row in rows])
+    flat_v = np.concatenate([np.asarray(values[row]) for row in rows])
+
+    # Times in grid steps from the earliest time, with each shot shifted
+    # past the last by more than the whole range
+    dt = grid[1] - grid[0] if len(grid) > 1 else 1.0
+    origin = min(flat_t.min(), grid[0])
+    width = (max(flat_t.max(), grid[-1]) - origin) / dt + 2
+    offset = width * np.repeat(np.arange(len(rows)), lengths)
+    flat_u = (flat_t - origin) / dt + offset
+    query = ((grid - origin) / dt)[None, :] + width * np.arange(
+            len(rows))[:, None]
+
+    # Left neighbour of every query within its own shot, then clamp the
+    # weight so points outside the shot hold its edge values
+    left = np.searchsorted(flat_u, query, side='right') - 1
+    first = starts[:, None]
+    last = (starts + lengths - 1)[:, None]
+    left = np.clip(left, first, np.maximum(last - 1, first))
+    right = np.minimum(left + 1, last)
+
+    # Weights from the original times, free of the offsets' rounding
+    span = flat_t[right] - flat_t[left]
+    weight = np.where(span > 0, (grid[None, :] - flat_t[left])
+            / np.where(span > 0, span, 1), 0)
+    weight = np.clip(weight, 0, 1).astype(dtype)
+    stack[rows] = flat_v[left] + weight * (flat_v[right] - flat_v[left])
+
+    return stack
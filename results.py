@@ -0,0 +1,182 @@
+"""Results Module
+
+This module contains the functions used to keep every computed result
+(electron temperature and density, saturation values, IVDF peak energy, beam
+current, pulse energy) in a local SQLite database, together with the run's
+parameters and a hash of its input dataset. Runs are indexed by diagnostic,
+date, result name and parameter, so trends across thousands of runs come
+from one query instead of rerunning each analysis.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import numpy as np
+
+RESULTS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'export', 'results.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL,
+    diagnostic TEXT,
+    dataset TEXT,
+    dataset_hash TEXT,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS params (
+    run_id INTEGER REFERENCES runs (id),
+    name TEXT,
+    value
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER REFERENCES runs (id),
+    name TEXT,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS runs_diagnostic ON runs (diagnostic, timestamp);
+CREATE INDEX IF NOT EXISTS runs_dataset ON runs (dataset_hash);
+CREATE INDEX IF NOT EXISTS params_name ON params (name, value, run_id);
+CREATE INDEX IF NOT EXISTS results_name ON results (name, run_id);
+"""
+
+# Content hashes of files already read, keyed by (path, size, mtime)
+_file_hashes = {}
+
+
+def connect(db=None):
+    if db is None:
+        db = RESULTS_DB
+    os.makedirs(os.path.dirname(os.path.abspath(db)), exist_ok=True)
+    connection = sqlite3.connect(db)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def file_hash(path, block_size=2**20):
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            block = f.read(block_size)
+            while block:
+                digest.update(block)
+                block = f.read(block_size)
+        _file_hashes[key] = digest.hexdigest()
+
+    return _file_hashes[key]
+
+
+def dataset_hash(name):
+
+    # Hash of every file under name (or of name itself) by relative path
+    # and content, so copies of a dataset hash the same on any machine
+    name = os.path.abspath(name)
+    if os.path.isfile(name):
+        return file_hash(name)
+
+    digest = hashlib.sha256()
+    for directory, folders, files in os.walk(name):
+        folders.sort()
+        for file in sorted(files):
+            if file == '.gitignore':
+                continue
+            path = os.path.join(directory, file)
+            digest.update(os.path.relpath(path, name).encode('utf8'))
+            digest.update(file_hash(path).encode('utf8'))
+
+    return digest.hexdigest()
+
+
+def dataset_signature(name):
+
+    # Hash of every file under name (or of name itself) by absolute path,
+    # size and modification time. Nothing is read, so it is cheap for any
+    # dataset size, but it only identifies the files on this machine.
+    name = os.path.abspath(name)
+    if os.path.isfile(name):
+        paths = [name]
+    else:
+        paths = []
+        for directory, folders, files in os.walk(name):
+            folders.sort()
+            for file in sorted(files):
+                if file != '.gitignore':
+                    paths.append(os.path.join(directory, file))
+
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(repr((path, stat.st_size, stat.st_mtime_ns))
+                .encode('utf8'))
+
+    return digest.hexdigest()
+
+
+def record(diagnostic, dataset, params, values, db=None):
+
+    # Store one run; params maps parameter names to numbers or strings
+    # and values maps result names to numbers. Returns the run id.
+    connection = connect(db)
+    with connection:
+        cursor = connection.execute(
+                'INSERT INTO runs (timestamp, diagnostic, dataset, '
+                'dataset_hash, params) VALUES (?, ?, ?, ?, ?)',
+                (time.time(), diagnostic, os.path.abspath(dataset),
+                dataset_hash(dataset), json.dumps(params, sort_keys=True)))
+        run_id = cursor.lastrowid
+        connection.executemany(
+                'INSERT INTO params VALUES (?, ?, ?)',
+                [(run_id, name, params[name]) for name in params])
+        connection.executemany(
+                'INSERT INTO results VALUES (?, ?, ?)',
+                [(run_id, name, float(values[name])) for name in values])
+    connection.close()
+
+    return run_id
+
+
+def trend(diagnostic, name, since=None, until=None, params=None, db=None):
+
+    # Timestamps, values and run ids of one result across runs, oldest
+    # first. since/until are Unix times and params filters on exact
+    # parameter values, e.g. {'order': 2}.
+    sql = ('SELECT runs.timestamp, results.value, runs.id FROM runs '
+            'JOIN results ON results.run_id = runs.id ')
+    values = []
+
+    if params is not None:
+        for index, param in enumerate(sorted(params)):
+            alias = 'p' + str(index)
+            sql += ('JOIN params ' + alias + ' ON ' + alias
+                    + '.run_id = runs.id AND ' + alias + '.name = ? AND '
+                    + alias + '.value = ? ')
+            values += [param, params[param]]
+
+    sql += 'WHERE runs.diagnostic = ? AND results.name = ? '
+    values += [diagnostic, name]
+    if since is not None:
+        sql += 'AND runs.timestamp >= ? '
+        values.append(since)
+    if until is not None:
+        sql += 'AND runs.timestamp <= ? '
+        values.append(until)
+    sql += 'ORDER BY runs.timestamp'
+
+    connection = connect(db)
+    rows = connection.execute(sql, values).fetchall()
+    connection.close()
+
+    if rows == []:
+        return np.zeros(0), np.zeros(0), np.zeros(0, dtype=int)
+    timestamps, trend_values, run_ids = zip(*rows)
+
+    return (np.array(timestamps), np.array(trend_values, dtype=float),
+            np.array(run_ids))
@@ -0,0 +1,65 @@
+"""Rolling Statistics Module
+
+This module contains the sliding window statistics used by the median and
+moving average stages: median, mean, minimum and maximum. Every function
+works along one explicit axis, so a whole stack of shots can be smoothed
+along the time axis or along the bias axis in a single call. Mean, minimum
+and maximum cost O(n) whatever the window. The median costs O(n log w) on
+accel's numpy backend, whose ndimage rank filter keeps the window in a pair
+of heaps, and O(n w) on the jit backend, which shifts a sorted window by
+up to w places per sample.
+
+Windows are centred like signal.medfilt and np.convolve(mode='same'), and
+the default 'constant' mode pads with zeros as both of those do. An even
+window has no centre sample; it covers i - window//2 to i + window//2 - 1,
+one more sample before i than after it, which is also where np.convolve
+puts it, so mean matches np.convolve(x, np.ones(w) / w, mode='same') for
+every window no longer than x. minimum and maximum repeat the edge samples
+instead ('nearest'), since zero padding would replace the extremes near the
+edges of any signal with an offset by zero.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import numpy as np
+from scipy import ndimage
+
+import accel
+
+
+def _rows(x, axis):
+
+    # View x as rows along the filtered axis, and a function to undo it
+    x = np.asarray(x)
+    moved = np.moveaxis(x, axis, -1)
+    rows = np.ascontiguousarray(moved).reshape(-1, moved.shape[-1])
+
+    def restore(out):
+        return np.moveaxis(out.reshape(moved.shape), -1, axis)
+
+    return rows, restore
+
+
+def median(x, window, axis=-1, mode='constant'):
+
+    # Each row goes through the 1-D rank filter in ndimage, or through the
+    # compiled sorted-window kernel when accel runs on its jit backend
+    rows, restore = _rows(x, axis)
+    return restore(accel.running_median(rows, window, mode))
+
+
+def mean(x, window, axis=-1, mode='constant'):
+
+    # Even windows lean one sample towards the start, see above
+    x = np.asarray(x)
+    return ndimage.uniform_filter1d(x, window, axis=axis, mode=mode)
+
+
+def minimum(x, window, axis=-1, mode='nearest'):
+    x = np.asarray(x)
+    return ndimage.minimum_filter1d(x, window, axis=axis, mode=mode)
+
+
+def maximum(x, window, axis=-1, mode='nearest'):
+    x = np.asarray(x)
+    return ndimage.maximum_filter1d(x, window, axis=axis, mode=mode)
@@ -1,6 +1,5 @@
 import sys
 import os
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 from scipy import signal
@@ -8,19 +7,38 @@ from scipy.signal import butter, lfilter
 from scipy.stats import maxwell
 from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
+from scipy.interpolate import BSpline, make_smoothing_spline
+
+import precision
+import rolling
+import sharedstack
+import align as alignment
 
 
 def get_data(name):
 
-    data = {}
-    os.chdir(name)
+    # Shots read by path so the caller's working directory never changes
+    return read_files(list_files(name))
+
+
+def list_files(name):
 
-    for folder in os.listdir():
+    # Shot files of every folder, in the order get_data reads them
+    files = []
+    for folder in os.listdir(name):
         if not folder == '.gitignore':
+            for shot in os.listdir(os.path.join(name, folder)):
+                files.append(os.path.join(name, folder, shot))
+    return files
 
-            for shot in os.listdir(folder):
-                data.update({shot: np.ndfromtxt(
-                    folder + '/' + shot, delimiter='\t')})
+
+def read_files(files):
+
+    # Load the given shot files by file name
+    data = {}
+    for shot in files:
+        data.update({os.path.basename(shot): precision.asarray(
+            np.genfromtxt(shot, delimiter='\t'))})
     return data
 
 
@@ -28,13 +46,27 @@ def get_data(name):
 def butter_filter(data, order, cutoff):
 
     buttered = {}
-    sos = signal.butter(order, cutoff, btype='low', analog=False, output='sos')
+    sos = precision.butter_sos(order, cutoff)
     for shot in sorted(data):  # this sorts in decending order (i.e 0-10)
         corrected = np.array(signal.sosfiltfilt(sos, data[shot][:, 1]))
         buttered.update({shot: [corrected]})
     return buttered
 
 
+# butter_filter on a process pool, see sharedstack.filter_rows
+def butter_filter_parallel(data, order, cutoff, workers=None):
+
+    sos = precision.butter_sos(order, cutoff)
+    shots = sorted(data)
+    filtered = sharedstack.filter_rows(
+        [data[shot][:, 1] for shot in shots], sos, workers)
+
+    buttered = {}
+    for shot, corrected in zip(shots, filtered):
+        buttered.update({shot: [corrected]})
+    return buttered
+
+
 # Means should only be used when finding mean of each plot in a given window
 def means(buttered):
 
@@ -45,6 +77,19 @@ def means(buttered):
     return butter_mean
 
 
+# Moves every shot onto the mean shot to remove trigger jitter, so the time
+# slice samples the same point of every pulse
+def align_shots(buttered, max_lag=alignment.MAX_JITTER):
+
+    shots = list(buttered.keys())
+    if len(set(len(buttered[shot][0]) for shot in shots)) > 1:
+        raise ValueError("Shot files differ in length: CHECK DIRECTORY")
+    rows = np.array([buttered[shot][0] for shot in shots])
+    aligned, lags = alignment.align_rows(rows, max_lag=max_lag)
+
+    return dict((shot, [row]) for shot, row in zip(shots, aligned))
+
+
 # This preforms a slice of time analysis to the buttered data
 def time_slice(buttered, time):
 
@@ -56,23 +101,26 @@ def time_slice(buttered, time):
     return slice
 
 
-# Only call for debugging plots
+# Only call for debugging plots; pyplot is imported here so the analysis
+# itself never loads a plotting backend
 def plot_dict(dict):
 
+    import matplotlib.pyplot as plt
+
     plt.figure()
     for key in dict.keys():
         for value in dict[key]:
             plt.plot(value)
     plt.show()
 
-# This function applies a median filter
+# This function applies a median filter along the bias axis
 def median_filter(dict, window):
 
     arr = []
     for key in dict.keys():
         for value in dict[key]:
             arr.append(value)
-    med = signal.medfilt(arr, window)
+    med = rolling.median(np.ravel(arr), window)
     return med
 
 
@@ -97,8 +145,80 @@ def normalize(x):
 def ivdf(xnew, spl, window=9):
 
     yder = splev(xnew, spl, der=1)
-    moving_avg = -np.convolve(yder,
-                              np.ones((window,)) / window, mode='same')
+    moving_avg = -rolling.mean(yder, window)
+    return xnew, moving_avg
+
+
+
+# Fits many curves sharing one bias grid exactly as spline_fit does each of
+# them, and evaluates the spline derivative on the output grid. Curves whose
+# splrep knots coincide share one basis evaluation, so the derivative of a
+# whole group is a single matrix product.
+def batch_spline_fit(curves, smooth, spline_num, der=1):
+
+    curves = np.atleast_2d(curves)
+    smooth = smooth * 1E-8
+    x = np.linspace(0, curves.shape[1] - 1, curves.shape[1])
+    xnew = np.linspace(0, curves.shape[1] - 1, spline_num)
+
+    groups = {}
+    for index, curve in enumerate(curves):
+        t, c, k = splrep(x, curve, k=3, s=smooth)
+        groups.setdefault(tuple(t), []).append((index, c))
+
+    ynew = np.empty((len(curves), spline_num))
+    for t, members in groups.items():
+        rows = [index for index, c in members]
+        coeffs = np.column_stack([c for index, c in members])
+        spl = BSpline(np.array(t), coeffs, 3, extrapolate=False)
+        ynew[rows] = spl.derivative(der)(xnew).T if der else spl(xnew).T
+
+    return xnew, ynew
+
+
+# Penalised spline derivative of many curves with one smoothing parameter
+# lam. The fit is linear in the curves, so the whole stack is solved with a
+# single factorisation; lam=None picks it by GCV for the stack.
+def batch_penalised(curves, spline_num, lam=None, der=1):
+
+    curves = np.atleast_2d(curves)
+    x = np.linspace(0, curves.shape[1] - 1, curves.shape[1])
+    xnew = np.linspace(0, curves.shape[1] - 1, spline_num)
+    spl = make_smoothing_spline(x, curves.T, lam=lam, axis=0)
+    ynew = spl.derivative(der)(xnew).T if der else spl(xnew).T
+    return xnew, ynew
+
+
+# Savitzky-Golay derivative of many curves, resampled to the output grid;
+# a faster alternative to the spline derivative
+def batch_savgol(curves, spline_num, savgol_window=9, polyorder=3, der=1):
+
+    curves = np.atleast_2d(curves)
+    x = np.linspace(0, curves.shape[1] - 1, curves.shape[1])
+    xnew = np.linspace(0, curves.shape[1] - 1, spline_num)
+    yder = signal.savgol_filter(curves, savgol_window, polyorder, deriv=der,
+                                axis=-1)
+    ynew = inter.interp1d(x, yder, axis=-1)(xnew)
+    return xnew, ynew
+
+
+# Batch counterpart of spline_fit followed by ivdf, one IVDF per row. The
+# 'spline' method gives ivdf's result for every curve; 'penalised' and
+# 'savgol' trade that for speed on large stacks.
+def batch_ivdf(curves, smooth, spline_num, window=9, method='spline',
+               lam=None, savgol_window=9, polyorder=3):
+
+    if method == 'spline':
+        xnew, yder = batch_spline_fit(curves, smooth, spline_num)
+    elif method == 'penalised':
+        xnew, yder = batch_penalised(curves, spline_num, lam)
+    elif method == 'savgol':
+        xnew, yder = batch_savgol(curves, spline_num, savgol_window,
+                                  polyorder)
+    else:
+        raise ValueError("IVDF method is not recognized: %r" % method)
+
+    moving_avg = -rolling.mean(yder, window, axis=-1)
     return xnew, moving_avg
 
 
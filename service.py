@@ -0,0 +1,422 @@
+"""Service Module
+
+This module contains the functions used to serve the diagnostic pipelines
+over HTTP on the local machine, so lab machines and dashboards can get DBD
+Te and ne, IVDFs, densities and power summaries without installing the GUI.
+Requests name a diagnostic, a dataset directory under the service root and
+any pipeline parameters; responses are JSON, or the result's arrays as a
+binary .npz (or one .npy) archive.
+
+Jobs run on a bounded pool of worker processes started with the service, so
+imports are paid once and each worker keeps a pipeline.NodeCache of the
+stage outputs it computed. Encoded responses are kept in the service too,
+keyed by the pipeline key of the result, so repeated requests are answered
+without reaching a worker until a file, parameter or source file changes.
+When every worker is busy and the queue is full, requests are refused with
+503 rather than left waiting. Only the standard library and the toolkit's
+own dependencies are used.
+
+    python service.py --root /data/campaign
+    curl 'localhost:8765/analyze?diagnostic=DBD&dataset=run1&fields=values'
+    curl -d '{"diagnostic": "RPA", "dataset": "run2", "params": {"tts": 300},
+            "format": "npz"}' localhost:8765/analyze > run2.npz
+"""
+
+__author__ = 'Kaito Durkee'
+
+import io
+import os
+import json
+import math
+import argparse
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+
+import pipeline
+import precision
+import store
+
+HOST = '127.0.0.1'  # local machine only
+PORT = 8765
+MAX_PENDING = 64    # jobs queued or running before requests are refused
+JOB_TIMEOUT = 600   # s
+MAX_BODY = 2**20    # bytes of request body read
+WORKER_CACHE_BUDGET = 256 * 2**20 # bytes of stage outputs per worker
+RESPONSE_BUDGET = 64 * 2**20 # bytes of encoded responses kept
+
+CONTENT_TYPES = {'json': 'application/json',
+                 'npz': 'application/octet-stream',
+                 'npy': 'application/octet-stream'}
+
+
+class RequestError(Exception):
+    """A request the service refuses, with the HTTP status to answer."""
+
+    def __init__(self, status, message):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+
+# Worker processes ------------------------------------------------------------
+
+_cache = None
+_store = None
+
+
+def _init_worker(cache_budget, store_dir):
+    global _cache, _store
+    _cache = pipeline.NodeCache(cache_budget)
+    if store_dir is not None:
+        _store = store.ResultStore(store_dir, store.STORE_BUDGET)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _job(diagnostic, dataset, params, fields, format, dtype):
+
+    # Encoded result of one request and the warnings raised computing it.
+    # A worker runs one job at a time, so the compute type can be set here.
+    precision.set_dtype(dtype)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        result = pipeline.run(pipeline.get_pipeline(diagnostic), dataset,
+                params, ('result',), _cache, store=_store)['result']
+    messages = sorted(set(str(warning.message) for warning in caught))
+
+    if fields:
+        for field in fields:
+            if field not in result:
+                raise RequestError(HTTPStatus.BAD_REQUEST,
+                        "Result field is not recognized: %r" % field)
+        result = dict((field, result[field]) for field in fields)
+
+    if format == 'json':
+        body = json.dumps({'diagnostic': diagnostic, 'dataset': dataset,
+                'result': jsonable(result), 'warnings': messages},
+                allow_nan=False)
+        return body.encode('utf8'), messages
+
+    arrays = flatten(result)
+    buffer = io.BytesIO()
+    if format == 'npy':
+        if len(arrays) != 1:
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                    "npy holds one array, the fields give %d: %r"
+                    % (len(arrays), sorted(arrays)))
+        np.save(buffer, next(iter(arrays.values())), allow_pickle=False)
+    else:
+        np.savez(buffer, **arrays)
+    return buffer.getvalue(), messages
+
+
+def jsonable(value):
+
+    # Result values as plain lists, numbers and strings. NaN and infinity
+    # are not JSON, so non-finite numbers (e.g. a failed fit) become null.
+    if isinstance(value, dict):
+        return dict((str(key), jsonable(value[key])) for key in value)
+    elif isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    elif isinstance(value, (np.ndarray, np.generic)):
+        if value.dtype.kind != 'f' or np.isfinite(value).all():
+            return value.tolist()
+        return jsonable(value.tolist())
+    elif isinstance(value, float):
+        return value if math.isfinite(value) else None
+    elif value is None or isinstance(value, (str, int, bool)):
+        return value
+    return str(value)
+
+
+def flatten(value, prefix=''):
+
+    # Every array and number in a result by its path, e.g. 'density/10cm';
+    # strings and numbers become 0-d arrays and None is left out
+    if isinstance(value, dict):
+        items = [(str(key), value[key]) for key in value]
+    elif isinstance(value, (list, tuple)):
+        items = [(str(index), item) for index, item in enumerate(value)]
+    else:
+        array = np.asarray(value)
+        if value is None or array.dtype == object:
+            return {}
+        return {prefix: array}
+
+    arrays = {}
+    for key, item in items:
+        arrays.update(flatten(item, prefix + '/' + key if prefix else key))
+    return arrays
+
+
+# Service ---------------------------------------------------------------------
+
+class AnalysisService:
+    """Warm worker pool running pipeline requests, with a response cache."""
+
+    def __init__(self, root=None, workers=None, max_pending=MAX_PENDING,
+            dtype=np.float64, store_dir=None,
+            cache_budget=WORKER_CACHE_BUDGET, response_budget=RESPONSE_BUDGET,
+            timeout=JOB_TIMEOUT):
+
+        self.root = os.path.realpath(root or os.getcwd())
+        self.workers = workers or os.cpu_count() or 1
+        self.dtype = np.dtype(dtype).name
+        self.timeout = timeout
+        self.responses = pipeline.NodeCache(response_budget)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(self.workers,
+                initializer=_init_worker, initargs=(cache_budget, store_dir))
+
+        # Start every worker now so the first requests find them ready
+        for future in [self.pool.submit(_ready)
+                for worker in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def dataset_path(self, dataset):
+
+        # Datasets are named relative to the root and must stay under it
+        if not isinstance(dataset, str) or not dataset:
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                    'A dataset directory is required')
+        path = os.path.realpath(os.path.join(self.root, dataset))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise RequestError(HTTPStatus.FORBIDDEN,
+                    "Dataset is outside the service root: %r" % dataset)
+        if not os.path.exists(path):
+            raise RequestError(HTTPStatus.NOT_FOUND,
+                    "Dataset was not found: %r" % dataset)
+        return path
+
+    def analyze(self, diagnostic, dataset, params=None, fields=None,
+            format='json', dtype=None):
+
+        # Encoded result and warnings of one request, from the response cache
+        # or a worker
+        if diagnostic not in pipeline.PIPELINES:
+            raise RequestError(HTTPStatus.NOT_FOUND,
+                    "Diagnostic is not recognized: %r" % diagnostic)
+        if format not in CONTENT_TYPES:
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                    "Format is not recognized: %r" % format)
+        graph = pipeline.get_pipeline(diagnostic)
+        params = dict(params or {})
+        for name in params:
+            if name not in graph.defaults:
+                raise RequestError(HTTPStatus.BAD_REQUEST,
+                        "Parameter is not recognized: %r" % name)
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        fields = tuple(fields or ())
+        try:
+            dtype = np.dtype(dtype or self.dtype).name
+        except TypeError:
+            dtype = None
+        if dtype not in ('float32', 'float64'):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                    'Compute type must be float32 or float64')
+        path = self.dataset_path(dataset)
+
+        # The result's node key covers the files, parameters and source, so
+        # a cached response is never stale
+        key = (graph.keys(path, params)['result'], dtype, fields, format)
+        response = self.responses.get(key)
+        if response is not None:
+            return response
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE,
+                        'Too many jobs queued, try again later')
+            self.pending += 1
+        try:
+            future = self.pool.submit(_job, diagnostic, path, params, fields,
+                    format, dtype)
+        except BaseException:
+            self._release(None)
+            raise
+
+        # A job that times out keeps its worker until it finishes, as a
+        # running job cannot be cancelled, so its slot is released only
+        # when the job is done
+        future.add_done_callback(self._release)
+        try:
+            response = future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise RequestError(HTTPStatus.GATEWAY_TIMEOUT,
+                    'Analysis took longer than %d s' % self.timeout)
+
+        self.responses.put(key, response)
+        return response
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def status(self):
+        return {'workers': self.workers, 'pending': self.pending,
+                'max pending': self.max_pending, 'root': self.root,
+                'cached responses': len(self.responses.values)}
+
+
+def _query_value(text):
+
+    # Query parameters are JSON where they parse (numbers, true, null) and
+    # strings otherwise
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    """HTTP front end of an AnalysisService (the server's service)."""
+
+    protocol_version = 'HTTP/1.1'   # keep-alive for many small requests
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/diagnostics':
+            self.send_body(HTTPStatus.OK, self.json_body(dict(
+                    (name, pipeline.PIPELINES[name].defaults)
+                    for name in sorted(pipeline.PIPELINES))))
+        elif url.path == '/status':
+            self.send_body(HTTPStatus.OK,
+                    self.json_body(self.server.service.status()))
+        elif url.path == '/analyze':
+            query = dict(parse_qsl(url.query))
+            request = {}
+            for name in ('diagnostic', 'dataset', 'fields', 'format',
+                    'dtype'):
+                if name in query:
+                    request[name] = query.pop(name)
+            request['params'] = dict((name, _query_value(query[name]))
+                    for name in query)
+            self.analyze(request)
+        else:
+            self.send_error_body(HTTPStatus.NOT_FOUND,
+                    "Path is not recognized: %r" % url.path)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        if url.path != '/analyze':
+            self.send_error_body(HTTPStatus.NOT_FOUND,
+                    "Path is not recognized: %r" % url.path)
+        elif length > MAX_BODY:
+            self.send_error_body(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                    'Request body is larger than %d bytes' % MAX_BODY)
+        else:
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError as error:
+                self.send_error_body(HTTPStatus.BAD_REQUEST,
+                        'Request body is not JSON: %s' % error)
+                return
+            if not isinstance(request, dict):
+                self.send_error_body(HTTPStatus.BAD_REQUEST,
+                        'Request body must be a JSON object')
+                return
+            self.analyze(request)
+
+    def analyze(self, request):
+        format = request.get('format', 'json')
+        params = request.get('params')
+        if params is not None and not isinstance(params, dict):
+            self.send_error_body(HTTPStatus.BAD_REQUEST,
+                    'params must be a JSON object')
+            return
+        try:
+            body, messages = self.server.service.analyze(
+                    request.get('diagnostic'), request.get('dataset'), params,
+                    request.get('fields'), format, request.get('dtype'))
+        except RequestError as error:
+            self.send_error_body(error.status, error.message)
+        except (FileNotFoundError, NotADirectoryError) as error:
+            self.send_error_body(HTTPStatus.NOT_FOUND, str(error))
+        except Exception as error:
+            self.send_error_body(HTTPStatus.INTERNAL_SERVER_ERROR,
+                    '%s: %s' % (type(error).__name__, error))
+        else:
+            self.send_body(HTTPStatus.OK, body, CONTENT_TYPES[format],
+                    {'X-Warnings': json.dumps(messages)})
+
+    def json_body(self, value):
+        return json.dumps(jsonable(value), allow_nan=False).encode('utf8')
+
+    def send_error_body(self, status, message):
+        self.send_body(status, self.json_body({'error': message}))
+
+    def send_body(self, status, body, content_type='application/json',
+            headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name in headers or {}:
+            self.send_header(name, headers[name])
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(service, host=HOST, port=PORT, quiet=False):
+
+    # HTTP server answering each connection on its own thread; the analysis
+    # itself runs in the service's worker processes
+    server = ThreadingHTTPServer((host, port), AnalysisHandler)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+def serve(host=HOST, port=PORT, quiet=False, **options):
+    service = AnalysisService(**options)
+    server = make_server(service, host, port, quiet)
+    host, port = server.server_address[:2]
+    print('Serving %s on http://%s:%d' % (service.root, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Serve the diagnostic pipelines over local HTTP')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--root', default=None,
+            help='directory the dataset paths are relative to')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING)
+    parser.add_argument('--float32', action='store_true',
+            help='compute in single precision unless a request asks')
+    parser.add_argument('--store', nargs='?', const=store.STORE_DIR,
+            default=None, help='reuse stage outputs stored in this directory')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.quiet, root=args.root,
+            workers=args.workers, max_pending=args.max_pending,
+            dtype=np.float32 if args.float32 else np.float64,
+            store_dir=args.store)
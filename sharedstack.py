@@ -0,0 +1,143 @@
+"""Shared Stack Module
+
+This module contains the shared-memory shot stack used to hand large shot
+matrices to process pool workers. The stack is written once into a named
+shared memory block; workers attach to it by name and read or write row
+slices in place, so no shot data is pickled between processes.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import numpy as np
+from scipy import signal
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+
+class SharedStack:
+    """2-D array of shots held in a named shared memory block.
+
+    The process that creates a stack owns it and unlinks the block when
+    it is closed; attached processes only unmap it.
+
+    Attributes:
+        shape -- (shots, samples) shape of the stack
+        dtype -- numpy dtype of the samples
+        array -- numpy view onto the shared block
+    """
+
+    def __init__(self, shape, dtype=np.float64, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype,
+                buffer=self._shm.buf)
+
+    @classmethod
+    def from_rows(cls, rows, dtype=None):
+        # Stack equal length 1-D arrays into a new shared block
+        if dtype is None:
+            dtype = np.result_type(*rows)
+        stack = cls((len(rows), len(rows[0])), dtype)
+        for index, row in enumerate(rows):
+            stack.array[index] = row
+        return stack
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def spec(self):
+        # Everything a worker needs to attach, small enough to pickle
+        return (self.name, self.shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name)
+
+    def close(self):
+        self.array = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map_block(func, source_spec, target_spec, start, stop, args):
+
+    source = SharedStack.attach(source_spec)
+    target = SharedStack.attach(target_spec)
+    try:
+        target.array[start:stop] = func(source.array[start:stop], *args)
+    finally:
+        source.close()
+        target.close()
+
+
+def map_rows(func, source, target, args=(), workers=None):
+
+    # Apply func to contiguous row blocks of source and write each result
+    # into the same rows of target. func must be a module level function
+    # taking (rows, *args) so it can be sent to a worker.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(source)))
+
+    if workers == 1:
+        target.array[:] = func(source.array, *args)
+        return target
+
+    # A few blocks per worker keeps the pool busy when rows vary in cost
+    bounds = np.linspace(0, len(source), workers * 4 + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_map_block, func, source.spec, target.spec,
+                start, stop, args)
+                for start, stop in zip(bounds[:-1], bounds[1:])
+                if stop > start]
+        for future in futures:
+            future.result()
+
+    return target
+
+
+def map_stack(func, rows, columns, args=(), workers=None, dtype=None):
+
+    # map_rows over equal length rows stacked into a new shared block,
+    # returning the (rows, columns) result as one ordinary array
+    with SharedStack.from_rows(rows, dtype) as source:
+        with SharedStack((len(source), columns), source.dtype) as target:
+            map_rows(func, source, target, args, workers)
+            return target.array.copy()
+
+
+def _filter_block(rows, sos):
+    return signal.sosfiltfilt(sos, rows, axis=1)
+
+
+def filter_rows(rows, sos, workers=None):
+
+    # Zero-phase filter every row with sosfiltfilt across a process pool
+    # sharing one stacked matrix, with the same values as filtering them
+    # one by one. Rows of unequal length cannot be stacked; they are
+    # filtered one by one here and returned as a list.
+    if len(set(len(row) for row in rows)) > 1:
+        return [signal.sosfiltfilt(sos, row) for row in rows]
+    return map_stack(_filter_block, rows, len(rows[0]), (sos,), workers,
+            sos.dtype)
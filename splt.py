@@ -9,17 +9,42 @@ from scipy.stats import maxwell
 from scipy.interpolate import CubicSpline, splev, splrep
 from scipy import interpolate as inter
 
+import json
+import hashlib
+import pandas as pd
+
+import precision
+import rolling
+from pplt import count_rows
+
+# Files larger than this open through the level-of-detail pyramid
+LOD_THRESHOLD = 50 * 2**20 # bytes
+
+# Samples folded into one min/max pair from one level to the next
+LOD_FACTOR = 8
+
+# Coarsest level is no longer than this; also the most points drawn
+LOD_POINTS = 4096
+
+# Rows read per block while building a pyramid
+LOD_CHUNK = 2**20
+
+# Pyramids live outside the data tree, so the loaders never see them
+LOD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'export', 'lod')
+
 
 def get_data(name):
 
     data = {}
-    data.update({name: np.ndfromtxt(name, delimiter='\t')})
+    data.update({name: precision.asarray(
+        np.genfromtxt(name, delimiter='\t'))})
     return data
 
 
 def butter_filter(data, order, cutoff):
     buttered = {}
-    sos = signal.butter(order, cutoff, btype='low', analog=False, output='sos')
+    sos = precision.butter_sos(order, cutoff)
     for shot in data:  # this sorts in decending order (i.e 0-10)
         corrected = np.array(signal.sosfiltfilt(sos, data[shot][:, 1]))
         buttered.update({shot: [corrected]})
@@ -41,7 +66,8 @@ def median_filter(dict, window):
     for key in dict.keys():
         for value in dict[key]:
             arr.append(value)
-    med = signal.medfilt(arr, window)
+    # Each shot is filtered along its own time axis
+    med = rolling.median(np.array(arr), window, axis=-1)
     return med
 
 
@@ -73,5 +99,165 @@ def plot_dict(dic):
             plt.plot(np.arange(len(v[0])), v[0])
     plt.show()
 
+def _fold_level(src_min, src_max, dst_min, dst_max, factor):
+
+    # Min/max of each run of factor samples, block by block so memory
+    # stays bounded whatever the level length
+    block = factor * LOD_CHUNK
+    for start in range(0, len(src_min), block):
+        stop = min(start + block, len(src_min))
+        bins = np.arange(start, stop, factor) - start
+        index = start // factor
+        dst_min[index:index + len(bins)] = np.minimum.reduceat(
+                src_min[start:stop], bins)
+        dst_max[index:index + len(bins)] = np.maximum.reduceat(
+                src_max[start:stop], bins)
+
+
+def lod_path(name):
+
+    # Pyramid directory of one file, named after it and a hash of its
+    # absolute path; a changed file is rebuilt in the same directory
+    name = os.path.abspath(name)
+    digest = hashlib.sha256(name.encode('utf8')).hexdigest()[:12]
+    return os.path.join(LOD_DIR, '%s-%s' % (os.path.basename(name), digest))
+
+
+def build_pyramid(name, factor=LOD_FACTOR):
+
+    # Build the min/max level-of-detail pyramid for a single dataset file
+    # under LOD_DIR. An existing pyramid is reused while the file's size
+    # and modification time are unchanged.
+    lod_dir = lod_path(name)
+    stat = os.stat(name)
+    meta = {'size': stat.st_size, 'mtime': stat.st_mtime, 'factor': factor}
+    meta_file = os.path.join(lod_dir, 'meta.json')
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            built = json.load(f)
+        if all(built.get(key) == meta[key] for key in meta):
+            return lod_dir
+    os.makedirs(lod_dir, exist_ok=True)
+
+    length = count_rows(name)
+    level = np.lib.format.open_memmap(os.path.join(lod_dir, 'level0.npy'),
+            mode='w+', dtype=precision.get_dtype(), shape=(length,))
+    start = 0
+    for chunk in pd.read_csv(name, sep='\t', header=None, usecols=[1],
+            chunksize=LOD_CHUNK):
+        level[start:start + len(chunk)] = chunk.values[:, 0]
+        start += len(chunk)
+    length = start
+    level_min = level_max = level[:length]
+
+    depth = 0
+    while len(level_min) > LOD_POINTS:
+        depth += 1
+        shape = (int(np.ceil(len(level_min) / factor)),)
+        next_min = np.lib.format.open_memmap(os.path.join(lod_dir,
+                'level%d_min.npy' % depth), mode='w+', dtype=level.dtype,
+                shape=shape)
+        next_max = np.lib.format.open_memmap(os.path.join(lod_dir,
+                'level%d_max.npy' % depth), mode='w+', dtype=level.dtype,
+                shape=shape)
+        _fold_level(level_min, level_max, next_min, next_max, factor)
+        next_min.flush()
+        next_max.flush()
+        level_min, level_max = next_min, next_max
+    level.flush()
+
+    meta['length'] = length
+    meta['depth'] = depth
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f)
+
+    return lod_dir
+
+
+class Pyramid:
+    """Memory-mapped min/max level-of-detail pyramid of one dataset.
+
+    Level 0 holds the raw samples; level k holds the min and max of each
+    run of factor**k samples. Only the level and window being drawn are
+    read from disk.
+    """
+
+    def __init__(self, lod_dir):
+        with open(os.path.join(lod_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        self.factor = meta['factor']
+        self.length = meta['length']
+        self.raw = np.load(os.path.join(lod_dir, 'level0.npy'),
+                mmap_mode='r')[:self.length]
+        self.levels = [(self.raw, self.raw)]
+        for depth in range(1, meta['depth'] + 1):
+            self.levels.append((
+                np.load(os.path.join(lod_dir, 'level%d_min.npy' % depth),
+                    mmap_mode='r'),
+                np.load(os.path.join(lod_dir, 'level%d_max.npy' % depth),
+                    mmap_mode='r')))
+
+    def window(self, start, stop, points=LOD_POINTS):
+
+        # Sample positions and values covering [start, stop) at the finest
+        # level that needs no more than about points values
+        start = int(np.clip(start, 0, self.length))
+        stop = int(np.clip(stop, start + 1, self.length))
+        depth = 0
+        while (depth + 1 < len(self.levels)
+                and (stop - start) / self.factor**depth > points):
+            depth += 1
+
+        if depth == 0:
+            x = np.arange(start, stop)
+            return x, np.asarray(self.raw[start:stop])
+
+        # Each bin is drawn as a vertical min-max segment at its start
+        scale = self.factor**depth
+        level_min, level_max = self.levels[depth]
+        first = start // scale
+        last = int(np.ceil(stop / scale))
+        x = np.repeat(np.arange(first, last) * scale, 2)
+        y = np.empty(len(x), dtype=level_min.dtype)
+        y[0::2] = level_min[first:last]
+        y[1::2] = level_max[first:last]
+        return x, y
+
+
+class LODViewer:
+    """Keeps a line on an Axes fed from a Pyramid as the view changes."""
+
+    def __init__(self, ax, pyramid, points=LOD_POINTS, **kwargs):
+        self.ax = ax
+        self.pyramid = pyramid
+        self.points = points
+        x, y = pyramid.window(0, pyramid.length, points)
+        self.line, = ax.plot(x, y, **kwargs)
+        ax.set_xlim(0, pyramid.length)
+        ax.callbacks.connect('xlim_changed', self.update)
+
+    def update(self, ax):
+        start, stop = ax.get_xlim()
+        x, y = self.pyramid.window(np.floor(start), np.ceil(stop) + 1,
+                self.points)
+        self.line.set_data(x, y)
+        ax.figure.canvas.draw_idle()
+
+
+def plot_pyramid(name):
+
+    pyramid = Pyramid(build_pyramid(name))
+
+    plt.figure()
+    plt.minorticks_on()
+    plt.grid(which='major', alpha=0.5)
+    plt.grid(which='minor', alpha=0.2)
+    plt.title(re.split('/', name)[-1])
+    viewer = LODViewer(plt.gca(), pyramid)
+    plt.show()
+
+    return viewer
+
+
 if __name__ == 'main':
     print('Running splt')
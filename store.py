@@ -0,0 +1,133 @@
+"""Store Module
+
+This module contains the functions used to keep pipeline stage outputs on
+disk, addressed by their pipeline key. A key hashes the content of every
+input file, the stage's parameters, the working precision and the source of
+the toolkit itself, never a path or a timestamp, so a dataset copied to
+another machine and analyzed with the same parameters finds the outputs an
+earlier run stored, and any change to the code or the data misses. The
+only other entries map a dataset's file signature (paths, sizes and
+modification times) to its content key, so pipeline.run hashes unchanged
+files once per store rather than once per process.
+
+The store is a plain directory of pickles, written atomically, so it can be
+placed on a shared filesystem (set MDT_STORE, or pass the directory) and
+used by several analysts at once. Only point it at a directory whose writers
+are trusted, since loading a pickle can run code.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import os
+import pickle
+import tempfile
+import warnings
+
+STORE_DIR = os.environ.get('MDT_STORE', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'export', 'store'))
+SUFFIX = '.pkl'
+
+# Disk kept by the GUI, service and render stores before least recently
+# used entries are pruned
+STORE_BUDGET = int(os.environ.get('MDT_STORE_BYTES', 4 * 2**30)) # bytes
+
+
+class ResultStore:
+    """Pickled pipeline node outputs in a directory, one file per key."""
+
+    def __init__(self, directory=STORE_DIR, max_bytes=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._size = None   # bytes on disk, walked once then tracked
+
+    def path(self, key):
+
+        # Keys fan out over 256 subdirectories to keep listings short
+        return os.path.join(self.directory, key[:2], key[2:] + SUFFIX)
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key, default=None):
+
+        # A missing, partly copied or unreadable entry is a miss
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        try:
+            os.utime(path)  # marks it recently used for prune
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+
+        # Written under a temporary name and renamed into place, so readers
+        # on other machines never see half an entry; a full or read-only
+        # store is reported but never stops an analysis
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, temp = tempfile.mkstemp(dir=os.path.dirname(path),
+                    suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'wb') as f:
+                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(temp, path)
+            except BaseException:
+                os.remove(temp)
+                raise
+        except (OSError, pickle.PicklingError) as error:
+            warnings.warn('Stage output was not stored: %s' % error,
+                    RuntimeWarning)
+            return
+
+        # The directory is walked again only when the tracked size, which
+        # misses other writers, says the budget is exceeded
+        if self.max_bytes is not None:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._size = self.prune(self.max_bytes)
+
+    def entries(self):
+
+        # (last used, size, path) of every entry
+        entries = []
+        for directory, folders, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith(SUFFIX):
+                    path = os.path.join(directory, file)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue    # pruned by another process
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(size for used, size, path in self.entries())
+
+    def prune(self, max_bytes):
+
+        # Remove least recently used entries until at most max_bytes
+        # remain; returns the bytes left
+        entries = sorted(self.entries())
+        total = sum(size for used, size, path in entries)
+        for used, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        return total
+
+    def clear(self):
+        self.prune(0)
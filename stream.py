@@ -0,0 +1,284 @@
+"""Stream Module
+
+This module contains the functions used to filter and plot scope data while
+it is still being acquired. Samples arrive in chunks from a local socket or
+from a capture file that is still being written, go through the same
+Butterworth design as the offline filters, applied causally with sosfilt,
+and land in a fixed size ring buffer that drives a live plot.
+
+The filter starts in steady state at the first sample (zi from sosfilt_zi
+scaled by it) and its state is carried across chunk boundaries, so the
+streamed output is the same as filtering the whole record at once with
+sosfilt from that zi, and the work per chunk depends only on the chunk and
+buffer sizes, never on how long the stream has run. Unlike the offline
+sosfiltfilt path the output is delayed by the filter's group delay.
+
+A stand-in for the scope is bundled for trying the mode without hardware:
+
+    python stream.py scope --port 5555
+    python stream.py live localhost:5555
+"""
+
+__author__ = 'Kaito Durkee'
+
+import io
+import os
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+from scipy import signal
+
+import precision
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 5555
+NUM_COLUMNS = 2         # time and signal, as in the scope text files
+CHUNK_SIZE = 1024       # samples
+RING_CAPACITY = 50000   # samples kept for the live plot
+POLL_INTERVAL = 0.05    # s
+REFRESH_INTERVAL = 50   # ms
+SCOPE_RATE = 100000     # samples/s
+
+# Rows travel over the socket as little endian float64 (time, signal)
+FRAME_DTYPE = np.dtype('<f8')
+
+
+class StreamFilter:
+    """Causal Butterworth low pass that carries its state across chunks."""
+
+    def __init__(self, order, cutoff):
+        self.sos = precision.butter_sos(order, cutoff)
+        self.zi = None
+
+    def process(self, chunk):
+
+        # The first chunk starts the filter in steady state at its first
+        # sample, so a signal offset does not ring through the output
+        chunk = precision.asarray(chunk)
+        if len(chunk) == 0:
+            return chunk
+        if self.zi is None:
+            self.zi = signal.sosfilt_zi(self.sos) * chunk[0]
+        filtered, self.zi = signal.sosfilt(self.sos, chunk, zi=self.zi)
+        return filtered
+
+    def reset(self):
+        self.zi = None
+
+
+class RingBuffer:
+    """Fixed size buffer of the most recent rows of a stream."""
+
+    def __init__(self, capacity, columns=NUM_COLUMNS, dtype=np.float64):
+        self.data = np.zeros((capacity, columns), dtype=dtype)
+        self.capacity = capacity
+        self.start = 0      # index of the oldest row
+        self.size = 0
+        self.total = 0      # rows ever written
+        self._lock = threading.Lock()
+
+    def extend(self, rows):
+
+        # Rows beyond the capacity would be overwritten at once, so only
+        # the newest are copied, but all of them are counted
+        rows = np.asarray(rows)
+        count = len(rows)
+        rows = rows[-self.capacity:]
+        with self._lock:
+            stop = (self.start + self.size) % self.capacity
+            first = min(len(rows), self.capacity - stop)
+            self.data[stop:stop+first] = rows[:first]
+            self.data[:len(rows)-first] = rows[first:]
+            overflow = max(0, self.size + len(rows) - self.capacity)
+            self.start = (self.start + overflow) % self.capacity
+            self.size = min(self.capacity, self.size + len(rows))
+            self.total += count
+
+    def view(self):
+
+        # Copy of the buffered rows, oldest first
+        with self._lock:
+            index = (self.start + np.arange(self.size)) % self.capacity
+            return self.data[index]
+
+
+def socket_source(host=DEFAULT_HOST, port=DEFAULT_PORT, columns=NUM_COLUMNS,
+        chunk_size=CHUNK_SIZE, stop=None):
+
+    # Chunks of (time, signal) rows from a scope streaming float64 frames
+    row_bytes = columns * FRAME_DTYPE.itemsize
+    connection = socket.create_connection((host, port))
+    connection.settimeout(POLL_INTERVAL)
+    pending = b''
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                data = connection.recv(chunk_size * row_bytes)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            pending += data
+            num_rows = len(pending) // row_bytes
+            if num_rows:
+                rows = np.frombuffer(pending[:num_rows*row_bytes],
+                        dtype=FRAME_DTYPE).reshape(num_rows, columns)
+                pending = pending[num_rows*row_bytes:]
+                yield rows
+    finally:
+        connection.close()
+
+
+def tail_source(name, columns=NUM_COLUMNS, chunk_size=CHUNK_SIZE, stop=None,
+        idle_timeout=None):
+
+    # Chunks of rows appended to a tab delimited capture file as it grows;
+    # ends once nothing new arrives for idle_timeout seconds, if given
+    pending = ''
+    idle = 0.0
+    with open(name, 'r') as f:
+        while stop is None or not stop.is_set():
+            text = f.read(chunk_size * 32)
+            if not text:
+                if idle_timeout is not None and idle >= idle_timeout:
+                    break
+                time.sleep(POLL_INTERVAL)
+                idle += POLL_INTERVAL
+                continue
+            idle = 0.0
+            pending += text
+            complete, _, pending = pending.rpartition('\n')
+            if complete.strip():
+                rows = np.loadtxt(io.StringIO(complete), delimiter='\t',
+                        ndmin=2)
+                yield rows[:, :columns]
+
+
+def open_source(location, stop=None):
+
+    # 'host:port' streams from a socket, anything else tails a file
+    host, _, port = location.rpartition(':')
+    if host and port.isdigit() and not os.path.exists(location):
+        return socket_source(host, int(port), stop=stop)
+    return tail_source(location, stop=stop)
+
+
+def filter_stream(source, order, cutoff, ring, column=1):
+
+    # Filter every chunk of a source into a ring buffer of (time, filtered)
+    # rows; returns the number of rows processed
+    stream_filter = StreamFilter(order, cutoff)
+    for rows in source:
+        filtered = stream_filter.process(rows[:, column])
+        ring.extend(np.column_stack((rows[:, 0], filtered)))
+    return ring.total
+
+
+def fake_scope(port=DEFAULT_PORT, rate=SCOPE_RATE, chunk_size=CHUNK_SIZE,
+        duration=None, seed=None, ready=None):
+
+    # Serve one client with a noisy pulse train at rate samples/s, time in
+    # us like the scope captures, until it disconnects or duration ends;
+    # ready is set once the port is listening
+    rng = np.random.default_rng(seed)
+    period = rate // 100    # 100 pulses/s
+    server = socket.create_server((DEFAULT_HOST, port))
+    if ready is not None:
+        ready.set()
+    connection, _ = server.accept()
+    server.close()
+
+    sample = 0
+    started = time.perf_counter()
+    try:
+        while duration is None or sample < duration * rate:
+            index = sample + np.arange(chunk_size)
+            phase = (index % period) / period
+            pulse = np.where(phase < 0.5, np.exp(-phase * 40), 0.0)
+            rows = np.empty((chunk_size, NUM_COLUMNS), dtype=FRAME_DTYPE)
+            rows[:, 0] = index / rate * 1E6 # us
+            rows[:, 1] = pulse + 0.05 * rng.normal(size=chunk_size)
+            connection.sendall(rows.tobytes())
+            sample += chunk_size
+            # Pace to real time
+            delay = started + sample / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        connection.close()
+
+
+def start_fake_scope(port=DEFAULT_PORT, rate=SCOPE_RATE, duration=None,
+        seed=None):
+
+    # Run fake_scope in its own process; returns it once it is listening
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=fake_scope,
+            args=(port, rate, CHUNK_SIZE, duration, seed, ready), daemon=True)
+    process.start()
+    ready.wait()
+    return process
+
+
+class LivePlot:
+    """Line redrawn from a ring buffer filled by a background reader."""
+
+    def __init__(self, location, order=2, cutoff=0.05,
+            capacity=RING_CAPACITY, interval=REFRESH_INTERVAL):
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+
+        self.ring = RingBuffer(capacity)
+        self.stop = threading.Event()
+        source = open_source(location, self.stop)
+        self.reader = threading.Thread(target=filter_stream,
+                args=(source, order, cutoff, self.ring), daemon=True)
+        self.reader.start()
+
+        self.figure = plt.figure()
+        self.ax = self.figure.gca()
+        self.line, = self.ax.plot([], [])
+        self.ax.set_xlabel(r'Time ($\mu$s)')
+        self.ax.set_title(location)
+        self.ax.minorticks_on()
+        self.ax.grid(which='major', alpha=0.5)
+        self.ax.grid(which='minor', alpha=0.2)
+        self.figure.canvas.mpl_connect('close_event',
+                lambda event: self.stop.set())
+        self.animation = FuncAnimation(self.figure, self.update,
+                interval=interval, cache_frame_data=False)
+
+    def update(self, frame):
+        rows = self.ring.view()
+        if len(rows):
+            self.line.set_data(rows[:, 0], rows[:, 1])
+            self.ax.set_xlim(rows[0, 0], max(rows[-1, 0], rows[0, 0] + 1))
+            low, high = rows[:, 1].min(), rows[:, 1].max()
+            margin = 0.05 * (high - low) + 1E-12
+            self.ax.set_ylim(low - margin, high + margin)
+        return self.line,
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Streaming filter tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scope = commands.add_parser('scope', help='serve a fake scope stream')
+    scope.add_argument('--port', type=int, default=DEFAULT_PORT)
+    scope.add_argument('--rate', type=int, default=SCOPE_RATE)
+    live = commands.add_parser('live', help='plot a stream as it arrives')
+    live.add_argument('location', help="'host:port' or a file to tail")
+    live.add_argument('--order', type=int, default=2)
+    live.add_argument('--cutoff', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command == 'scope':
+        fake_scope(args.port, args.rate)
+    else:
+        import matplotlib.pyplot as plt
+        viewer = LivePlot(args.location, args.order, args.cutoff)
+        plt.show()
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _write_shots(folder, names, time, signal):
+    os.makedirs(folder, exist_ok=True)
+    for name, values in zip(names, signal):
+        np.savetxt(os.path.join(folder, name), np.column_stack((time, values)),
+                delimiter='\t')
+
+
+@pytest.fixture(scope='session')
+def datasets(tmp_path_factory):
+
+    # One small dataset of every diagnostic, under a shared root
+    root = str(tmp_path_factory.mktemp('datasets'))
+    rng = np.random.default_rng(0)
+    time = np.arange(1000) / 10.
+    pulse = np.exp(-((time - 50) / 5)**2)
+
+    _write_shots(os.path.join(root, 'RPA', 'set'),
+            ['shot%02d.txt' % i for i in range(6)], time,
+            pulse + 0.01 * rng.standard_normal((6, len(time))))
+
+    for folder in ('10cm', '20cm'):
+        _write_shots(os.path.join(root, 'DLP', folder),
+                ['shot%02d.txt' % i for i in range(4)], time,
+                pulse + 0.01 * rng.standard_normal((4, len(time))))
+
+    for probe in ('L1', 'R1'):
+        for position in (0, 5, 10):
+            _write_shots(os.path.join(root, 'NFP', probe, '%dcm' % position),
+                    ['s%d %dcm.txt' % (i, position) for i in range(3)], time,
+                    rng.standard_normal((3, len(time))) - position)
+
+    _write_shots(os.path.join(root, 'Bias'),
+            ['sweep %dV.txt' % bias for bias in (-30, -20, -10)], time,
+            [pulse * (1 + i) for i in range(3)])
+
+    bias = np.arange(-40, 41, 10.0)
+    os.makedirs(os.path.join(root, 'DBD', 'run1'))
+    np.savetxt(os.path.join(root, 'DBD', 'bias.txt'), bias)
+    for i in range(4):
+        x = 0.1 * rng.standard_normal((290 + len(bias)*100, 5))
+        for j, v in enumerate(bias):
+            x[290 + j*100 + 50, 4] = np.tanh(v / 8) + 1.5
+        np.savetxt(os.path.join(root, 'DBD', 'run1', 'F%02d.CSV' % i), x,
+                delimiter=',')
+
+    os.makedirs(os.path.join(root, 'Power', 'trial'))
+    t = np.arange(5000) * 5e-9
+    for channel, values in (('CH1', np.sin(t * 1e7)**2),
+            ('CH3', np.cos(t * 1e7)**2)):
+        columns = np.zeros((len(t), 5))
+        columns[:, 3] = t
+        columns[:, 4] = values
+        np.savetxt(os.path.join(root, 'Power', 'trial',
+                'F0000%s.CSV' % channel), columns, delimiter=',')
+
+    return root
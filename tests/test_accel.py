@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+from scipy.signal import find_peaks
+
+import accel
+
+TRIALS = 20
+
+
+# Without Numba the 'jit' backend runs the same scalar loops uncompiled,
+# so both code paths are checked everywhere
+@pytest.fixture(params=['jit', 'numpy'])
+def backend(request):
+    previous = accel.get_backend()
+    accel.set_backend(request.param)
+    yield request.param
+    accel.set_backend(previous)
+
+
+def _pulse_edges(active, min_gap, min_width):
+
+    # Runs of True one sample at a time, merged and dropped as documented
+    runs = []
+    for index, value in enumerate(active):
+        if value and (index == 0 or not active[index - 1]):
+            if runs and index - runs[-1][1] < min_gap:
+                runs[-1][1] = index + 1
+            else:
+                runs.append([index, index + 1])
+        elif value:
+            runs[-1][1] = index + 1
+    runs = [run for run in runs if run[1] - run[0] >= min_width]
+    return ([run[0] for run in runs], [run[1] for run in runs])
+
+
+@pytest.mark.parametrize('trial', range(TRIALS))
+def test_segment_peaks_matches_find_peaks(backend, trial):
+    rng = np.random.default_rng(trial)
+    length = int(rng.integers(50, 400))
+    num_biases = int(rng.integers(1, 12))
+    # Rounded values give flat tops and repeated samples
+    trace = np.round(rng.random(length) * 20) / 4
+    if trial % 2:
+        trace = trace.astype(np.float32)
+
+    heights = accel.segment_peaks(trace, num_biases)
+
+    index, offsets = accel.segment_offsets(length, num_biases)
+    for j in range(num_biases):
+        segment = trace[index[offsets[j]:offsets[j+1]]]
+        if len(segment) == 0:
+            continue
+        _, properties = find_peaks(segment, height=np.mean(segment) * 2)
+        peaks = properties['peak_heights']
+        expected = np.max(peaks) if len(peaks) else np.nan
+        np.testing.assert_array_equal(heights[j], expected)
+
+
+@pytest.mark.parametrize('trial', range(TRIALS))
+def test_pulse_edges(backend, trial):
+    rng = np.random.default_rng(trial)
+    length = int(rng.integers(50, 400))
+    active = rng.random(length) < rng.random()
+    min_gap = int(rng.integers(1, 6))
+    min_width = int(rng.integers(1, 6))
+
+    starts, ends = accel.pulse_edges(active, min_gap, min_width)
+
+    expected = _pulse_edges(active, min_gap, min_width)
+    np.testing.assert_array_equal(starts, expected[0])
+    np.testing.assert_array_equal(ends, expected[1])
+
+
+@pytest.mark.parametrize('mode', sorted(accel.PAD_MODES))
+@pytest.mark.parametrize('window', [1, 2, 7, 16, 29])
+def test_running_median_matches_median_filter(backend, mode, window):
+    rng = np.random.default_rng(window)
+    rows = rng.normal(size=(3, 200))
+    rows[:, ::7] = 0.0
+
+    medians = accel.running_median(rows, window, mode)
+
+    for row, median in zip(rows, medians):
+        np.testing.assert_array_equal(
+            median, ndimage.median_filter(row, size=window, mode=mode))
+
+
+@pytest.mark.parametrize('window', [1, 2, 5, 16])
+def test_running_median_backends_agree(window):
+    rows = np.round(np.random.default_rng(window).normal(size=(4, 150)), 1)
+    previous = accel.get_backend()
+    results = []
+    try:
+        for name in accel.BACKENDS:
+            accel.set_backend(name)
+            results.append(accel.running_median(rows, window, 'reflect'))
+    finally:
+        accel.set_backend(previous)
+    np.testing.assert_array_equal(results[0], results[1])
+
+
+def test_set_backend_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        accel.set_backend('gpu')
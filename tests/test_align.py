@@ -0,0 +1,45 @@
+import numpy as np
+
+import align
+import lplt
+
+
+def _pulse(samples, centre, width=12.0):
+    t = np.arange(samples)
+    return np.exp(-((t - centre) / width)**2)
+
+
+def test_align_rows_recovers_lags():
+    shifts = np.array([0.0, 7.0, -12.0, 3.25, -0.6])
+    reference = _pulse(1000, 400)
+    rows = np.array([_pulse(1000, 400 + shift) for shift in shifts])
+    aligned, lags = align.align_rows(rows, reference)
+    np.testing.assert_allclose(lags, shifts, atol=0.05)
+    np.testing.assert_allclose(aligned, np.broadcast_to(reference,
+            rows.shape), atol=5E-3)
+
+
+def test_align_rows_limits_search_to_max_lag():
+    reference = _pulse(1000, 400)
+    rows = np.array([_pulse(1000, 430), _pulse(1000, 405)])
+    lags = align.align_rows(rows, reference, max_lag=10)[1]
+    assert np.all(np.absolute(lags) <= 10)
+    np.testing.assert_allclose(lags[1], 5.0, atol=0.05)
+    lags = align.align_rows(rows, reference, max_lag=None)[1]
+    np.testing.assert_allclose(lags, [30.0, 5.0], atol=0.05)
+
+
+def test_align_rows_keeps_dtype():
+    rows = np.array([_pulse(256, 100), _pulse(256, 104)], dtype=np.float32)
+    aligned, lags = align.align_rows(rows)
+    assert aligned.dtype == np.float32
+    np.testing.assert_allclose(lags[0] - lags[1], -4.0, atol=0.1)
+
+
+def test_aligned_average_removes_jitter():
+    shifts = [0, 9, -6, 4]
+    buttered = {'10cm': [_pulse(1000, 400 + shift, 6.0) for shift in shifts]}
+    plain = lplt.butter_avg(buttered)['10cm']
+    aligned = lplt.butter_avg(buttered, align=True)['10cm']
+    assert aligned.max() > plain.max()
+    np.testing.assert_allclose(aligned.max(), 1.0, atol=1E-2)
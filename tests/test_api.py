@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+import api
+
+PARAMS = {'RPA': {'tts': 50}, 'DLP': {}, 'DBD': {}, 'NFP': {}, 'Bias': {},
+          'Power': {}}
+
+
+@pytest.mark.parametrize('diagnostic', sorted(PARAMS))
+def test_analyze_keeps_working_directory(datasets, monkeypatch, diagnostic):
+
+    # A relative path is analyzed twice from the same directory; the first
+    # call must not move the second one's starting point
+    monkeypatch.chdir(datasets)
+    name = os.path.join(diagnostic, 'trial') if diagnostic == 'Power' \
+            else diagnostic
+    first = api.analyze(diagnostic, name, PARAMS[diagnostic])
+    assert os.getcwd() == datasets
+    second = api.analyze(diagnostic, name, PARAMS[diagnostic])
+    assert os.getcwd() == datasets
+    assert type(first) is type(second)
+    assert first.diagnostic == diagnostic
+
+
+def test_analyze_rejects_unknown_diagnostic(datasets):
+    with pytest.raises(ValueError):
+        api.analyze('XYZ', datasets)
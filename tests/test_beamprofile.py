@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import beamprofile
+
+DISTANCE = beamprofile.PROBE_DISTANCE
+
+
+def test_uniform_one_sided_profile():
+    # J on a cap of half-angle a: I = 2 pi d^2 J (1 - cos a), and the
+    # fraction enclosed within alpha is (1 - cos alpha) / (1 - cos a)
+    position = np.linspace(0, 20, 2001) # cm
+    a = 20E-2 / DISTANCE
+    metrics = beamprofile.beam_metrics(position, 3.0 * np.ones(2001))
+    np.testing.assert_allclose(metrics['beam current'],
+            2 * np.pi * DISTANCE**2 * 3.0 * (1 - np.cos(a)), rtol=1E-5)
+    alpha = np.arccos(1 - 0.95 * (1 - np.cos(a)))
+    np.testing.assert_allclose(metrics['divergence'], np.degrees(alpha),
+            rtol=1E-3)
+
+
+@pytest.mark.parametrize('method', ['trapezoid', 'spline'])
+def test_centroid_of_shifted_gaussian(method):
+    position = np.linspace(-30, 30, 601) # cm
+    profile = np.exp(-((position - 4.0) / 3.0)**2)
+    metrics = beamprofile.beam_metrics(position, profile, method=method)
+    np.testing.assert_allclose(metrics['centroid'], 4.0, rtol=1E-6)
+    np.testing.assert_allclose(metrics['centroid angle'],
+            np.degrees(4E-2 / DISTANCE), rtol=1E-6)
+
+
+def test_stacked_profiles_match_single_calls():
+    rng = np.random.default_rng(0)
+    position = np.linspace(-25, 25, 51)
+    profiles = np.exp(-(position / rng.uniform(3, 10, (2, 3, 1)))**2)
+    metrics = beamprofile.beam_metrics(position[::-1], profiles[..., ::-1])
+    for index in np.ndindex(2, 3):
+        single = beamprofile.beam_metrics(position, profiles[index])
+        for name in single:
+            np.testing.assert_allclose(metrics[name][index], single[name],
+                    rtol=1E-12, atol=1E-12)
+
+
+def test_stack_profiles_on_shared_grid():
+    Idensity = {'L': (np.array([10., 0., 5.]), np.array([1., 3., 2.])),
+                'R': (np.array([0., 2.5]), np.array([4., 6.]))}
+    probes, grid, profiles = beamprofile.stack_profiles(Idensity)
+    assert probes == ['L', 'R']
+    np.testing.assert_array_equal(grid, [0., 2.5, 5., 10.])
+    np.testing.assert_allclose(profiles, [[3., 2.5, 2., 1.],
+                                          [4., 6., 0., 0.]])
+
+
+def test_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        beamprofile.beam_metrics(np.arange(5.), np.ones(5), method='simpson')
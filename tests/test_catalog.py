@@ -0,0 +1,28 @@
+import os
+
+import catalog
+import lplt
+import results
+
+
+def test_build_leaves_dataset_untouched(datasets, tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, 'CATALOG_DIR', str(tmp_path))
+    name = os.path.join(datasets, 'DLP')
+    before = results.dataset_hash(name)
+    db = catalog.build(name)
+    assert os.path.dirname(db) == str(tmp_path)
+    assert sorted(os.listdir(name)) == ['10cm', '20cm']
+    assert results.dataset_hash(name) == before
+    assert set(lplt.get_data(name)) == {'10cm', '20cm'}
+
+
+def test_probe_of_campaign_root(datasets, tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, 'CATALOG_DIR', str(tmp_path))
+    db = catalog.build(datasets)
+    left = catalog.query(db, probe='L')
+    assert len(left) == 9
+    assert all(os.sep + 'L1' + os.sep in path for path in left)
+    assert catalog.query(db, probe='R', position=5) == \
+            catalog.query(db, folder='NFP', directory=os.path.join(
+                'NFP', 'R1', '5cm'))
+    assert catalog.query(db, probe='D') == []
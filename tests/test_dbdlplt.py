@@ -0,0 +1,16 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import DBDlplt as dlplt
+
+
+def test_get_bias_without_pandas_parse(datasets, monkeypatch):
+    def fail(*args, **kwargs):
+        raise ValueError('unreadable')
+
+    name = os.path.join(datasets, 'DBD')
+    expected = dlplt.get_bias(name)
+    monkeypatch.setattr(pd, 'read_csv', fail)
+    np.testing.assert_array_equal(dlplt.get_bias(name), expected)
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+import lplt
+
+
+def test_density_time_axis_in_microseconds():
+    avg = {'10cm': np.ones(4)}
+    grid = np.arange(4) * 1E-7  # s
+    time, density = lplt.density(avg, grid, 's')
+    np.testing.assert_allclose(time, np.arange(4) * 0.1)
+    time, density = lplt.density(avg, np.arange(4) * 0.1, 'us')
+    np.testing.assert_allclose(time, np.arange(4) * 0.1)
+
+
+def test_density_rejects_unknown_time_unit():
+    with pytest.raises(ValueError):
+        lplt.density({'10cm': np.ones(4)}, np.arange(4), 'fortnight')
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+import lplt
+import nplt
+import DBDlplt
+import outofcore
+
+# Small enough that every block holds one shot and partials spill to disk
+BUDGET = 100000 # bytes
+
+
+@pytest.mark.parametrize('align', [False, True])
+def test_dlp_average_matches_in_memory(datasets, align):
+    name = os.path.join(datasets, 'DLP')
+    expected = lplt.butter_avg(lplt.butter_filter(lplt.get_data(name), 2,
+            0.05), align)
+    shots = lplt.get_shot_files(name, BUDGET)
+    result = lplt.butter_avg(lplt.butter_filter(shots, 2, 0.05), align)
+    assert list(result) == list(expected)
+    for key in expected:
+        np.testing.assert_array_equal(result[key], expected[key])
+
+
+def test_nfp_average_matches_in_memory(datasets):
+    name = os.path.join(datasets, 'NFP')
+    expected = nplt.butter_avg(nplt.butter_filter(nplt.get_data(name), 2,
+            0.05))
+    result = nplt.butter_avg(nplt.butter_filter(
+            nplt.get_shot_files(name, BUDGET), 2, 0.05))
+    np.testing.assert_array_equal(result.probe, expected.probe)
+    np.testing.assert_array_equal(result.position, expected.position)
+    np.testing.assert_array_equal(result.samples, expected.samples)
+
+
+def test_dbd_peaks_match_in_memory(datasets):
+    name = os.path.join(datasets, 'DBD')
+    expected = DBDlplt.get_peak_vals(*DBDlplt.get_data(name))
+    result = DBDlplt.get_peak_vals(*DBDlplt.get_shot_files(name, BUDGET))
+    assert sorted(result) == sorted(expected)
+    for key in expected:
+        np.testing.assert_array_equal(result[key], expected[key])
+
+
+def test_partial_merge_matches_whole(tmp_path):
+    rows = np.random.default_rng(1).standard_normal((7, 16))
+    whole = outofcore.Partial(16)
+    whole.update(rows)
+    first = outofcore.Partial(16)
+    first.update(rows[:3])
+    second = outofcore.Partial(16, directory=str(tmp_path))
+    second.update(rows[3:])
+    first.merge(second)
+    assert first.count == 7
+    np.testing.assert_allclose(first.mean(), rows.mean(axis=0))
+    np.testing.assert_allclose(first.variance(1), rows.var(axis=0, ddof=1))
+    np.testing.assert_array_equal(first.maximum, rows.max(axis=0))
+    np.testing.assert_allclose(whole.variance(), rows.var(axis=0))
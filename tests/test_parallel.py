@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+
+import rplt
+import lplt
+import bplt
+import DBDlplt as dlplt
+import pipeline
+
+
+def _shots(count, samples, seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.arange(samples, dtype=float)
+    return [np.column_stack((time, rng.standard_normal(samples)))
+            for index in range(count)]
+
+
+def test_rplt_butter_filter_parallel_matches_serial():
+    data = dict(('%d.txt' % index, shot)
+                for index, shot in enumerate(_shots(5, 300)))
+    serial = rplt.butter_filter(data, 3, 0.1)
+    parallel = rplt.butter_filter_parallel(data, 3, 0.1, workers=2)
+    assert list(serial) == list(parallel)
+    for shot in serial:
+        np.testing.assert_array_equal(serial[shot][0], parallel[shot][0])
+
+
+def test_bplt_butter_filter_parallel_matches_serial():
+    data = dict((-10.0 * index, shot)
+                for index, shot in enumerate(_shots(4, 300)))
+    serial = bplt.butter_filter(data, 3, 0.1)
+    parallel = bplt.butter_filter_parallel(data, 3, 0.1, workers=2)
+    for bias in serial:
+        np.testing.assert_array_equal(serial[bias], parallel[bias])
+
+
+@pytest.mark.parametrize('layout', ['list', 'array'])
+def test_lplt_butter_filter_parallel_matches_serial(layout):
+    data = {'10cm': _shots(3, 300, 1), '20cm': _shots(2, 300, 2)}
+    if layout == 'array':
+        data = dict((key, np.array(data[key])) for key in data)
+    serial = lplt.butter_filter(data, 3, 0.1)
+    parallel = lplt.butter_filter_parallel(data, 3, 0.1, workers=2)
+    for key in serial:
+        np.testing.assert_array_equal(np.array(serial[key]),
+                                      np.array(parallel[key]))
+        assert isinstance(parallel[key], type(serial[key]))
+
+
+def test_butter_filter_parallel_unequal_lengths():
+    data = {'a.txt': _shots(1, 300)[0], 'b.txt': _shots(1, 200)[0]}
+    serial = rplt.butter_filter(data, 3, 0.1)
+    parallel = rplt.butter_filter_parallel(data, 3, 0.1, workers=2)
+    for shot in serial:
+        np.testing.assert_array_equal(serial[shot][0], parallel[shot][0])
+
+
+def test_get_peak_vals_parallel_matches_serial():
+    rng = np.random.default_rng(3)
+    bias_data = np.column_stack((np.arange(4.0), np.arange(4.0)))
+    raw = dict(('F%04d.CSV' % index, rng.standard_normal(400))
+               for index in range(3))
+    serial = dlplt.get_peak_vals(raw, bias_data)
+    parallel = dlplt.get_peak_vals_parallel(raw, bias_data, workers=2)
+    for key in serial:
+        np.testing.assert_array_equal(serial[key], parallel[key])
+
+
+def test_pipeline_lowpass_uses_parallel_for_large_stacks(monkeypatch):
+    data = dict(('%d.txt' % index, shot)
+                for index, shot in enumerate(_shots(4, 300)))
+    serial = pipeline._rpa_lowpass(data, 3, 0.1)
+    monkeypatch.setattr(pipeline, 'PARALLEL_MIN_BYTES', 0)
+    monkeypatch.setattr(pipeline.os, 'cpu_count', lambda: 2)
+    calls = []
+    monkeypatch.setattr(rplt, 'butter_filter_parallel',
+                        lambda *args: calls.append(args) or serial)
+    pipeline._rpa_lowpass(data, 3, 0.1)
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('diagnostic', ['RPA', 'DLP', 'DBD', 'Bias'])
+def test_pipeline_parallel_matches_serial(datasets, monkeypatch, diagnostic):
+    name = os.path.join(datasets, diagnostic)
+    params = {'tts': 50} if diagnostic == 'RPA' else {}
+    serial = pipeline.analyze(diagnostic, name, params)
+    monkeypatch.setattr(pipeline, 'PARALLEL_MIN_BYTES', 0)
+    monkeypatch.setattr(pipeline.os, 'cpu_count', lambda: 2)
+    parallel = pipeline.analyze(diagnostic, name, params)
+    _assert_same(serial, parallel)
+
+
+def _assert_same(first, second):
+    if isinstance(first, dict):
+        assert list(first) == list(second)
+        for key in first:
+            _assert_same(first[key], second[key])
+    elif isinstance(first, (list, tuple)):
+        assert len(first) == len(second)
+        for a, b in zip(first, second):
+            _assert_same(a, b)
+    else:
+        np.testing.assert_array_equal(first, second)
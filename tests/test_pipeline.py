@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pytest
+
+import pipeline
+import results
+import store
+
+
+def _no_content_hash(name):
+    raise AssertionError('dataset content was hashed')
+
+
+def test_run_without_store_reads_no_content(datasets, monkeypatch):
+    monkeypatch.setattr(results, 'dataset_hash', _no_content_hash)
+    cache = pipeline.NodeCache()
+    name = os.path.join(datasets, 'Bias')
+    first = pipeline.analyze('Bias', name, cache=cache)
+    second = pipeline.analyze('Bias', name, cache=cache)
+    assert first is second
+
+
+def test_signature_changes_with_files(tmp_path):
+    shot = tmp_path / 'sweep -30V.txt'
+    shot.write_text('0\t1\n')
+    before = results.dataset_signature(str(tmp_path))
+    shot.write_text('0\t1\n1\t2\n')
+    assert results.dataset_signature(str(tmp_path)) != before
+
+
+def test_store_is_keyed_by_content(datasets, tmp_path, monkeypatch):
+    result_store = store.ResultStore(str(tmp_path / 'store'))
+    name = os.path.join(datasets, 'Bias')
+    first = pipeline.analyze('Bias', name, store=result_store)
+
+    # A second process finds the content key without hashing again
+    monkeypatch.setattr(results, 'dataset_hash', _no_content_hash)
+    pipeline.analyze('Bias', name, store=result_store)
+    monkeypatch.undo()
+
+    # A copy elsewhere hashes its content and finds the stored result
+    copy = str(tmp_path / 'copy')
+    shutil.copytree(name, copy)
+    hits = []
+    get = result_store.get
+
+    def counted_get(key, default=None):
+        value = get(key, default)
+        hits.append(value is not default)
+        return value
+
+    monkeypatch.setattr(result_store, 'get', counted_get)
+    second = pipeline.analyze('Bias', copy, store=result_store)
+    assert hits == [False, True]
+    assert second.keys() == first.keys()
+    for bias in first['Idensity']:
+        assert second['Idensity'][bias] == pytest.approx(
+            first['Idensity'][bias])
@@ -0,0 +1,23 @@
+import os
+import types
+
+import matplotlib
+import pytest
+
+pytest.importorskip('PyQt5')
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+import PlotWindow
+
+
+def test_power_summary_table_in_window(datasets, monkeypatch, capsys):
+    monkeypatch.setattr(plt, 'show', lambda: None)
+    window = types.SimpleNamespace(fname=os.path.join(datasets, 'Power'))
+    PlotWindow.plotPowerSummary(window)
+    figure = plt.gcf()
+    tables = [artist for ax in figure.axes for artist in ax.tables]
+    assert len(tables) == 1
+    assert capsys.readouterr().out == ''
+    plt.close(figure)
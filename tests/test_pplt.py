@@ -0,0 +1,103 @@
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pytest
+
+import pipeline
+import pplt
+
+
+def _pulses(starts):
+    starts = np.array(starts, dtype=float)
+    return {'start': starts, 'duration': np.full(len(starts), 1E-6),
+            'peak power': np.full(len(starts), 5.0),
+            'energy': np.full(len(starts), 2.0)}
+
+
+@pytest.mark.parametrize('count', [0, 1])
+def test_pulse_statistics_without_a_period(count):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        statistics = pplt.pulse_statistics(_pulses(np.arange(count)))
+    assert statistics['count'] == count
+    for field in ('mean period', 'period jitter', 'repetition rate'):
+        assert np.isnan(statistics[field])
+    if count:
+        assert statistics['mean energy'] == 2.0
+    else:
+        assert np.isnan(statistics['mean energy'])
+
+
+def test_pulse_statistics_period():
+    statistics = pplt.pulse_statistics(_pulses([0.0, 0.5, 1.0]))
+    assert statistics['mean period'] == 0.5
+    assert statistics['period jitter'] == 0.0
+    assert statistics['repetition rate'] == 2.0
+
+
+def test_stream_data_reuses_one_directory(datasets, tmp_path, monkeypatch):
+    monkeypatch.setattr(pplt, 'STREAM_DIR', str(tmp_path))
+    trial = os.path.join(datasets, 'Power', 'trial')
+    first = pplt.stream_data(trial, True, chunk_size=1000)
+    directories = os.listdir(str(tmp_path))
+    assert len(directories) == 1
+
+    def no_rows(file):
+        raise AssertionError('trial was streamed again')
+
+    monkeypatch.setattr(pplt, 'count_rows', no_rows)
+    second = pplt.stream_data(trial, True, chunk_size=1000)
+    for key in first:
+        np.testing.assert_array_equal(first[key], second[key])
+    monkeypatch.undo()
+    monkeypatch.setattr(pplt, 'STREAM_DIR', str(tmp_path))
+
+    # A changed capture is streamed again and the old copy removed
+    channel = os.path.join(trial, 'F0000CH1.CSV')
+    stat = os.stat(channel)
+    os.utime(channel, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    pplt.stream_data(trial, True, chunk_size=1000)
+    assert len(os.listdir(str(tmp_path))) == 1
+    assert os.listdir(str(tmp_path)) != directories
+
+
+@pytest.mark.parametrize('chunk_size', [700, 5000])
+def test_streamed_energy_equals_in_memory(datasets, tmp_path, chunk_size):
+    trial = os.path.join(datasets, 'Power', 'trial')
+    in_memory = pplt.get_data(trial, True)
+    streamed = pplt.stream_data(trial, True, out_dir=str(tmp_path),
+                                chunk_size=chunk_size)
+    assert in_memory['energy'][-1] > 0
+    for key in ('time', 'voltage', 'current', 'power', 'energy'):
+        np.testing.assert_array_equal(streamed[key], in_memory[key])
+
+
+def test_read_files_without_current(datasets):
+    trial = os.path.join(datasets, 'Power', 'trial')
+    assert pplt.read_files([os.path.join(trial, 'F0000CH1.CSV')], True) == {}
+
+
+def test_batch_summary_reuses_cached_trials(datasets, tmp_path, monkeypatch):
+    campaign = str(tmp_path / 'campaign')
+    os.makedirs(os.path.join(campaign, 'empty'))
+    shutil.copytree(os.path.join(datasets, 'Power', 'trial'),
+                    os.path.join(campaign, 'trial'))
+    cache = pipeline.NodeCache()
+
+    with pytest.warns(RuntimeWarning):
+        table = pplt.batch_summary(campaign, workers=2, cache=cache)
+    assert list(table.index) == ['trial']
+    expected = pplt.summarize(pplt.get_data(
+        os.path.join(campaign, 'trial'), False))
+    for column in table.columns:
+        assert table.loc['trial', column] == expected[column]
+
+    def no_read(*args):
+        raise AssertionError('trial was read again')
+
+    monkeypatch.setattr(pplt, 'read_files', no_read)
+    with pytest.warns(RuntimeWarning):
+        again = pplt.batch_summary(campaign, cache=cache)
+    assert again.equals(table)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+import lplt
+from resample import resample_rows
+
+
+def _shots():
+    rng = np.random.default_rng(2)
+    times = [np.arange(100) * 0.1, np.arange(80) * 0.13 + 0.5,
+            np.sort(rng.uniform(-1, 12, 150))]
+    values = [np.sin(t) + rng.standard_normal(len(t)) for t in times]
+    return times, values
+
+
+def test_resample_rows_matches_interp():
+    times, values = _shots()
+    grid = np.arange(-0.5, 11.0, 0.07)
+    stack = resample_rows(times, values, grid)
+    assert stack.shape == (3, len(grid))
+    for row, (t, v) in enumerate(zip(times, values)):
+        np.testing.assert_allclose(stack[row], np.interp(grid, t, v),
+                rtol=1E-12, atol=1E-12)
+
+
+def test_resample_rows_copies_shots_on_grid():
+    times, values = _shots()
+    grid = times[0]
+    values = [v.astype(np.float32) for v in values]
+    stack = resample_rows(times, values, grid)
+    assert stack.dtype == np.float32
+    np.testing.assert_array_equal(stack[0], values[0])
+    assert resample_rows([], [], grid).shape == (0, len(grid))
+
+
+def _write(folder, times, values):
+    os.makedirs(folder)
+    for index, (t, v) in enumerate(zip(times, values)):
+        np.savetxt(os.path.join(folder, 'shot%02d.txt' % index),
+                np.column_stack((t, v)), delimiter='\t')
+
+
+def test_resampled_average_of_mixed_shots(tmp_path):
+    # Shots of different lengths and rates average on the grid of the
+    # first shot read
+    times, values = _shots()
+    _write(str(tmp_path / '10cm'), times, values)
+    data = lplt.get_data(str(tmp_path))
+    grid = lplt.common_grid(data)
+    np.testing.assert_array_equal(grid, data['10cm'][0][:, 0])
+
+    resampled = lplt.resample(data, grid)
+    assert resampled['10cm'].shape == (3, len(grid), 2)
+    np.testing.assert_array_equal(resampled['10cm'][:, :, 0],
+            np.broadcast_to(grid, (3, len(grid))))
+
+    avg = lplt.butter_avg(lplt.butter_filter(resampled, 2, 0.05))
+    expected = lplt.butter_filter({'10cm': [np.column_stack((grid,
+            np.interp(grid, t, v))) for t, v in zip(times, values)]}, 2, 0.05)
+    np.testing.assert_allclose(avg['10cm'], np.mean(expected['10cm'],
+            axis=0), rtol=1E-10, atol=1E-12)
+
+    shots = lplt.get_shot_files(str(tmp_path), 10000)
+    np.testing.assert_array_equal(lplt.common_grid(shots), grid)
+    out_of_core = lplt.butter_avg(lplt.butter_filter(lplt.resample(shots,
+            grid), 2, 0.05))
+    np.testing.assert_allclose(out_of_core['10cm'], avg['10cm'],
+            rtol=1E-12, atol=1E-12)
@@ -0,0 +1,51 @@
+import os
+import json
+import sqlite3
+
+import numpy as np
+
+import results
+
+
+def test_record_trend_round_trip(datasets, tmp_path, monkeypatch):
+    db = str(tmp_path / 'results.sqlite')
+    name = os.path.join(datasets, 'DLP')
+    clock = iter([100.0, 200.0, 300.0])
+    monkeypatch.setattr(results.time, 'time', lambda: next(clock))
+
+    first = results.record('DLP', name, {'order': 2, 'cutoff': 0.05},
+            {'density peak': 1.5, 'delay': np.float32(4.0)}, db)
+    second = results.record('DLP', name, {'order': 3, 'cutoff': 0.05},
+            {'density peak': 2.5}, db)
+    results.record('RPA', name, {'order': 2}, {'density peak': 9.0}, db)
+
+    timestamps, values, run_ids = results.trend('DLP', 'density peak',
+            db=db)
+    np.testing.assert_array_equal(timestamps, [100.0, 200.0])
+    np.testing.assert_array_equal(values, [1.5, 2.5])
+    np.testing.assert_array_equal(run_ids, [first, second])
+
+    timestamps, values, run_ids = results.trend('DLP', 'density peak',
+            params={'order': 2}, db=db)
+    np.testing.assert_array_equal(values, [1.5])
+    np.testing.assert_array_equal(run_ids, [first])
+
+    timestamps, values, run_ids = results.trend('DLP', 'density peak',
+            since=150, until=250, db=db)
+    np.testing.assert_array_equal(run_ids, [second])
+
+    connection = sqlite3.connect(db)
+    dataset, dataset_hash, params = connection.execute(
+            'SELECT dataset, dataset_hash, params FROM runs WHERE id = ?',
+            (first,)).fetchone()
+    connection.close()
+    assert dataset == os.path.abspath(name)
+    assert dataset_hash == results.dataset_hash(name)
+    assert json.loads(params) == {'order': 2, 'cutoff': 0.05}
+
+
+def test_trend_of_unknown_result_is_empty(tmp_path):
+    timestamps, values, run_ids = results.trend('DLP', 'missing',
+            db=str(tmp_path / 'results.sqlite'))
+    assert len(timestamps) == len(values) == len(run_ids) == 0
+    assert run_ids.dtype.kind == 'i'
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import rolling
+
+
+@pytest.mark.parametrize('window', range(1, 12))
+def test_mean_matches_convolve_same(window):
+    x = np.random.default_rng(window).random(30)
+    np.testing.assert_allclose(
+        rolling.mean(x, window),
+        np.convolve(x, np.ones(window) / window, mode='same'))
+
+
+def test_even_window_leans_towards_start():
+    x = np.array([1., 2., 4., 8., 16.])
+    np.testing.assert_allclose(rolling.mean(x, 2), [0.5, 1.5, 3., 6., 12.])
+
+
+def test_mean_along_axis():
+    x = np.random.default_rng(0).random((4, 30))
+    expected = np.array([rolling.mean(row, 5) for row in x.T]).T
+    np.testing.assert_allclose(rolling.mean(x, 5, axis=0), expected)
+
+
+def test_minimum_and_maximum_keep_edges_of_offset_data():
+    y = 5 + np.array([0., 1., 2., 3., 4., 3., 2., 1.])
+    np.testing.assert_array_equal(rolling.minimum(y, 5)[:2], [5., 5.])
+    np.testing.assert_array_equal(rolling.maximum(y, 5)[-2:], [9., 8.])
+    np.testing.assert_array_equal(rolling.minimum(y, 5, mode='constant')[:2],
+                                  [0., 0.])
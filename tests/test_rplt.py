@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import rplt
+
+
+def _curves(count=6, length=120):
+    rng = np.random.default_rng(0)
+    bias = np.linspace(0, 1, length)
+    steps = rng.uniform(0.3, 0.7, count)[:, None]
+    return (1 / (1 + np.exp((bias - steps) * 20))
+            + 0.01 * rng.standard_normal((count, length)))
+
+
+@pytest.mark.parametrize('smooth', [1, 4, 1E6])
+def test_batch_ivdf_matches_spline_fit_and_ivdf(smooth):
+    curves = _curves()
+    xnew, batch = rplt.batch_ivdf(curves, smooth, 100)
+    for curve, row in zip(curves, batch):
+        x, spl = rplt.spline_fit(curve, smooth, 100, rtrn='spline')
+        expected_x, expected = rplt.ivdf(x, spl)
+        np.testing.assert_allclose(xnew, expected_x)
+        np.testing.assert_allclose(row, expected, rtol=1E-9, atol=1E-12)
+
+
+def test_batch_penalised_matches_each_curve():
+    curves = _curves()
+    xnew, batch = rplt.batch_penalised(curves, 100, lam=1.0)
+    for curve, row in zip(curves, batch):
+        np.testing.assert_allclose(
+            row, rplt.batch_penalised(curve, 100, lam=1.0)[1][0],
+            rtol=1E-8, atol=1E-12)
+
+
+def test_batch_savgol_shape():
+    xnew, ivdf = rplt.batch_ivdf(_curves(), 4, 50, method='savgol')
+    assert ivdf.shape == (6, 50)
+
+
+def test_batch_ivdf_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        rplt.batch_ivdf(_curves(), 4, 50, method='fourier')
@@ -0,0 +1,59 @@
+import json
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+import service
+
+
+def test_jsonable_maps_non_finite_to_null():
+    value = {'Te': np.float64(np.nan), 'ne': float('inf'),
+             'ivdf': np.array([1.0, np.nan, -np.inf]), 'count': np.int64(3)}
+    text = json.dumps(service.jsonable(value), allow_nan=False)
+    assert json.loads(text) == {'Te': None, 'ne': None,
+                                'ivdf': [1.0, None, None], 'count': 3}
+
+
+class _RunningPool:
+
+    # Stands in for the worker pool with a job that is already running
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def analysis_service(datasets):
+    analysis_service = service.AnalysisService(datasets, workers=1,
+                                               timeout=0.01)
+    analysis_service.pool.shutdown()
+    analysis_service.pool = _RunningPool()
+    yield analysis_service
+    analysis_service.close()
+
+
+def test_timed_out_job_keeps_its_slot(analysis_service):
+    with pytest.raises(service.RequestError) as error:
+        analysis_service.analyze('Bias', 'Bias')
+    assert error.value.status == 504
+    assert analysis_service.pending == 1
+    analysis_service.pool.futures[0].set_result((b'{}', []))
+    assert analysis_service.pending == 0
+
+
+def test_full_queue_is_refused(analysis_service):
+    analysis_service.max_pending = 1
+    with pytest.raises(service.RequestError):
+        analysis_service.analyze('Bias', 'Bias')
+    with pytest.raises(service.RequestError) as error:
+        analysis_service.analyze('Bias', 'Bias')
+    assert error.value.status == 503
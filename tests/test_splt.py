@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+import api
+import splt
+
+
+def test_pyramid_outside_dataset(datasets, tmp_path, monkeypatch):
+    monkeypatch.setattr(splt, 'LOD_DIR', str(tmp_path / 'lod'))
+    monkeypatch.setattr(splt, 'LOD_POINTS', 64)
+    folder = os.path.join(datasets, 'RPA', 'set')
+    shot = os.path.join(folder, sorted(os.listdir(folder))[0])
+    before = sorted(os.listdir(folder))
+
+    pyramid = splt.Pyramid(splt.build_pyramid(shot))
+
+    assert sorted(os.listdir(folder)) == before
+    values = np.genfromtxt(shot, delimiter='\t')[:, 1]
+    np.testing.assert_allclose(pyramid.raw, values)
+    x, y = pyramid.window(0, pyramid.length, 64)
+    assert y.min() == values.min() and y.max() == values.max()
+    api.analyze_rpa(os.path.join(datasets, 'RPA'), tts=50)
+
+
+def test_get_data_reads_small_files(datasets):
+    folder = os.path.join(datasets, 'RPA', 'set')
+    shot = os.path.join(folder, sorted(os.listdir(folder))[0])
+    data = splt.get_data(shot)
+    np.testing.assert_allclose(data[shot],
+                               np.genfromtxt(shot, delimiter='\t'))
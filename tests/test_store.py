@@ -0,0 +1,24 @@
+import os
+import time
+
+import numpy as np
+
+import store
+
+
+def test_put_prunes_to_budget(tmp_path):
+    result_store = store.ResultStore(str(tmp_path), max_bytes=30000)
+    for index in range(10):
+        result_store.put('%064x' % index, np.zeros(1000))
+        path = result_store.path('%064x' % index)
+        os.utime(path, (time.time() - 100 + index,) * 2)
+    assert result_store.size() <= 30000
+    assert '%064x' % 9 in result_store
+    assert '%064x' % 0 not in result_store
+
+
+def test_unbounded_store_keeps_everything(tmp_path):
+    result_store = store.ResultStore(str(tmp_path))
+    for index in range(5):
+        result_store.put('%064x' % index, np.zeros(1000))
+    assert len(result_store.entries()) == 5
@@ -0,0 +1,50 @@
+import socket
+
+import numpy as np
+from scipy import signal
+
+import precision
+import stream
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind((stream.DEFAULT_HOST, 0))
+        return probe.getsockname()[1]
+
+
+def test_ring_counts_rows_beyond_capacity():
+    ring = stream.RingBuffer(4)
+    rows = np.arange(20.0).reshape(10, 2)
+    ring.extend(rows[:3])
+    ring.extend(rows[3:])
+    assert ring.total == 10
+    np.testing.assert_array_equal(ring.view(), rows[-4:])
+
+
+def test_fake_scope_stream_matches_one_shot_sosfilt():
+    port = _free_port()
+    process = stream.start_fake_scope(port, duration=0.05, seed=0)
+    received = []
+
+    def recording(source):
+        for rows in source:
+            received.append(rows.copy())
+            yield rows
+
+    # A ring smaller than one chunk keeps only the newest rows
+    ring = stream.RingBuffer(500)
+    total = stream.filter_stream(
+        recording(stream.socket_source(stream.DEFAULT_HOST, port)),
+        2, 0.05, ring)
+    process.join(5)
+
+    record = np.concatenate(received)
+    # The scope sends whole chunks until the duration is covered
+    assert total == len(record) == 5 * stream.CHUNK_SIZE
+    sos = precision.butter_sos(2, 0.05)
+    expected = signal.sosfilt(sos, record[:, 1],
+                              zi=signal.sosfilt_zi(sos) * record[0, 1])[0]
+    np.testing.assert_array_equal(ring.view()[:, 0], record[-500:, 0])
+    np.testing.assert_allclose(ring.view()[:, 1], expected[-500:],
+                               rtol=1E-12, atol=1E-12)
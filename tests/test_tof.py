@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+import tof
+
+
+def _density(time, delay):
+    pulse = lambda t: np.exp(-((t - 20.0) / 2.0)**2)
+    return {'10cm': pulse(time), '30cm': pulse(time - delay)}
+
+
+@pytest.mark.parametrize('time_unit, scale', [('us', 1.0), ('s', 1E-6),
+                                              ('ns', 1E3)])
+def test_velocity_independent_of_time_unit(time_unit, scale):
+    time = np.arange(0, 60, 0.05)   # us
+    result = tof.time_of_flight(_density(time, 4.0), time * scale,
+                                time_unit=time_unit)
+    np.testing.assert_allclose(result['delay'], [4.0 * scale], rtol=1E-2)
+    np.testing.assert_allclose(result['velocity'], [0.2 / 4E-6], rtol=1E-2)
+
+
+def test_time_of_flight_rejects_unknown_time_unit():
+    time = np.arange(0, 60, 0.05)
+    with pytest.raises(ValueError):
+        tof.time_of_flight(_density(time, 4.0), time, time_unit='fortnight')
@@ -0,0 +1,157 @@
+"""Time Of Flight Module
+
+This module contains the functions used to estimate plasma arrival-time
+delays and velocities between Langmuir probes from their averaged density
+traces. Every pair of probes is cross-correlated through the FFT, with
+each trace transformed once, and the correlation peak is refined to a
+fraction of a sample by fitting a parabola through its three highest
+points. Traces from any number of runs are reduced in one call.
+
+Probe positions along the beam are taken from numbers with a length unit in
+the probe folder names (e.g. '10cm', '250 mm'), or can be given explicitly.
+"""
+
+__author__ = 'Kaito Durkee'
+
+import re
+import itertools
+import numpy as np
+from scipy import fft
+
+# Axial probe position in a folder name, e.g. '10cm' or '2.5 m'
+DISTANCE_PATTERN = re.compile(
+        '(-?[0-9]+(?:\\.[0-9]+)?)[ ]?(mm|cm|m)(?![A-Za-z])')
+UNITS = {'mm': 1E-3, 'cm': 1E-2, 'm': 1.0} # m
+
+# Seconds per unit of a time axis
+TIME_UNITS = {'s': 1.0, 'ms': 1E-3, 'us': 1E-6, 'ns': 1E-9} # s
+
+# Complex spectrum values held at once while correlating pairs
+XCORR_CHUNK = 2**24
+
+
+def get_probe_position(folder):
+
+    # Position of a probe from its folder name in m, or NaN if it has none
+    match = DISTANCE_PATTERN.search(folder)
+    if match is None:
+        return np.nan
+    return float(match.group(1)) * UNITS[match.group(2)]
+
+
+def xcorr(a, b, detrend=True):
+
+    # Full linear cross-correlation c[m] = sum a[t] b[t+m] along the last
+    # axis for every broadcast row, with lags -(n-1) ... n-1
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if detrend:
+        a = a - a.mean(axis=-1, keepdims=True)
+        b = b - b.mean(axis=-1, keepdims=True)
+
+    n = a.shape[-1]
+    nfft = fft.next_fast_len(2*n - 1, real=True)
+    corr = fft.irfft(np.conj(fft.rfft(a, nfft)) * fft.rfft(b, nfft), nfft)
+
+    lags = np.arange(-(n-1), n)
+    return lags, np.concatenate((corr[..., nfft-n+1:], corr[..., :n]),
+            axis=-1)
+
+
+def peak_lag(corr, lags):
+
+    # Lag of the correlation maximum along the last axis, refined by the
+    # vertex of the parabola through it and its two neighbours
+    k = np.argmax(corr, axis=-1)[..., None]
+    inner = (k > 0) & (k < corr.shape[-1] - 1)
+    left = np.take_along_axis(corr, np.maximum(k - 1, 0), axis=-1)
+    center = np.take_along_axis(corr, k, axis=-1)
+    right = np.take_along_axis(corr, np.minimum(k + 1,
+            corr.shape[-1] - 1), axis=-1)
+
+    curvature = left - 2*center + right
+    safe = inner & (curvature < 0)
+    offset = np.where(safe, 0.5 * (left - right)
+            / np.where(safe, curvature, -1), 0)
+
+    return (lags[k] + offset)[..., 0]
+
+
+def pair_delays(traces, dt=1.0, pairs=None, max_lag=None, detrend=True,
+        workers=-1):
+
+    # traces has probes and samples on its last two axes, with any leading
+    # axes for runs. Returns the pairs and, for every run, the delay of the
+    # second probe of each pair behind the first, in units of dt. Only lags
+    # up to max_lag samples either way are searched when it is given.
+    traces = np.asarray(traces, dtype=np.float64)
+    num_probes, n = traces.shape[-2:]
+    if pairs is None:
+        pairs = list(itertools.combinations(range(num_probes), 2))
+    first = np.array([pair[0] for pair in pairs], dtype=int)
+    second = np.array([pair[1] for pair in pairs], dtype=int)
+    if max_lag is None or max_lag > n - 1:
+        max_lag = n - 1
+    max_lag = int(max_lag)
+
+    if detrend:
+        traces = traces - traces.mean(axis=-1, keepdims=True)
+    # Padding to n + max_lag keeps the circular wrap out of the lags kept
+    nfft = fft.next_fast_len(n + max_lag, real=True)
+    spectra = fft.rfft(traces, nfft, workers=workers)  # once per trace
+    conjugates = np.conj(spectra)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    runs = int(np.prod(traces.shape[:-2]))
+    chunk = max(1, XCORR_CHUNK // (max(runs, 1) * spectra.shape[-1]))
+    delays = np.zeros(traces.shape[:-2] + (len(pairs),))
+    for start in range(0, len(pairs), chunk):
+        stop = start + chunk
+        product = conjugates[..., first[start:stop], :]
+        product *= spectra[..., second[start:stop], :]
+        corr = fft.irfft(product, nfft, workers=workers)
+        corr = np.concatenate((corr[..., nfft-max_lag:],
+                corr[..., :max_lag+1]), axis=-1)
+        delays[..., start:stop] = peak_lag(corr, lags)
+
+    return pairs, delays * dt
+
+
+def time_of_flight(density, time_axis, positions=None, pairs=None,
+        max_delay=None, time_unit='us'):
+
+    # density maps probe folders to averaged density traces, as returned by
+    # lplt.density, or to (runs, samples) stacks of them. time_unit names
+    # the unit of time_axis (us for lplt.density). Delays are in that unit
+    # and velocities in m/s, positive when the plasma reaches the second
+    # probe of a pair later. max_delay, in the same unit, bounds the delays
+    # searched.
+    if time_unit not in TIME_UNITS:
+        raise ValueError("Time unit is not recognized: %r" % time_unit)
+    probes = list(density.keys())
+    traces = np.stack([np.asarray(density[probe]) for probe in probes],
+            axis=-2)
+    dt = time_axis[1] - time_axis[0]
+
+    if positions is None:
+        positions = {}
+    position = np.array([positions[probe] if probe in positions
+            else get_probe_position(probe) for probe in probes])
+
+    if max_delay is not None:
+        max_delay = int(np.ceil(max_delay / dt))
+    index_pairs, delays = pair_delays(traces, dt, pairs, max_delay)
+    first = np.array([pair[0] for pair in index_pairs], dtype=int)
+    second = np.array([pair[1] for pair in index_pairs], dtype=int)
+    separation = position[second] - position[first] # m
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = separation / (delays * TIME_UNITS[time_unit]) # m/s
+
+    tof = {}
+    tof['pairs'] = [(probes[i], probes[j]) for i, j in index_pairs]
+    tof['delay'] = delays
+    tof['separation'] = separation
+    tof['velocity'] = velocity
+
+    return tof